@@ -3,36 +3,91 @@ Victor Marin Felip
 vicmf88@gmail.com
 """
 
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from fee_models import *
 from errors import FeeModelNotFound
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+import numpy as np
+import sys
+
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def datetime_to_us(dt: datetime) -> int:
+	"""
+	Converts a datetime to integer microseconds since the epoch. Naive datetimes are taken as they are,
+	aware ones are converted to UTC first, so the round trip with us_to_datetime is exact.
+	
+	:param dt: The datetime
+	:return: Microseconds since 1970-01-01
+	"""
+	if dt.tzinfo is not None:
+		dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+	return (dt - _EPOCH) // _MICROSECOND
+
+
+def us_to_datetime(us: int) -> datetime:
+	"""
+	Converts integer microseconds since the epoch back to a naive datetime
+	
+	:param us: Microseconds since 1970-01-01
+	:return: The datetime
+	"""
+	return _EPOCH + timedelta(microseconds=int(us))
 
 
 class PriceUpdate(object):
 	
+	__slots__ = ("_ex", "_coin", "_quote", "_best_rate", "_extime", "_systime", "_orderbook")
+	
+	# TODO Placeholder expected keys!
+	expected_keys = ("coin", "quote", "exchange", "rate", "datetime")
+	
 	def __init__(self, update: dict):
-		self._ex = None
-		self._coin = None
-		self._quote = None
-		self._best_rate = None
 		self._extime = None
-		self._systime = None
 		self._orderbook = None
-		
-		# TODO Placeholder expected keys!
-		self.expected_keys = ["coin", "quote", "exchange", "rate", "datetime"]
 		self._parse_update(update)
 		
+	@classmethod
+	def from_fields(cls, ex: str, coin: str, quote: str, rate: float, systime: datetime,
+	                orderbook: Optional[dict] = None) -> "PriceUpdate":
+		"""
+		Trusted constructor for feed handlers we control. Skips the dictionary round trip and its validation,
+		so fields are expected to be of the right type already.
+		
+		:param ex: Exchange id
+		:param coin: Coin id
+		:param quote: Quote id
+		:param rate: Best rate
+		:param systime: Time of the update
+		:param orderbook: Optional order book snapshot or diff, see orderbook
+		:return: The update
+		"""
+		update = cls.__new__(cls)
+		update._ex = ex
+		update._coin = coin
+		update._quote = quote
+		update._best_rate = rate
+		update._extime = None
+		update._systime = systime
+		update._orderbook = orderbook
+		return update
+		
 	def _parse_update(self, update: dict):
 		# TODO Placeholder code here!
-		if not all([x in update.keys() for x in self.expected_keys]):
-			raise KeyError("Missing keys in update dictionary!")
+		for key in self.expected_keys:
+			if key not in update:
+				raise KeyError("Missing keys in update dictionary!")
 		
 		self._ex = update["exchange"]
 		self._coin = update["coin"]
 		self._quote = update["quote"]
 		self._best_rate = update["rate"]
 		self._systime = update["datetime"]
+		# Optional market depth, see orderbook
+		self._orderbook = update.get("orderbook")
 		
 	@property
 	def ex(self) -> str:
@@ -63,12 +118,117 @@ class PriceUpdate(object):
 		return self._systime
 	
 	@property
-	def orderbook(self) -> dict:
+	def orderbook(self) -> Optional[dict]:
 		return self._orderbook
 
 
+class PriceUpdateBatch(object):
+	
+	def __init__(self, pair_ids: Sequence[Union[str, Tuple[str, str, str]]], handles, rates, timestamps):
+		"""
+		A columnar batch of price updates. Instead of one object per tick it holds three arrays of the same
+		length: the handle of the pair (an index into pair_ids), the best rate and the time of the tick as
+		int64 microseconds since the epoch (see datetime_to_us). Arrays are not copied if they already have
+		the right dtype.
+		
+		:param pair_ids: The pair table of the batch, as "EX_COIN_QUOTE" strings or (ex, coin, quote) tuples
+		:param handles: Integer array of indexes into pair_ids, one per tick
+		:param rates: Float array of rates, one per tick
+		:param timestamps: Int64 array of microseconds since the epoch, one per tick
+		"""
+		self._pair_ids = []
+		for pair_id in pair_ids:
+			if type(pair_id) is str:
+				pair_id = pair_id.split("_")
+			if len(pair_id) != 3:
+				raise ValueError("A pair id needs 3 items. Got: {}".format(pair_id))
+			self._pair_ids.append(tuple(pair_id))
+		
+		# Any integer dtype is kept as is, so views over on-disk records are not copied
+		self._handles = np.asarray(handles)
+		if self._handles.dtype.kind not in "iu":
+			self._handles = self._handles.astype(np.int64)
+		self._rates = np.asarray(rates, dtype=np.float64)
+		self._timestamps = np.asarray(timestamps, dtype=np.int64)
+		
+		if not (self._handles.ndim == self._rates.ndim == self._timestamps.ndim == 1):
+			raise ValueError("Batch columns must be one dimensional arrays")
+		if not (len(self._handles) == len(self._rates) == len(self._timestamps)):
+			raise ValueError("Batch columns must have the same length")
+		if len(self._handles) and (self._handles.min() < 0 or self._handles.max() >= len(self._pair_ids)):
+			raise IndexError("Batch handles out of the pair table range")
+		
+	@classmethod
+	def from_updates(cls, updates: Iterable[PriceUpdate]) -> "PriceUpdateBatch":
+		"""
+		Builds a batch from PriceUpdate objects
+		
+		:param updates: A list or iterator of PriceUpdate instances
+		:return: The batch
+		"""
+		table = {}
+		handles = []
+		rates = []
+		timestamps = []
+		for update in updates:
+			handles.append(table.setdefault(update.id, len(table)))
+			rates.append(update.best_rate)
+			timestamps.append(datetime_to_us(update.systime))
+		return cls(list(table.keys()), handles, rates, timestamps)
+	
+	@property
+	def pair_ids(self) -> list:
+		return self._pair_ids
+	
+	@property
+	def handles(self) -> np.ndarray:
+		return self._handles
+	
+	@property
+	def rates(self) -> np.ndarray:
+		return self._rates
+	
+	@property
+	def timestamps(self) -> np.ndarray:
+		return self._timestamps
+	
+	def __len__(self) -> int:
+		return len(self._handles)
+	
+	def groups(self) -> Iterator[Tuple[Tuple[str, str, str], np.ndarray, np.ndarray]]:
+		"""
+		Yields the ticks of the batch grouped by pair, keeping their original order within every pair
+		
+		:return: An iterator of (pair id, rates, timestamps)
+		"""
+		if not len(self._handles):
+			return
+		order = np.argsort(self._handles, kind="stable")
+		sorted_handles = self._handles[order]
+		bounds = np.flatnonzero(np.diff(sorted_handles)) + 1
+		starts = np.concatenate(([0], bounds))
+		ends = np.concatenate((bounds, [len(order)]))
+		for start, end in zip(starts, ends):
+			idx = order[start:end]
+			yield self._pair_ids[sorted_handles[start]], self._rates[idx], self._timestamps[idx]
+	
+	def iter_updates(self) -> Iterator[PriceUpdate]:
+		"""
+		Yields the ticks of the batch as PriceUpdate objects, in order
+		
+		:return: An iterator of PriceUpdate instances
+		"""
+		for handle, rate, ts in zip(self._handles.tolist(), self._rates.tolist(), self._timestamps.tolist()):
+			ex, coin, quote = self._pair_ids[handle]
+			yield PriceUpdate.from_fields(ex, coin, quote, rate, us_to_datetime(ts))
+
+
 class AssetUpdate(object):
 	
+	__slots__ = ("_ex", "_datetime", "_assetlist", "_holdinglist")
+	
+	expected_keys = ("exchange", "assets", "datetime")
+	
 	def __init__(self, update: dict):
 		"""
 		The base class for a holdings update from an exchange
@@ -76,17 +236,34 @@ class AssetUpdate(object):
 		:param update: The exchange holdings update
 		"""
 		
-		self._ex = None
-		self._datetime = None
 		self._assetlist = []
 		self._holdinglist = []
-		self.expected_keys = ["exchange", "assets", "datetime"]
 		self._parse_update(update)
 		
+	@classmethod
+	def from_fields(cls, ex: str, assetlist: list, holdinglist: list, systime: datetime) -> "AssetUpdate":
+		"""
+		Trusted constructor for feed handlers we control. The lists are stored as given, without copying
+		or converting holdings to float.
+		
+		:param ex: Exchange id
+		:param assetlist: List of asset ids
+		:param holdinglist: List of holdings, in the same order as assetlist
+		:param systime: Time of the update
+		:return: The update
+		"""
+		update = cls.__new__(cls)
+		update._ex = ex
+		update._datetime = systime
+		update._assetlist = assetlist
+		update._holdinglist = holdinglist
+		return update
+		
 	def _parse_update(self, update: dict):
 		# TODO Placeholder code here!
-		if not all([x in update.keys() for x in self.expected_keys]):
-			raise KeyError("Missing keys in update dictionary!")
+		for key in self.expected_keys:
+			if key not in update:
+				raise KeyError("Missing keys in update dictionary!")
 		
 		self._ex = update["exchange"]
 		self._datetime = update["datetime"]
@@ -114,8 +291,11 @@ class AssetUpdate(object):
 class Asset(object):
 	
 	def __init__(self, _id: str):
-		self._id = _id
+		# Ids are interned so pair keys built from them compare by identity
+		self._id = sys.intern(_id) if type(_id) is str else _id
 		self._hold = 0.
+		# Called with no arguments when the holding changes, set by the Portfolio that owns the asset
+		self.on_change = None
 		
 	@property
 	def id(self) -> str:
@@ -127,7 +307,10 @@ class Asset(object):
 	
 	@am.setter
 	def am(self, value):
+		changed = value != self._hold
 		self._hold = value
+		if changed and self.on_change is not None:
+			self.on_change()
 
 	def __str__(self):
 		return self._id
@@ -136,39 +319,11 @@ class Asset(object):
 class Exchange(object):
 	
 	def __init__(self, _id: str):
-		self._id = _id
-		self.model = FeesEmpty()
-		self._get_fee_model()
-		
-	# TODO code tests for fees
-	def _get_fee_model(self):
-		if self.id == "KRAKEN":
-			self.model = FeesKraken()
-		elif self.id == "COINBASE":
-			self.model = FeesCoinbase()
-		elif self.id == "BINANCE":
-			self.model = FeesBinance()
-		elif self.id == "BITMEX":
-			self.model = FeesBitmex()
-		elif self.id == "BITTREX":
-			self.model = FeesBittrex()
-		elif self.id == "OANDA":
-			self.model = FeesOanda()
-		elif self.id == "GEMINI":
-			self.model = FeesGemini()
-		elif self.id == "BITSTAMP":
-			self.model = FeesBitstamp()
-		elif self.id == "BITFINEX":
-			self.model = FeesBitfinex()
-		elif self.id == "POLONIEX":
-			self.model = FeesPoloniex()
-			
-		elif self.id == "EMPTY":
-			self.model = FeesEmpty()
-		elif self.id == "TEST":
-			self.model = FeesTest()
-		else:
-			raise FeeModelNotFound(self.id)
+		self._id = sys.intern(_id) if type(_id) is str else _id
+		self.model = get_fee_model(self._id)
+		# 30 day traded volume that sets the fee tier, None for the default tier of the model. Loop evaluators
+		# cache fee_rate, refresh them after changing it.
+		self.volume = None
 		
 	@property
 	def id(self) -> id:
@@ -176,7 +331,16 @@ class Exchange(object):
 	
 	@property
 	def fee_rate(self) -> float:
-		return self.model.rate
+		if self.volume is None:
+			return self.model.rate
+		return self.model.fee(self.volume)
+	
+	def fee(self, maker: bool = False) -> float:
+		"""
+		:param maker: Maker fee if True, taker fee otherwise
+		:return: The fee rate of the current volume tier
+		"""
+		return self.model.fee(self.volume, maker)
 	
 	@property
 	def fee_model_name(self) -> str:
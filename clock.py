@@ -0,0 +1,78 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from datetime import datetime
+from typing import Optional
+
+
+class WallClock(object):
+
+	def __init__(self):
+		"""
+		The system clock, as datetime.now()
+		"""
+		pass
+
+	def now(self) -> datetime:
+		return datetime.now()
+
+
+class SimulatedClock(object):
+
+	def __init__(self, start: Optional[datetime] = None):
+		"""
+		A clock that only moves when told to, meant for market replay. ReplayEngine advances it to the
+		time of every event, so staleness queries measure replayed time instead of wall time.
+
+		:param start: Initial time. The clock can't be read until it is set or advanced.
+		"""
+		self._now = start
+
+	def now(self) -> datetime:
+		if self._now is None:
+			raise ValueError("Simulated clock read before being set")
+		return self._now
+
+	def set(self, now: datetime):
+		"""
+		Moves the clock to a time, backwards if needed
+
+		:param now: The new time
+		"""
+		self._now = now
+
+	def advance_to(self, now: datetime):
+		"""
+		Moves the clock forward to a time. Earlier times are ignored, so the clock never goes back.
+
+		:param now: The new time
+		"""
+		if self._now is None or now > self._now:
+			self._now = now
+
+
+class CachedClock(object):
+
+	def __init__(self, clock=None):
+		"""
+		Wraps another clock and keeps returning the first time read until invalidate is called.
+		Useful to read the system clock once per batch of queries instead of once per pair.
+
+		:param clock: The wrapped clock, WallClock if None
+		"""
+		self._clock = clock if clock is not None else WallClock()
+		self._now = None
+
+	def now(self) -> datetime:
+		if self._now is None:
+			self._now = self._clock.now()
+		return self._now
+
+	def invalidate(self):
+		self._now = None
+
+
+# Shared by every Pair not attached to a Portfolio
+WALL_CLOCK = WallClock()
@@ -0,0 +1,177 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional, Set, Union
+from threading import RLock
+import functools
+import numpy as np
+
+
+def _exclusive(method):
+	"""
+	Runs a Portfolio method holding every lock of a ConcurrentPortfolio
+	"""
+	@functools.wraps(method)
+	def wrapper(self, *args, **kwargs):
+		with self.locked():
+			return method(self, *args, **kwargs)
+	return wrapper
+
+
+def _structural(method):
+	"""
+	Runs a Portfolio method holding the structure lock of a ConcurrentPortfolio, for reads of the pair indexes
+	that add_pair changes
+	"""
+	@functools.wraps(method)
+	def wrapper(self, *args, **kwargs):
+		with self._structure_lock:
+			return method(self, *args, **kwargs)
+	return wrapper
+
+
+class ConcurrentPortfolio(Portfolio):
+
+	def __init__(self, history_len: int = UPDATES_KEPT, keep_updates: bool = False, clock=None):
+		"""
+		A Portfolio that can be updated from several threads, typically one feed thread per exchange.
+		Price updates only lock their exchange, so exchanges ingest in parallel, and a shared lock protects the
+		state derived from every pair (freshness index, valuation cache, tracked loops) for the short time it
+		takes to update it. Adding pairs, holding updates (which return every holding) and the holdings,
+		valuation, report and loop queries hold every lock, so they see a consistent state, and lookups of pairs
+		and assets hold the structure lock.
+		Locks are always taken in the same order (structure, exchanges sorted by id, shared) so threads can't
+		deadlock.
+
+		:param history_len: Number of past rates kept by every pair added
+		:param keep_updates: Debug mode, pairs also keep their raw PriceUpdate objects
+		:param clock: Source of the current time for staleness queries, the system clock if None
+		"""
+		self._structure_lock = RLock()
+		self._derived_lock = RLock()
+		self._exchange_locks = {}
+		super().__init__(history_len, keep_updates, clock)
+
+	def _exchange_lock(self, exchange: str) -> RLock:
+		lock = self._exchange_locks.get(exchange)
+		if lock is None:
+			raise PairlNotImplemented("No pairs of exchange {}".format(exchange))
+		return lock
+
+	@contextmanager
+	def _exchanges_locked(self, exchanges: Iterable[str]) -> Iterator[None]:
+		locks = [self._exchange_lock(ex) for ex in sorted(set(exchanges))]
+		for lock in locks:
+			lock.acquire()
+		try:
+			yield
+		finally:
+			for lock in reversed(locks):
+				lock.release()
+
+	@contextmanager
+	def locked(self) -> Iterator[None]:
+		"""
+		Holds every lock of the portfolio, for callers that need several reads to be consistent with each other
+		"""
+		with self._structure_lock:
+			with self._exchanges_locked(self._exchange_locks.keys()):
+				with self._derived_lock:
+					yield
+
+	def _index_pair(self, pair: Pair):
+		super()._index_pair(pair)
+		# Created last, so pushes to a new exchange fail until its first pair is fully indexed
+		self._exchange_locks.setdefault(pair.ex.id, RLock())
+
+	def push_update(self, update: PriceUpdate) -> Pair:
+		with self._exchange_lock(update.ex):
+			return super().push_update(update)
+
+	def push_by_handle(self, handle: int, rate: float, systime: datetime) -> Pair:
+		target_pair = self.get_pair_by_handle(handle)
+		if target_pair is None:
+			raise PairlNotImplemented(handle)
+		with self._exchange_lock(target_pair.ex.id):
+			return super().push_by_handle(handle, rate, systime)
+
+	def push_updates(self, updates: Union[Iterable[PriceUpdate], PriceUpdateBatch]) -> Set[Pair]:
+		if isinstance(updates, PriceUpdateBatch):
+			# Only the pairs with ticks, Portfolio ignores entries of the pair table that no tick uses
+			exchanges = [updates.pair_ids[handle][0] for handle in np.unique(updates.handles)]
+		else:
+			updates = list(updates)
+			exchanges = [update.ex for update in updates]
+		with self._exchanges_locked(exchanges):
+			return super().push_updates(updates)
+
+	def _after_updates(self, pairs: Iterable[Pair]):
+		with self._derived_lock:
+			super()._after_updates(pairs)
+
+	def _invalidate_valuation(self):
+		with self._derived_lock:
+			super()._invalidate_valuation()
+
+	def snapshot(self, threshold: Optional[timedelta] = None) -> dict:
+		"""
+		Returns a consistent view of the portfolio, taken holding every lock. Keys are:
+		- rates: dict of pair id: rate
+		- holdings: as returned by get_holdings
+		- usd_value: as returned by get_usd_value
+		- full_usd_value: as returned by get_full_usd_value
+		- report: as returned by report(threshold), None if no threshold is given
+
+		:param threshold: Threshold of the freshness report
+		:return: The snapshot
+		"""
+		with self.locked():
+			return {
+				"rates": {pair.id: pair.rate for pair in self._pair_list},
+				"holdings": self.get_holdings(),
+				"usd_value": self.get_usd_value(),
+				"full_usd_value": self.get_full_usd_value(),
+				"report": self.report(threshold) if threshold is not None else None,
+			}
+
+	add_pair = _exclusive(Portfolio.add_pair)
+	add_pair_reverses = _exclusive(Portfolio.add_pair_reverses)
+	set_fake_holdings = _exclusive(Portfolio.set_fake_holdings)
+	adjust_holdings_from_assetupd = _exclusive(Portfolio.adjust_holdings_from_assetupd)
+	enable_stats = _exclusive(Portfolio.enable_stats)
+	disable_stats = _exclusive(Portfolio.disable_stats)
+
+	get_pairs_by_exchange = _structural(Portfolio.get_pairs_by_exchange)
+	get_pairs_by_coin = _structural(Portfolio.get_pairs_by_coin)
+	get_pairs_by_quote = _structural(Portfolio.get_pairs_by_quote)
+	get_pairs_full = _structural(Portfolio.get_pairs_full)
+	get_pair_list = _structural(Portfolio.get_pair_list)
+	get_pair_by_id = _structural(Portfolio.get_pair_by_id)
+	get_assets = _structural(Portfolio.get_assets)
+	get_routing_table = _structural(Portfolio.get_routing_table)
+
+	get_holdings = _exclusive(Portfolio.get_holdings)
+	get_usd_value = _exclusive(Portfolio.get_usd_value)
+	get_usd_only = _exclusive(Portfolio.get_usd_only)
+	get_full_usd_value = _exclusive(Portfolio.get_full_usd_value)
+	get_usd_per_ex = _exclusive(Portfolio.get_usd_per_ex)
+	get_virtual_rate = _exclusive(Portfolio.get_virtual_rate)
+	predict_usd_val = _exclusive(Portfolio.predict_usd_val)
+
+	pairs_with_data = _exclusive(Portfolio.pairs_with_data)
+	report = _exclusive(Portfolio.report)
+	data_flag = _exclusive(Portfolio.data_flag)
+	last_data_td = _exclusive(Portfolio.last_data_td)
+
+	get_possible_loops = _exclusive(Portfolio.get_possible_loops)
+	get_loop_evaluator = _exclusive(Portfolio.get_loop_evaluator)
+	track_loops = _exclusive(Portfolio.track_loops)
+	untrack_loops = _exclusive(Portfolio.untrack_loops)
+	changed_loops = _exclusive(Portfolio.changed_loops)
+	evaluate_loops = _exclusive(Portfolio.evaluate_loops)
+	find_negative_cycles = _exclusive(Portfolio.find_negative_cycles)
@@ -0,0 +1,112 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from base import PriceUpdate
+from orderbook import conflate_updates
+from datetime import timedelta
+from typing import Dict, Iterable, Optional, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:
+	from portfolio import Pair, Portfolio
+
+
+class Conflator(object):
+
+	def __init__(self, portfolio: "Portfolio", window: Optional[timedelta] = None, max_batch: Optional[int] = None):
+		"""
+		Coalesces updates by pair before they reach the portfolio: within a window only the last update of
+		every pair is pushed, and the others are counted as dropped (their order book changes, if any, are
+		carried over to the one pushed). A window is closed, and its updates pushed with Portfolio.push_updates,
+		when an update arrives window or more after the first one of the window (in update time, so replays
+		conflate the same way every run), when max_batch updates have been received, or when flush is called.
+
+		:param portfolio: The portfolio to push to
+		:param window: Maximum time span of a window, None for no time limit
+		:param max_batch: Maximum number of updates received per window, None for no limit
+		"""
+		if max_batch is not None and max_batch < 1:
+			raise ValueError("Conflation batch must be at least 1. Got: {}".format(max_batch))
+		self._portfolio = portfolio
+		self.window = window
+		self.max_batch = max_batch
+
+		self._pending = {}
+		self._window_start = None
+		self._received = 0
+		self._dropped = {}
+		self.total_received = 0
+		self.total_pushed = 0
+
+	def push(self, update: PriceUpdate) -> Optional[Set["Pair"]]:
+		"""
+		Adds an update to the current window
+
+		:param update: The update
+		:return: The pairs pushed if a window was closed, None otherwise
+		"""
+		touched = None
+		if self._window_start is None:
+			self._window_start = update.systime
+		elif self.window is not None and update.systime - self._window_start >= self.window:
+			touched = self.flush()
+			self._window_start = update.systime
+
+		key = update.id
+		previous = self._pending.get(key)
+		if previous is not None:
+			self._dropped[key] = self._dropped.get(key, 0) + 1
+			update = conflate_updates(previous, update)
+		self._pending[key] = update
+		self._received += 1
+		self.total_received += 1
+
+		if self.max_batch is not None and self._received >= self.max_batch:
+			flushed = self.flush()
+			touched = flushed if touched is None else touched | flushed
+		return touched
+
+	def push_many(self, updates: Iterable[PriceUpdate]) -> Set["Pair"]:
+		"""
+		Adds several updates, in order
+
+		:param updates: The updates
+		:return: The pairs pushed by the windows closed meanwhile
+		"""
+		touched = set()
+		for update in updates:
+			flushed = self.push(update)
+			if flushed:
+				touched |= flushed
+		return touched
+
+	def flush(self) -> Set["Pair"]:
+		"""
+		Pushes the last update of every pair in the current window and starts a new one
+
+		:return: The pairs pushed, as returned by Portfolio.push_updates
+		"""
+		pending = self._pending
+		self._pending = {}
+		self._window_start = None
+		self._received = 0
+		if not pending:
+			return set()
+		self.total_pushed += len(pending)
+		return self._portfolio.push_updates(pending.values())
+
+	@property
+	def pending(self) -> int:
+		return len(self._pending)
+
+	@property
+	def dropped(self) -> Dict[str, int]:
+		"""
+		Number of updates replaced by a newer one of the same pair, per pair id
+		"""
+		return {"{}_{}_{}".format(*key): count for key, count in self._dropped.items()}
+
+	@property
+	def total_dropped(self) -> int:
+		return self.total_received - self.total_pushed - len(self._pending)
@@ -0,0 +1,156 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from base import PriceUpdateBatch, datetime_to_us
+from tickfile import TickFileWriter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence
+import csv
+import json
+import os
+
+
+FIELDS = ("exchange", "coin", "quote", "rate", "datetime")
+
+
+class HistoricalConverter(object):
+
+	def __init__(self, columns: Optional[Dict[str, str]] = None, fmt: str = "csv", chunk_size: int = 100000,
+	             datetime_format: Optional[str] = None, exchange: Optional[str] = None, delimiter: str = ","):
+		"""
+		Converts historical dumps (CSV with a header row, or JSON lines) into PriceUpdateBatch chunks, reading
+		the input as a stream so memory only depends on chunk_size.
+
+		:param columns: Mapping from our fields (exchange, coin, quote, rate, datetime) to the column names of
+			the input. Fields not in the mapping are expected under their own name.
+		:param fmt: "csv" or "jsonl"
+		:param chunk_size: Rows per batch
+		:param datetime_format: strptime format of the datetime column. If None, numbers are taken as seconds
+			since the epoch and strings as ISO 8601.
+		:param exchange: Exchange of every row, for dumps without an exchange column
+		:param delimiter: CSV delimiter
+		"""
+		if fmt not in ("csv", "jsonl"):
+			raise ValueError("Unknown historical data format: {}".format(fmt))
+		self.columns = {field: field for field in FIELDS}
+		self.columns.update(columns or {})
+		self.fmt = fmt
+		self.chunk_size = chunk_size
+		self.datetime_format = datetime_format
+		self.exchange = exchange
+		self.delimiter = delimiter
+
+	def _parse_time(self, value) -> int:
+		if self.datetime_format is not None:
+			return datetime_to_us(datetime.strptime(value, self.datetime_format))
+		if isinstance(value, (int, float)):
+			return int(round(value * 1000000))
+		try:
+			return int(round(float(value) * 1000000))
+		except ValueError:
+			return datetime_to_us(datetime.fromisoformat(value))
+
+	def _rows(self, path: str) -> Iterator[tuple]:
+		"""
+		Yields (exchange, coin, quote, rate, datetime) tuples of raw values
+		"""
+		cols = self.columns
+		with open(path, "r", newline="") as f:
+			if self.fmt == "csv":
+				reader = csv.reader(f, delimiter=self.delimiter)
+				header = next(reader, None)
+				if header is None:
+					return
+				try:
+					idx = [header.index(cols[field]) if field != "exchange" or self.exchange is None else None
+					       for field in FIELDS]
+				except ValueError as e:
+					raise KeyError("Missing column in {}: {}".format(path, e))
+				ex_i, coin_i, quote_i, rate_i, dt_i = idx
+				for row in reader:
+					if not row:
+						continue
+					ex = self.exchange if ex_i is None else row[ex_i]
+					yield ex, row[coin_i], row[quote_i], row[rate_i], row[dt_i]
+			else:
+				ex_col = cols["exchange"]
+				coin_col, quote_col, rate_col, dt_col = cols["coin"], cols["quote"], cols["rate"], cols["datetime"]
+				for line in f:
+					if not line.strip():
+						continue
+					row = json.loads(line)
+					ex = self.exchange if self.exchange is not None else row[ex_col]
+					yield ex, row[coin_col], row[quote_col], row[rate_col], row[dt_col]
+
+	def iter_batches(self, path: str) -> Iterator[PriceUpdateBatch]:
+		"""
+		Yields the rows of a file as batches of at most chunk_size ticks, in file order. Batches of the same
+		file share a growing pair table.
+
+		:param path: The input file
+		:return: An iterator of batches ready for Portfolio.push_updates
+		"""
+		table = {}
+		handles = []
+		rates = []
+		timestamps = []
+		parse_time = self._parse_time
+		for ex, coin, quote, rate, dt in self._rows(path):
+			key = (ex, coin, quote)
+			handle = table.get(key)
+			if handle is None:
+				handle = table[key] = len(table)
+			handles.append(handle)
+			rates.append(float(rate))
+			timestamps.append(parse_time(dt))
+			if len(handles) >= self.chunk_size:
+				yield PriceUpdateBatch(list(table.keys()), handles, rates, timestamps)
+				handles = []
+				rates = []
+				timestamps = []
+		if handles:
+			yield PriceUpdateBatch(list(table.keys()), handles, rates, timestamps)
+
+	def to_tickfile(self, path: str, out_path: str) -> int:
+		"""
+		Converts a file into a tick file (see tickfile), appending if it already exists
+
+		:param path: The input file
+		:param out_path: The tick file
+		:return: Number of ticks written
+		"""
+		count = 0
+		with TickFileWriter(out_path) as writer:
+			for batch in self.iter_batches(path):
+				writer.write_batch(batch)
+				count += len(batch)
+		return count
+
+	def convert_files(self, paths: Sequence[str], out_dir: str, processes: Optional[int] = None) -> List[str]:
+		"""
+		Converts several files into tick files in parallel, one file per worker process at a time.
+		Every input gets a tick file in out_dir with its name plus ".ticks", replacing any previous one,
+		which can then be read with tickfile.TickFileReader. Inputs with the same file name would share
+		a tick file, so they raise ValueError before anything is converted.
+
+		:param paths: The input files
+		:param out_dir: Directory of the tick files
+		:param processes: Number of worker processes, the number of CPUs if None
+		:return: Paths of the tick files, in the same order as paths
+		"""
+		out_paths = [os.path.join(out_dir, os.path.basename(path) + ".ticks") for path in paths]
+		sources = {}
+		for path, out_path in zip(paths, out_paths):
+			key = os.path.normcase(os.path.abspath(out_path))
+			if key in sources:
+				raise ValueError("{} and {} would both be converted into {}".format(sources[key], path, out_path))
+			sources[key] = path
+		for out_path in out_paths:
+			if os.path.exists(out_path):
+				os.remove(out_path)
+		with ProcessPoolExecutor(max_workers=processes) as pool:
+			list(pool.map(self.to_tickfile, paths, out_paths))
+		return out_paths
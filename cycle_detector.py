@@ -0,0 +1,217 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from collections import deque
+from typing import List, Optional, Set, Tuple, TYPE_CHECKING
+import math
+
+if TYPE_CHECKING:
+	from portfolio import Pair, Portfolio
+
+
+class _ExchangeGraph(object):
+
+	def __init__(self, pairs: List["Pair"], tolerance: float):
+		"""
+		Graph of a single exchange. Assets are nodes and every pair is an edge from its coin to its quote
+		weighted -log(rate * (1 - fee)), so a negative cycle is a loop whose rates and fees multiply above 1.
+		Node potentials are kept between searches: if the last search converged only the edges that got
+		cheaper can break them, so the next search starts from their tails instead of from scratch.
+
+		:param pairs: The pairs of the exchange
+		:param tolerance: Minimum improvement for a relaxation to count
+		"""
+		self._tolerance = tolerance
+		self._pairs = list(pairs)
+		self._nodes = {}
+		self._tails = []
+		self._heads = []
+		for pair in self._pairs:
+			self._tails.append(self._nodes.setdefault(pair.coin.id, len(self._nodes)))
+			self._heads.append(self._nodes.setdefault(pair.quote.id, len(self._nodes)))
+
+		self._out = [[] for _ in range(len(self._nodes))]
+		for e, tail in enumerate(self._tails):
+			self._out[tail].append(e)
+
+		self._weights = [math.inf] * len(self._pairs)
+		self._dist = [0.] * len(self._nodes)
+		self._feasible = False
+		self._seeds = set()
+
+	@staticmethod
+	def _weight(pair: "Pair") -> float:
+		rate = pair.rate
+		if rate is None:
+			return math.inf
+		factor = rate * (1. - pair.ex.fee_rate)
+		if factor <= 0:
+			return math.inf
+		return -math.log(factor)
+
+	def refresh(self):
+		"""
+		Reloads edge weights from the pairs and remembers the tails of the edges that got cheaper
+		"""
+		for e, pair in enumerate(self._pairs):
+			weight = self._weight(pair)
+			if weight < self._weights[e]:
+				self._seeds.add(self._tails[e])
+			self._weights[e] = weight
+
+	def search(self, max_cycles: int) -> List[Tuple["Pair", ...]]:
+		"""
+		Looks for negative cycles. After a cycle is found one of its edges is left out and the search
+		runs again from scratch, up to max_cycles times.
+
+		:param max_cycles: Maximum number of cycles to return
+		:return: A list of cycles as tuples of pairs
+		"""
+		if not self._feasible:
+			self._dist = [0.] * len(self._nodes)
+			self._seeds = set(range(len(self._nodes)))
+		seeds = self._seeds
+		self._seeds = set()
+
+		cycles = []
+		disabled = set()
+		while seeds and len(cycles) < max_cycles:
+			cycle = self._spfa(seeds, disabled)
+			if cycle is None:
+				break
+			# Rotate so the same loop always comes out starting from the same edge
+			start = cycle.index(min(cycle))
+			cycles.append(tuple(self._pairs[e] for e in cycle[start:] + cycle[:start]))
+			disabled.add(cycle[0])
+			self._dist = [0.] * len(self._nodes)
+			seeds = set(range(len(self._nodes)))
+
+		# Potentials are only valid for the full graph if the first search converged
+		self._feasible = not cycles
+		return cycles
+
+	def _spfa(self, seeds: Set[int], disabled: Set[int]) -> Optional[List[int]]:
+		"""
+		Queue based Bellman-Ford over the current potentials
+
+		:param seeds: Nodes to start relaxing from
+		:param disabled: Edges left out of the search
+		:return: The edges of a negative cycle in conversion order, None if the potentials converged
+		"""
+		n = len(self._nodes)
+		dist = self._dist
+		weights = self._weights
+		heads = self._heads
+		tol = self._tolerance
+
+		pred = [-1] * n
+		length = [0] * n
+		in_queue = [False] * n
+		queue = deque(sorted(seeds))
+		for node in queue:
+			in_queue[node] = True
+
+		while queue:
+			u = queue.popleft()
+			in_queue[u] = False
+			du = dist[u]
+			for e in self._out[u]:
+				if e in disabled:
+					continue
+				v = heads[e]
+				candidate = du + weights[e]
+				if candidate < dist[v] - tol:
+					dist[v] = candidate
+					pred[v] = e
+					length[v] = length[u] + 1
+					# A chain of n edges must repeat a node, but the cycle only shows in pred once it closed
+					if length[v] >= n:
+						cycle = self._pred_cycle(pred)
+						if cycle is not None:
+							return cycle
+					if not in_queue[v]:
+						in_queue[v] = True
+						queue.append(v)
+		return None
+
+	def _pred_cycle(self, pred: List[int]) -> Optional[List[int]]:
+		"""
+		Looks for a cycle in the predecessor graph. Every such cycle is negative.
+
+		:param pred: Predecessor edge per node, -1 if none
+		:return: The edges of the cycle in conversion order, None if there is no cycle
+		"""
+		state = [0] * len(pred)
+		for start in range(len(pred)):
+			node = start
+			while node != -1 and state[node] == 0:
+				state[node] = start + 1
+				node = self._tails[pred[node]] if pred[node] != -1 else -1
+			if node != -1 and state[node] == start + 1:
+				cycle = []
+				first = node
+				while True:
+					e = pred[node]
+					cycle.append(e)
+					node = self._tails[e]
+					if node == first:
+						break
+				cycle.reverse()
+				return cycle
+		return None
+
+
+class NegativeCycleDetector(object):
+
+	def __init__(self, portfolio: "Portfolio", tolerance: float = 1e-12):
+		"""
+		Finds profitable loops of any length with a negative cycle search over one graph per exchange,
+		using the current Pair.rate and Exchange.fee_rate. Graphs are rebuilt when the portfolio gets new
+		pairs, and otherwise searches start from the potentials left by the previous one.
+
+		:param portfolio: The portfolio
+		:param tolerance: Minimum improvement in log space for a relaxation to count. Keeps loops that
+			multiply to exactly 1 (like a pair and its reverse) from showing up through rounding.
+		"""
+		self._portfolio = portfolio
+		self._tolerance = tolerance
+		self._generation = None
+		self._graphs = {}
+
+	def _graph(self, exchange: str) -> Optional[_ExchangeGraph]:
+		if self._generation != self._portfolio.generation:
+			self._graphs = {}
+			self._generation = self._portfolio.generation
+		graph = self._graphs.get(exchange)
+		if graph is None:
+			pairs = self._portfolio.get_pairs_by_exchange(exchange)
+			if not pairs:
+				return None
+			graph = _ExchangeGraph(pairs, self._tolerance)
+			self._graphs[exchange] = graph
+		return graph
+
+	def find_cycles(self, exchange: Optional[str] = None, max_cycles: int = 1) -> List[Tuple["Pair", ...]]:
+		"""
+		Returns profitable cycles as tuples of pairs, in the same form as Portfolio.get_possible_loops:
+		every pair converts its coin into the coin of the next one, and the last one closes the loop.
+
+		:param exchange: Exchange to search, all of them if None
+		:param max_cycles: Maximum number of cycles returned per exchange
+		:return: A list of tuples of pairs, empty if no profitable cycle exists
+		"""
+		if exchange is None:
+			exchanges = list(self._portfolio.ex_asset.keys())
+		else:
+			exchanges = [str(exchange)]
+
+		cycles = []
+		for ex in exchanges:
+			graph = self._graph(ex)
+			if graph is None:
+				continue
+			graph.refresh()
+			cycles.extend(graph.search(max_cycles))
+		return cycles
@@ -159,3 +159,20 @@ class SimulationNotCompleted(EngineException):
 		
 	def __str__(self):
 		return "Simulation uncompleded, no report possible!"
+
+
+class TickFileError(EngineException):
+	
+	def __init__(self, path, msg):
+		"""
+		Raised when a tick file is malformed or can't hold more data
+		
+		:param path: The path of the tick file
+		:param msg: What went wrong
+		"""
+		super().__init__()
+		self.path = path
+		self.msg = msg
+		
+	def __str__(self):
+		return "Tick file {}: {}".format(self.path, self.msg)
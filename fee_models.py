@@ -3,160 +3,221 @@ Victor Marin Felip
 vicmf88@gmail.com
 """
 
-class FeesEmpty(object):
-	
+from errors import FeeModelNotFound
+from bisect import bisect_right
+from typing import Optional, Sequence
+
+
+class TieredFees(object):
+
+	def __init__(self, thresholds: Sequence[float], maker: Sequence[float], taker: Sequence[float],
+	             default_volume: float = 0.):
+		"""
+		A fee schedule with maker and taker fees by tiers of 30 day traded volume. Tier i applies from
+		thresholds[i] of volume up to the next threshold. Models are stateless, so a single instance is shared
+		by every exchange using it (see register_fee_model).
+
+		:param thresholds: Volume where every tier starts, ascending and starting at 0
+		:param maker: Maker fee of every tier
+		:param taker: Taker fee of every tier
+		:param default_volume: Volume of the tier used by rate
+		"""
+		if not thresholds or thresholds[0] != 0 or list(thresholds) != sorted(thresholds):
+			raise ValueError("Fee tier thresholds must be ascending and start at 0. Got: {}".format(thresholds))
+		if not len(thresholds) == len(maker) == len(taker):
+			raise ValueError("Every fee tier needs a threshold, a maker fee and a taker fee")
+		self.thresholds = tuple(float(x) for x in thresholds)
+		self.maker = tuple(float(x) for x in maker)
+		self.taker = tuple(float(x) for x in taker)
+		self.default_volume = default_volume
+		self._rate = self.fee(default_volume)
+
+	@property
+	def rate(self) -> float:
+		"""
+		Taker fee of the default tier
+		"""
+		return self._rate
+
+	def tier(self, volume: float) -> int:
+		"""
+		:param volume: 30 day traded volume
+		:return: Index of the tier of that volume
+		"""
+		if not volume >= 0:
+			raise ValueError("Traded volume must be a non negative number. Got: {}".format(volume))
+		return bisect_right(self.thresholds, volume) - 1
+
+	def fee(self, volume: Optional[float] = None, maker: bool = False) -> float:
+		"""
+		:param volume: 30 day traded volume, the default tier if None
+		:param maker: Maker fee if True, taker fee otherwise
+		:return: The fee rate
+		"""
+		if volume is None:
+			return self._rate if not maker else self.maker[self.tier(self.default_volume)]
+		fees = self.maker if maker else self.taker
+		return fees[self.tier(volume)]
+
+
+class FeesEmpty(TieredFees):
+
 	def __init__(self):
 		"""
 		An empty fee model returning 0% fees
 		"""
-	
-	@property
-	def rate(self):
-		return 0.
+		super().__init__((0,), (0.,), (0.,))
 
 
-class FeesTest(object):
+class FeesTest(TieredFees):
 	def __init__(self):
 		"""
 		A test case for fees. Returns a flat 5% fee
 		"""
-	
-	@property
-	def rate(self):
-		return 0.05
+		super().__init__((0,), (0.05,), (0.05,))
+
 
+class FeesKraken(TieredFees):
 
-class FeesKraken(object):
-	
 	def __init__(self):
 		"""
-		Based on zero tier taker fee
+		Kraken spot schedule by 30 day volume in USD, rate is the zero tier taker fee
 		https://www.kraken.com/features/fee-schedule
 		"""
-		pass
-	
-	@property
-	def rate(self):
-		return 0.0026
-	
-	
-class FeesCoinbase(object):
-	
+		super().__init__(
+			(0, 50000, 100000, 250000, 500000, 1000000, 2500000, 5000000, 10000000),
+			(0.0016, 0.0014, 0.0012, 0.0010, 0.0008, 0.0006, 0.0004, 0.0002, 0.),
+			(0.0026, 0.0024, 0.0022, 0.0020, 0.0018, 0.0016, 0.0014, 0.0012, 0.0010),
+		)
+
+
+class FeesCoinbase(TieredFees):
+
 	def __init__(self):
 		"""
-		Based on the second tier taker fee
+		Coinbase Pro schedule by 30 day volume in USD, rate is the second tier taker fee
 		https://pro.coinbase.com/fees
 		"""
-		pass
-	
-	@property
-	def rate(self):
-		return 0.0035
-	
-	
-class FeesBinance(object):
-	
+		super().__init__(
+			(0, 10000, 50000, 100000, 1000000, 10000000, 50000000),
+			(0.0050, 0.0035, 0.0015, 0.0010, 0.0008, 0.0005, 0.),
+			(0.0050, 0.0035, 0.0025, 0.0020, 0.0018, 0.0015, 0.0010),
+			default_volume=10000,
+		)
+
+
+class FeesBinance(TieredFees):
+
 	def __init__(self):
 		"""
 		Based on first tier taker fee
 		https://www.binance.com/en/fee/schedule
 		"""
-		pass
-	
-	@property
-	def rate(self):
-		return 0.001
-	
-	
-class FeesBitmex(object):
-	
+		super().__init__((0,), (0.001,), (0.001,))
+
+
+class FeesBitmex(TieredFees):
+
 	def __init__(self):
 		"""
-		Single tier system
+		Single tier system, makers get a rebate
 		https://www.bitmex.com/app/fees
 		"""
-		pass
-	
-	@property
-	def rate(self):
-		return 0.00075
-	
-	
-class FeesBittrex(object):
-	
+		super().__init__((0,), (-0.00025,), (0.00075,))
+
+
+class FeesBittrex(TieredFees):
+
 	def __init__(self):
 		"""
 		Single tier system
 		https://www.cryptowisser.com/exchange/bittrex/
 		"""
-		pass
-	
-	@property
-	def rate(self):
-		return 0.002
-	
+		super().__init__((0,), (0.002,), (0.002,))
+
+
+class FeesGemini(TieredFees):
 
-class FeesGemini(object):
-	
 	def __init__(self):
 		"""
 		A tier system similar to others
 		https://gemini.com/fees/activetrader-fee-schedule#active-trader
 		"""
-	
-	@property
-	def rate(self):
-		return 0.0035
+		super().__init__((0,), (0.0035,), (0.0035,))
 
 
-class FeesBitstamp(object):
-	
+class FeesBitstamp(TieredFees):
+
 	def __init__(self):
 		"""
 		A tier system similar to others
 		https://www.bitstamp.net/fee-schedule/
 		"""
-	
-	@property
-	def rate(self):
-		return 0.0025
+		super().__init__((0,), (0.0025,), (0.0025,))
+
 
+class FeesOanda(TieredFees):
 
-class FeesOanda(object):
-	
 	def __init__(self):
 		"""
 		Fees built in spread, computed in pips. Average of 1.2 pips of fees per trade.
 		https://brokerchooser.com/broker-reviews/oanda-review/oanda-fees
 		"""
-		pass
-	
-	@property
-	def rate(self):
 		# 1.2*0.01*0.01 = 0.00012 --- the average fee per trade
-		return 0.00012
+		super().__init__((0,), (0.00012,), (0.00012,))
 
-class FeesBitfinex(object):
+class FeesBitfinex(TieredFees):
 
 	def __init__(self):
 		"""
 		Fees based on the first tier of bitfinex fees:
 		https://www.bitfinex.com/fees/
 		"""
-		pass
-
-	@property
-	def rate(self):
-		return 0.002
+		super().__init__((0,), (0.001,), (0.002,))
 
-class FeesPoloniex(object):
+class FeesPoloniex(TieredFees):
 
 	def __init__(self):
 		"""
 		Fees based on https://poloniex.com/fee-schedule
 		"""
-
-	@property
-	def rate(self):
-		return 0.00125
-
+		super().__init__((0,), (0.00125,), (0.00125,))
+
+
+# Fee model of every exchange id, shared by all the Exchange instances
+FEE_MODELS = {
+	"KRAKEN": FeesKraken(),
+	"COINBASE": FeesCoinbase(),
+	"BINANCE": FeesBinance(),
+	"BITMEX": FeesBitmex(),
+	"BITTREX": FeesBittrex(),
+	"OANDA": FeesOanda(),
+	"GEMINI": FeesGemini(),
+	"BITSTAMP": FeesBitstamp(),
+	"BITFINEX": FeesBitfinex(),
+	"POLONIEX": FeesPoloniex(),
+	"EMPTY": FeesEmpty(),
+	"TEST": FeesTest(),
+}
+
+
+def register_fee_model(ex_id: str, model: TieredFees):
+	"""
+	Sets the fee model of an exchange, replacing any previous one. Exchange instances pick their model when
+	they are created, so models should be registered before adding pairs of the exchange.
+
+	:param ex_id: The exchange id
+	:param model: The model, a TieredFees or any object with the same rate property and fee method
+	"""
+	FEE_MODELS[ex_id] = model
+
+
+def get_fee_model(ex_id: str) -> TieredFees:
+	"""
+	:param ex_id: The exchange id
+	:return: The shared fee model of the exchange
+	"""
+	try:
+		return FEE_MODELS[ex_id]
+	except (KeyError, TypeError):
+		raise FeeModelNotFound(ex_id)
@@ -0,0 +1,216 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from base import PriceUpdate
+from errors import PairlNotImplemented
+from orderbook import conflate_updates
+from typing import Dict, List, Optional, TYPE_CHECKING
+import asyncio
+
+if TYPE_CHECKING:
+	from portfolio import Portfolio
+
+
+POLICIES = ("block", "drop_oldest", "conflate")
+
+
+class AsyncIngestor(object):
+
+	def __init__(self, portfolio: "Portfolio", maxsize: int = 10000, policy: str = "block", batch_size: int = 1000):
+		"""
+		Asyncio front end for a Portfolio. Feed handlers put updates in a bounded queue per exchange and a
+		consumer task drains the queues in batches into Portfolio.push_updates, so socket reads only pay for
+		an enqueue. What happens when a queue is full depends on the policy:
+		- block: put waits until the consumer makes room (backpressure)
+		- drop_oldest: the oldest queued update of the exchange is dropped
+		- conflate: updates go to an overflow buffer that only keeps the last update per pair (carrying over
+		  the order book changes of the ones replaced), until the consumer drains it
+
+		:param portfolio: The portfolio to feed
+		:param maxsize: Maximum number of updates queued per exchange
+		:param policy: Overflow policy, one of POLICIES
+		:param batch_size: Maximum number of updates taken from every queue per batch
+		"""
+		if policy not in POLICIES:
+			raise ValueError("Unknown overflow policy: {}. Expected one of {}".format(policy, POLICIES))
+		if maxsize < 1:
+			raise ValueError("Queue size must be at least 1. Got: {}".format(maxsize))
+		self._portfolio = portfolio
+		self.maxsize = maxsize
+		self.policy = policy
+		self.batch_size = batch_size
+
+		self._queues = {}
+		# Conflate policy: per exchange, pair id -> last update that didn't fit in the queue
+		self._overflow = {}
+		# Created by run, inside the event loop it runs on (before Python 3.10 an Event is bound to the
+		# loop current when it is created, which may not be the one asyncio.run starts later)
+		self._ready = None
+		self._task = None
+		self._closing = False
+
+		self._max_depth = {}
+		self._dropped = {}
+		self._conflated = {}
+		self._processed = 0
+		self._rejected = 0
+		self._batches = 0
+
+	def _queue(self, exchange: str) -> asyncio.Queue:
+		queue = self._queues.get(exchange)
+		if queue is None:
+			queue = asyncio.Queue(self.maxsize)
+			self._queues[exchange] = queue
+			self._overflow[exchange] = {}
+			self._max_depth[exchange] = 0
+			self._dropped[exchange] = 0
+			self._conflated[exchange] = 0
+		return queue
+
+	def _wake(self):
+		if self._ready is not None:
+			self._ready.set()
+
+	async def put(self, update: PriceUpdate):
+		"""
+		Queues an update. Only waits with the block policy and a full queue.
+
+		:param update: The update
+		"""
+		if self.policy == "block":
+			queue = self._queue(update.ex)
+			await queue.put(update)
+			self._queued(update.ex, queue)
+		else:
+			self.put_nowait(update)
+
+	def put_nowait(self, update: PriceUpdate):
+		"""
+		Queues an update without ever waiting. With the block policy a full queue raises asyncio.QueueFull.
+
+		:param update: The update
+		"""
+		ex = update.ex
+		queue = self._queue(ex)
+		overflow = self._overflow[ex]
+		if self.policy == "conflate" and (overflow or queue.full()):
+			# Once the overflow is in use everything goes there, so the queue only holds older updates
+			previous = overflow.get(update.id)
+			if previous is not None:
+				self._conflated[ex] += 1
+				update = conflate_updates(previous, update)
+			overflow[update.id] = update
+		else:
+			if self.policy == "drop_oldest" and queue.full():
+				queue.get_nowait()
+				self._dropped[ex] += 1
+			queue.put_nowait(update)
+		self._queued(ex, queue)
+
+	def _queued(self, exchange: str, queue: asyncio.Queue):
+		depth = queue.qsize() + len(self._overflow[exchange])
+		if depth > self._max_depth[exchange]:
+			self._max_depth[exchange] = depth
+		self._wake()
+
+	def _take_batch(self) -> List[PriceUpdate]:
+		"""
+		Takes up to batch_size updates from every queue, plus the whole overflow of a queue once it is empty
+		"""
+		batch = []
+		for ex, queue in self._queues.items():
+			for _ in range(min(self.batch_size, queue.qsize())):
+				batch.append(queue.get_nowait())
+			overflow = self._overflow[ex]
+			if overflow and queue.empty():
+				batch.extend(overflow.values())
+				overflow.clear()
+		return batch
+
+	def _push(self, batch: List[PriceUpdate]):
+		try:
+			self._portfolio.push_updates(batch)
+		except PairlNotImplemented:
+			# Nothing was applied, push the known pairs one by one
+			for update in batch:
+				try:
+					self._portfolio.push_update(update)
+				except PairlNotImplemented:
+					self._rejected += 1
+		self._processed += len(batch)
+		self._batches += 1
+
+	@property
+	def pending(self) -> int:
+		return sum(queue.qsize() for queue in self._queues.values()) + \
+			sum(len(overflow) for overflow in self._overflow.values())
+
+	async def run(self):
+		"""
+		Consumer loop, until stop is called and every queue is empty. Yields to the event loop after every
+		batch so producers keep running.
+		"""
+		self._ready = asyncio.Event()
+		while True:
+			batch = self._take_batch()
+			if batch:
+				self._push(batch)
+				await asyncio.sleep(0)
+				continue
+			if self._closing:
+				return
+			self._ready.clear()
+			await self._ready.wait()
+
+	def start(self) -> asyncio.Task:
+		"""
+		Starts the consumer task in the running event loop
+
+		:return: The task
+		"""
+		if self._task is None or self._task.done():
+			self._closing = False
+			self._task = asyncio.ensure_future(self.run())
+		return self._task
+
+	async def stop(self):
+		"""
+		Pushes every queued update and stops the consumer task
+		"""
+		self._closing = True
+		self._wake()
+		if self._task is not None:
+			await self._task
+			self._task = None
+
+	async def __aenter__(self) -> "AsyncIngestor":
+		self.start()
+		return self
+
+	async def __aexit__(self, *args):
+		await self.stop()
+
+	def metrics(self) -> dict:
+		"""
+		Returns a dictionary about the queues. Keys are:
+		- depth: dict of exchange: updates waiting now
+		- max_depth: dict of exchange: highest depth seen
+		- dropped: dict of exchange: updates dropped by the drop_oldest policy
+		- conflated: dict of exchange: updates replaced by a newer one of the same pair by the conflate policy
+		- processed: updates handed to the portfolio
+		- rejected: updates for pairs not in the portfolio
+		- batches: number of batches pushed
+
+		:return: The metrics
+		"""
+		return {
+			"depth": {ex: queue.qsize() + len(self._overflow[ex]) for ex, queue in self._queues.items()},
+			"max_depth": dict(self._max_depth),
+			"dropped": dict(self._dropped),
+			"conflated": dict(self._conflated),
+			"processed": self._processed,
+			"rejected": self._rejected,
+			"batches": self._batches,
+		}
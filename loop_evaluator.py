@@ -0,0 +1,150 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+	from portfolio import Pair
+
+
+class LoopEvaluator(object):
+
+	def __init__(self, loops: Sequence[Tuple["Pair", ...]], loops_by_pair: Optional[Dict["Pair", List[int]]] = None):
+		"""
+		Compiles a set of loops (as returned by Portfolio.get_possible_loops) into an index matrix over
+		a contiguous array with one slot per pair. Every slot holds log(rate) + log(1 - fee) of its pair,
+		so the net log-return of every loop is a single gather and sum over the matrix.
+		Loops shorter than the longest one are padded with an extra slot that always holds 0.
+		Loop values are cached, and update_pair only recomputes the loops that contain the given pair.
+
+		:param loops: The loops, as tuples of pairs
+		:param loops_by_pair: Reverse index of loop positions per pair. Built from loops if not given
+		"""
+		self._loops = [tuple(loop) for loop in loops]
+		self._pairs = []
+		self._slots = {}
+
+		depth = max([len(loop) for loop in self._loops], default=0)
+		rows = []
+		for loop in self._loops:
+			row = []
+			for pair in loop:
+				slot = self._slots.get(pair)
+				if slot is None:
+					slot = len(self._pairs)
+					self._slots[pair] = slot
+					self._pairs.append(pair)
+				row.append(slot)
+			rows.append(row)
+
+		pad = len(self._pairs)
+		self._matrix = np.full((len(rows), depth), pad, dtype=np.intp)
+		for i, row in enumerate(rows):
+			self._matrix[i, :len(row)] = row
+
+		if loops_by_pair is None:
+			loops_by_pair = {}
+			for i, loop in enumerate(self._loops):
+				for pair in set(loop):
+					loops_by_pair.setdefault(pair, []).append(i)
+		self._rows_by_slot = [np.array(loops_by_pair.get(pair, ()), dtype=np.intp) for pair in self._pairs]
+
+		self._log_rates = np.zeros(pad + 1, dtype=np.float64)
+		self._log_fees = np.zeros(pad + 1, dtype=np.float64)
+		self._net = np.zeros(pad + 1, dtype=np.float64)
+		self._values = np.zeros(len(rows), dtype=np.float64)
+		self.refresh()
+
+	@property
+	def loops(self) -> List[Tuple["Pair", ...]]:
+		return self._loops
+
+	@property
+	def pairs(self) -> List["Pair"]:
+		return self._pairs
+
+	@property
+	def matrix(self) -> np.ndarray:
+		return self._matrix
+
+	def __len__(self) -> int:
+		return len(self._loops)
+
+	@staticmethod
+	def _log_rate(rate: Optional[float]) -> float:
+		if rate is None or rate <= 0:
+			return -np.inf
+		return float(np.log(rate))
+
+	def refresh(self):
+		"""
+		Reloads the rate and fee of every pair. Pairs without a rate get a log rate of -inf, so the
+		loops using them never show as profitable.
+		"""
+		n = len(self._pairs)
+		rates = np.array([pair.rate if pair.rate is not None else 0. for pair in self._pairs], dtype=np.float64)
+		fees = np.array([pair.ex.fee_rate for pair in self._pairs], dtype=np.float64)
+		with np.errstate(divide="ignore", invalid="ignore"):
+			self._log_rates[:n] = np.log(rates)
+			self._log_fees[:n] = np.log1p(-fees)
+		self._log_rates[:n][~(rates > 0)] = -np.inf
+		np.add(self._log_rates, self._log_fees, out=self._net)
+		self._values = self._net[self._matrix].sum(axis=1)
+
+	def update_pair(self, pair: "Pair") -> np.ndarray:
+		"""
+		Reloads the rate of a single pair and recomputes only the loops that contain it
+
+		:param pair: The pair
+		:return: Positions (in loops) of the loops whose value changed. Empty if the pair is not part of any loop
+		"""
+		slot = self._slots.get(pair)
+		if slot is None:
+			return _NO_ROWS
+		self._log_rates[slot] = self._log_rate(pair.rate)
+		self._net[slot] = self._log_rates[slot] + self._log_fees[slot]
+
+		rows = self._rows_by_slot[slot]
+		new_values = self._net[self._matrix[rows]].sum(axis=1)
+		changed = rows[new_values != self._values[rows]]
+		self._values[rows] = new_values
+		return changed
+
+	def values(self) -> np.ndarray:
+		"""
+		Returns the net log-return of every loop, in the same order as loops. A loop is profitable
+		when its value is above 0.
+
+		:return: Array of floats, one per loop
+		"""
+		return self._values.copy()
+
+	def ranked(self, threshold: Optional[float] = None) -> List[Tuple[Tuple["Pair", ...], float]]:
+		"""
+		Returns loops sorted by net log-return, best first
+
+		:param threshold: If given, only loops with a value strictly above it are returned
+		:return: A list of (loop, value) tuples
+		"""
+		values = self._values
+		if threshold is None:
+			idx = np.flatnonzero(~np.isnan(values))
+		else:
+			idx = np.flatnonzero(values > threshold)
+		idx = idx[np.argsort(-values[idx], kind="stable")]
+		return [(self._loops[i], float(values[i])) for i in idx.tolist()]
+
+	def select(self, rows: np.ndarray) -> List[Tuple[Tuple["Pair", ...], float]]:
+		"""
+		Returns the loops at the given positions with their current value
+
+		:param rows: Positions in loops, as returned by update_pair
+		:return: A list of (loop, value) tuples
+		"""
+		return [(self._loops[i], float(self._values[i])) for i in rows.tolist()]
+
+
+_NO_ROWS = np.zeros(0, dtype=np.intp)
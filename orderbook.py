@@ -0,0 +1,213 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+
+Order books (market depth) as sent by exchanges. A book update is a dictionary like:
+
+{
+"type": "snapshot", # Or "diff"
+"bids": [[price, size], ...],
+"asks": [[price, size], ...]
+}
+
+A snapshot replaces the whole book. A diff sets the size of the levels it lists, and a size of 0 removes the level.
+"""
+
+from base import PriceUpdate
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Optional, Sequence, Tuple
+import numpy as np
+
+
+BOOK_TYPES = ("snapshot", "diff")
+
+
+def merge_book_updates(older: Optional[dict], newer: Optional[dict]) -> Optional[dict]:
+	"""
+	Combines two consecutive book updates into one with the same effect on a book
+
+	:param older: The first update, or None
+	:param newer: The second update, or None
+	:return: The combined update
+	"""
+	if older is None or newer is None:
+		return newer if older is None else older
+	if newer.get("type", "snapshot") == "snapshot":
+		return newer
+	merged = {"type": older.get("type", "snapshot")}
+	for side in ("bids", "asks"):
+		levels = {float(price): float(size) for price, size in older.get(side, ())}
+		levels.update((float(price), float(size)) for price, size in newer.get(side, ()))
+		if merged["type"] == "snapshot":
+			merged[side] = [[price, size] for price, size in levels.items() if size]
+		else:
+			merged[side] = [[price, size] for price, size in levels.items()]
+	return merged
+
+
+def conflate_updates(older: PriceUpdate, newer: PriceUpdate) -> PriceUpdate:
+	"""
+	Returns the update that replaces two consecutive updates of a pair: the newer one, carrying the order book
+	changes of both so no diff is lost
+
+	:param older: The update replaced
+	:param newer: The update that replaces it
+	:return: The update to keep
+	"""
+	if older.orderbook is None:
+		return newer
+	book = merge_book_updates(older.orderbook, newer.orderbook)
+	if book is newer.orderbook:
+		return newer
+	return PriceUpdate.from_fields(newer.ex, newer.coin, newer.quote, newer.best_rate, newer.systime, book)
+
+
+class _BookSide(object):
+
+	def __init__(self, sign: float):
+		"""
+		One side of a book as two parallel arrays of doubles sorted by key = sign * price, so the best level
+		is always the last one (highest bid with sign 1, lowest ask with sign -1)
+
+		:param sign: 1. for bids, -1. for asks
+		"""
+		self._sign = sign
+		self._keys = array("d")
+		self._sizes = array("d")
+
+	def __len__(self) -> int:
+		return len(self._keys)
+
+	def load(self, levels: Iterable[Sequence[float]]):
+		sign = self._sign
+		ordered = sorted((sign * float(price), float(size)) for price, size in levels)
+		ordered = [(key, size) for key, size in ordered if size]
+		self._keys = array("d", [key for key, _ in ordered])
+		self._sizes = array("d", [size for _, size in ordered])
+
+	def update(self, price: float, size: float):
+		keys = self._keys
+		key = self._sign * price
+		i = bisect_left(keys, key)
+		if i < len(keys) and keys[i] == key:
+			if size:
+				self._sizes[i] = size
+			else:
+				del keys[i]
+				del self._sizes[i]
+		elif size:
+			keys.insert(i, key)
+			self._sizes.insert(i, size)
+
+	@property
+	def best(self) -> Optional[float]:
+		return self._sign * self._keys[-1] if self._keys else None
+
+	@property
+	def best_size(self) -> Optional[float]:
+		return self._sizes[-1] if self._sizes else None
+
+	def levels(self, depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+		"""
+		:param depth: Maximum number of levels, all of them if None
+		:return: A tuple of (prices, sizes) arrays, best level first. They are copies, the book can keep changing.
+		"""
+		n = len(self._keys) if depth is None else min(depth, len(self._keys))
+		if not n:
+			return np.zeros(0), np.zeros(0)
+		prices = np.frombuffer(self._keys, dtype=np.float64)[:-n - 1:-1] * self._sign
+		sizes = np.frombuffer(self._sizes, dtype=np.float64)[:-n - 1:-1].copy()
+		return prices, sizes
+
+
+class OrderBook(object):
+
+	def __init__(self):
+		"""
+		A level 2 order book. Levels are kept sorted in compact arrays, so a level update is a bisection plus,
+		for new or removed levels, a short move of the levels behind the best one. The best bid and ask are
+		read in O(1).
+		"""
+		self._bids = _BookSide(1.)
+		self._asks = _BookSide(-1.)
+
+	def apply(self, book: dict):
+		"""
+		Applies a snapshot or a diff, see the module docstring for the format
+
+		:param book: The book update
+		"""
+		kind = book.get("type", "snapshot")
+		if kind == "snapshot":
+			self._bids.load(book.get("bids", ()))
+			self._asks.load(book.get("asks", ()))
+		elif kind == "diff":
+			update_bid = self._bids.update
+			for price, size in book.get("bids", ()):
+				update_bid(float(price), float(size))
+			update_ask = self._asks.update
+			for price, size in book.get("asks", ()):
+				update_ask(float(price), float(size))
+		else:
+			raise ValueError("Unknown order book update type: {}. Expected one of {}".format(kind, BOOK_TYPES))
+
+	def update_bid(self, price: float, size: float):
+		self._bids.update(price, size)
+
+	def update_ask(self, price: float, size: float):
+		self._asks.update(price, size)
+
+	def clear(self):
+		self._bids.load(())
+		self._asks.load(())
+
+	@property
+	def best_bid(self) -> Optional[float]:
+		return self._bids.best
+
+	@property
+	def best_ask(self) -> Optional[float]:
+		return self._asks.best
+
+	@property
+	def best_bid_size(self) -> Optional[float]:
+		return self._bids.best_size
+
+	@property
+	def best_ask_size(self) -> Optional[float]:
+		return self._asks.best_size
+
+	@property
+	def spread(self) -> Optional[float]:
+		if not len(self._bids) or not len(self._asks):
+			return None
+		return self._asks.best - self._bids.best
+
+	@property
+	def mid(self) -> Optional[float]:
+		if not len(self._bids) or not len(self._asks):
+			return None
+		return (self._asks.best + self._bids.best) / 2.
+
+	@property
+	def bid_depth(self) -> int:
+		return len(self._bids)
+
+	@property
+	def ask_depth(self) -> int:
+		return len(self._asks)
+
+	def bids(self, depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+		"""
+		:param depth: Maximum number of levels, all of them if None
+		:return: A tuple of (prices, sizes) arrays, highest price first
+		"""
+		return self._bids.levels(depth)
+
+	def asks(self, depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+		"""
+		:param depth: Maximum number of levels, all of them if None
+		:return: A tuple of (prices, sizes) arrays, lowest price first
+		"""
+		return self._asks.levels(depth)
@@ -0,0 +1,124 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from collections import deque
+from typing import Optional, Sequence
+import math
+
+
+class PairStats(object):
+
+	def __init__(self, halflives: Sequence[float] = (60.,), window: int = 100):
+		"""
+		Online statistics of the rate of a pair, updated in O(1) per tick so signal code never has to
+		rescan the history. Keeps:
+		- ema: dict of halflife (seconds) -> exponential moving average of the rate, decayed by elapsed time
+		- count: number of ticks seen
+		- mean_return, variance, volatility: Welford running moments of the log-returns between ticks
+		- min, max, roc: minimum, maximum and rate of change over the last window ticks
+
+		:param halflives: Halflives of the EMAs, in seconds
+		:param window: Number of ticks of the min / max / rate of change window
+		"""
+		if window < 1:
+			raise ValueError("Stats window must be at least 1. Got: {}".format(window))
+		self.halflives = tuple(halflives)
+		self.window = window
+		self.ema = {hl: None for hl in self.halflives}
+		# Per microsecond log decay of every EMA
+		self._decays = [(hl, math.log(0.5) / (hl * 1e6)) for hl in self.halflives]
+
+		self.count = 0
+		self.last = None
+		self._last_ts = None
+
+		self.n_returns = 0
+		self.mean_return = 0.
+		self._m2 = 0.
+
+		self._values = deque(maxlen=window)
+		self._mins = deque()
+		self._maxs = deque()
+
+	def update(self, rate: float, timestamp: int):
+		"""
+		Adds a tick
+
+		:param rate: The rate
+		:param timestamp: Time of the tick in microseconds since the epoch
+		"""
+		last = self.last
+		if last is None:
+			for hl in self.halflives:
+				self.ema[hl] = rate
+		else:
+			elapsed = timestamp - self._last_ts
+			if elapsed > 0:
+				ema = self.ema
+				for hl, decay in self._decays:
+					alpha = 1. - math.exp(decay * elapsed)
+					ema[hl] += alpha * (rate - ema[hl])
+			if rate > 0 and last > 0:
+				ret = math.log(rate / last)
+				self.n_returns += 1
+				delta = ret - self.mean_return
+				self.mean_return += delta / self.n_returns
+				self._m2 += delta * (ret - self.mean_return)
+
+		i = self.count
+		oldest = i - self.window
+		mins = self._mins
+		while mins and mins[-1][1] >= rate:
+			mins.pop()
+		mins.append((i, rate))
+		if mins[0][0] <= oldest:
+			mins.popleft()
+		maxs = self._maxs
+		while maxs and maxs[-1][1] <= rate:
+			maxs.pop()
+		maxs.append((i, rate))
+		if maxs[0][0] <= oldest:
+			maxs.popleft()
+		self._values.append(rate)
+
+		self.count = i + 1
+		self.last = rate
+		self._last_ts = timestamp
+
+	@property
+	def variance(self) -> Optional[float]:
+		"""
+		Sample variance of the log-returns, None with less than two returns
+		"""
+		if self.n_returns < 2:
+			return None
+		return self._m2 / (self.n_returns - 1)
+
+	@property
+	def volatility(self) -> Optional[float]:
+		"""
+		Sample standard deviation of the log-returns, None with less than two returns
+		"""
+		variance = self.variance
+		if variance is None:
+			return None
+		return math.sqrt(variance)
+
+	@property
+	def min(self) -> Optional[float]:
+		return self._mins[0][1] if self._mins else None
+
+	@property
+	def max(self) -> Optional[float]:
+		return self._maxs[0][1] if self._maxs else None
+
+	@property
+	def roc(self) -> Optional[float]:
+		"""
+		Rate of change from the oldest to the newest rate in the window, None if undefined
+		"""
+		if len(self._values) < 2 or not self._values[0]:
+			return None
+		return self.last / self._values[0] - 1.
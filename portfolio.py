@@ -6,14 +6,38 @@ vicmf88@gmail.com
 from base import *
 from collections import deque
 from errors import *
-from typing import Tuple, List, Union, Optional, Dict
+from loop_evaluator import LoopEvaluator
+from cycle_detector import NegativeCycleDetector
+from price_history import PriceHistory
+from pair_stats import PairStats
+from clock import WALL_CLOCK
+from staleness import StalenessIndex
+from routing import RoutingTable, path_rate
+from orderbook import OrderBook
+from typing import Tuple, List, Union, Optional, Dict, Iterable, Set, Sequence
 from datetime import datetime, timedelta
-import itertools
+import sys
+
+
+# Default number of past rates kept per pair
+UPDATES_KEPT = 50
+# Age reported for pairs that never got an update
+NO_DATA_AGE = timedelta(days=9999)
 
 
 class Pair(object):
 	
-	def __init__(self, exchange: Exchange, coin: Asset, quote: Asset):
+	def __init__(self, exchange: Exchange, coin: Asset, quote: Asset, history_len: int = UPDATES_KEPT,
+	             keep_updates: bool = False):
+		"""
+		A tradeable pair of assets within an exchange
+		
+		:param exchange: The exchange
+		:param coin: The coin asset
+		:param quote: The quote asset
+		:param history_len: Number of past rates and times kept in the history ring buffer
+		:param keep_updates: Debug mode, also keeps the last history_len PriceUpdate objects in updates
+		"""
 		self.ex = exchange
 		self.coin = coin
 		self.quote = quote
@@ -28,9 +52,26 @@ class Pair(object):
 			raise WrongAssetError(coin, "any other one as it is repeated (coin = quote !)")
 		
 		self._best_rate = None
-		self.updates = deque()
+		self.history = PriceHistory(history_len)
+		self.updates = deque(maxlen=history_len) if keep_updates else None
+		# Online statistics, only kept once enabled
+		self.stats = None
+		# Market depth, created with the first update that carries an order book
+		self.book = None
 		
 		self._last_update_time_sys = None
+		
+		# Ids never change for a pair, so they are built once
+		self._sliced_id = (exchange.id, coin.id, quote.id)
+		self._id = sys.intern("{}_{}_{}".format(*self._sliced_id))
+		
+		# Small integer assigned by the Portfolio registry, None until the pair is added to one
+		self.handle = None
+		# Source of "now" for staleness, replaced by the one of the Portfolio the pair is added to
+		self.clock = WALL_CLOCK
+		# Called with the pair after add_update and add_batch, set by the Portfolio the pair is added to so
+		# its derived state (staleness, valuation, tracked loops) follows updates that bypass the push methods
+		self.on_update = None
 
 	@property
 	def rate(self) -> Optional[float]:
@@ -42,33 +83,61 @@ class Pair(object):
 	@property
 	def last_update_time(self) -> Optional[datetime]:
 		if self.fake_mode:
-			return datetime.now()
+			return self.clock.now()
 		else:
 			return self._last_update_time_sys
 	
 	@property
 	def time_since_update(self) -> Optional[timedelta]:
+		return self.age(self.time_now)
+	
+	@property
+	def time_now(self) -> datetime:
+		return self.clock.now()
+	
+	def age(self, now: datetime) -> timedelta:
+		"""
+		Time since the last update at a given time, so queries over many pairs can read the clock once
+		
+		:param now: The current time
+		:return: now - time of the last update, or 9999 days if there has never been one
+		"""
 		if self._last_update_time_sys is not None:
-			return self.time_now - self._last_update_time_sys
+			return now - self._last_update_time_sys
 		else:
 			# TODO RECHECK THAT THIS ACTUALLY WORKS EVERYWHERE
-			return timedelta(days=9999)
+			return NO_DATA_AGE
 	
 	@property
-	def time_now(self) -> datetime:
-		return datetime.now()
+	def best_bid(self) -> Optional[float]:
+		return self.book.best_bid if self.book is not None else None
+	
+	@property
+	def best_ask(self) -> Optional[float]:
+		return self.book.best_ask if self.book is not None else None
 	
 	@property
 	def id(self) -> str:
-		return "{}_{}_{}".format(self.ex, self.coin, self.quote)
+		return self._id
 
 	@property
 	def sliced_id(self) -> Tuple[str, str, str]:
-		return (self.ex.id, self.coin.id, self.quote.id)
+		return self._sliced_id
 
 	def __str__(self) -> str:
 		return self.id
 	
+	def enable_stats(self, halflives: Sequence[float] = (60.,), window: int = 100) -> PairStats:
+		"""
+		Starts keeping online statistics of the rate, updated on every tick. See PairStats.
+		
+		:param halflives: Halflives of the EMAs, in seconds
+		:param window: Number of ticks of the min / max / rate of change window
+		:return: The statistics object, also available as Pair.stats
+		"""
+		self.stats = PairStats(halflives, window)
+		return self.stats
+	
 	def add_update(self, update: PriceUpdate):
 		"""
 		Adds an update to the pair. It expects the update to be for this specific pair.
@@ -82,22 +151,140 @@ class Pair(object):
 			raise WrongAssetError(self.coin, update.coin)
 		if update.quote != self.quote.id:
 			raise WrongAssetError(self.quote, update.quote)
+		
+		self._apply(update)
+		if self.on_update is not None:
+			self.on_update(self)
 	
-		self.updates.append(update)
-		if len(self.updates) > 50:
-			self.updates.popleft()
+	def _apply(self, update: PriceUpdate):
+		"""
+		Applies an update already known to belong to this pair, skipping the id checks
+		
+		:param update: The update
+		"""
+		if self.updates is not None:
+			self.updates.append(update)
+		ts = datetime_to_us(update.systime)
+		self.history.append(update.best_rate, ts)
+		if self.stats is not None:
+			self.stats.update(update.best_rate, ts)
+		if update.orderbook is not None:
+			if self.book is None:
+				self.book = OrderBook()
+			self.book.apply(update.orderbook)
 			
 		self._best_rate = update.best_rate
 		self._last_update_time_sys = update.systime
 	
+	def add_batch(self, rates: np.ndarray, timestamps: np.ndarray):
+		"""
+		Adds a run of ticks for this pair in columnar form, as produced by PriceUpdateBatch.groups().
+		In debug mode only the ticks that fit in updates are turned into PriceUpdate objects.
+		
+		:param rates: Array of rates, in order
+		:param timestamps: Array of int64 microseconds since the epoch, in order
+		"""
+		if not len(rates):
+			return
+		self._apply_batch(rates, timestamps)
+		if self.on_update is not None:
+			self.on_update(self)
+	
+	def _apply_batch(self, rates: np.ndarray, timestamps: np.ndarray):
+		"""
+		add_batch without notifying on_update, for callers that keep the derived state themselves
+		
+		:param rates: Array of rates, in order
+		:param timestamps: Array of int64 microseconds since the epoch, in order
+		"""
+		if not len(rates):
+			return
+		
+		self.history.extend(rates, timestamps)
+		if self.stats is not None:
+			update_stats = self.stats.update
+			for rate, ts in zip(rates.tolist(), timestamps.tolist()):
+				update_stats(rate, ts)
+		if self.updates is not None:
+			start = max(0, len(rates) - self.updates.maxlen)
+			for rate, ts in zip(rates[start:].tolist(), timestamps[start:].tolist()):
+				self.updates.append(PriceUpdate.from_fields(self.ex.id, self.coin.id, self.quote.id, rate, us_to_datetime(ts)))
+		
+		self._best_rate = float(rates[-1])
+		self._last_update_time_sys = us_to_datetime(timestamps[-1])
+	
 	
 class Portfolio(object):
 	
-	def __init__(self):
+	def __init__(self, history_len: int = UPDATES_KEPT, keep_updates: bool = False, clock=None):
+		"""
+		A collection of pairs across exchanges, with their assets and holdings
+		
+		:param history_len: Number of past rates kept by every pair added
+		:param keep_updates: Debug mode, pairs also keep their raw PriceUpdate objects
+		:param clock: Source of the current time for staleness queries (see clock), the system clock if None.
+			Use a clock.SimulatedClock for replays.
+		"""
+		self.history_len = history_len
+		self.keep_updates = keep_updates
+		self._clock = clock if clock is not None else WALL_CLOCK
+		# Arguments of Pair.enable_stats for every pair, None while stats are disabled
+		self._stats_config = None
 		self.pairs = {}
 		self.ex_asset = {}
-		self._possible_loops = None
+		# Loops (with their pair -> loop positions reverse index) and evaluators per depth,
+		# dropped every time a pair is added
+		self._possible_loops = {}
+		self._loop_evaluators = {}
+		
+		# Depths whose loop values are kept up to date on every push, and the loops changed by the last one
+		self._tracked_loops = set()
+		self._changed_loops = {}
+		self._cycle_detector = None
 		self._updating = True
+		
+		# Secondary indexes, maintained by add_pair. Every list keeps the order of the pairs nested dict
+		# (exchange, then coin, then quote, each in the order they were first added), given by _pair_order
+		self._pair_list = []
+		self._pairs_by_ex = {}
+		self._pairs_by_coin = {}
+		self._pairs_by_quote = {}
+		self._pair_order = {}
+		self._coin_ranks = {}
+		self._generation = 0
+		# Pairs by last update time, overall and per exchange, maintained by the push methods
+		self._staleness = StalenessIndex()
+		self._staleness_by_ex = {}
+		
+		# Cached get_usd_value result and its totals, with the pairs it read rates from. Dropped when
+		# holdings change, pairs are added or one of those pairs is pushed
+		self._usd_value = None
+		self._usd_totals = None
+		self._usd_deps = set()
+		# Routing tables per numeraire asset, see get_routing_table
+		self._routing_tables = {}
+		
+		# Pair registry. A pair handle is its index in _registry, _pair_by_key maps (ex, coin, quote) to pairs
+		self._registry = []
+		self._pair_by_key = {}
+	
+	@property
+	def generation(self) -> int:
+		"""
+		Counter increased every time the pair universe changes. Callers can keep the last value they saw
+		to know whether anything derived from the pairs has to be rebuilt.
+		"""
+		return self._generation
+	
+	@property
+	def clock(self):
+		return self._clock
+	
+	@clock.setter
+	def clock(self, clock):
+		self._clock = clock
+		for pair in self._registry:
+			pair.clock = clock
 	
 	def add_pair(self, pair: Union[str, Tuple[Exchange, Asset, Asset]]) -> Pair:
 		"""
@@ -115,11 +302,11 @@ class Portfolio(object):
 			ex = Exchange(names[0])
 			coin = Asset(names[1])
 			quote = Asset(names[2])
-			new_pair = Pair(ex, coin, quote)
+			new_pair = Pair(ex, coin, quote, self.history_len, self.keep_updates)
 		elif type(pair) is tuple:
 			if len(pair) != 3:
 				raise IndexError("A symbol needs 3 items. Got: {}".format(pair))
-			new_pair = Pair(*pair)
+			new_pair = Pair(*pair, history_len=self.history_len, keep_updates=self.keep_updates)
 		else:
 			raise UnrecognizedPairlFormat(pair)
 		
@@ -127,11 +314,9 @@ class Portfolio(object):
 		co = new_pair.coin.id
 		quo = new_pair.quote.id
 		
-		try:
-			old_pair = self.pairs[e][co][quo]
+		old_pair = self._pair_by_key.get((e, co, quo))
+		if old_pair is not None:
 			raise AlreadyImplementedPair(old_pair)
-		except KeyError:
-			pass
 		if e not in self.ex_asset.keys():
 			# Let's check that the assets are not already present
 			ex_ass = self.get_assets()
@@ -160,9 +345,64 @@ class Portfolio(object):
 			self.pairs[e][co] = {}
 		if quo not in self.pairs[e][co]:
 			self.pairs[e][co][quo] = new_pair
+		
+		self._index_pair(new_pair)
 
 		return new_pair
 	
+	def _index_pair(self, pair: Pair):
+		"""
+		Registers a new pair, giving it a handle, adds it to the secondary indexes and bumps the generation counter
+		
+		:param pair: The newly added pair
+		"""
+		e, co, quo = pair.sliced_id
+		if self._stats_config is not None:
+			pair.enable_stats(*self._stats_config)
+		pair.handle = len(self._registry)
+		pair.clock = self._clock
+		self._registry.append(pair)
+		self._pair_by_key[pair.sliced_id] = pair
+		ex_rank = list(self.pairs).index(e)
+		coin_rank = self._coin_ranks.setdefault((e, co), len(self.pairs[e]) - 1)
+		self._pair_order[pair] = (ex_rank, coin_rank, len(self.pairs[e][co]) - 1)
+		self._insert_ordered(self._pair_list, pair)
+		self._insert_ordered(self._pairs_by_ex.setdefault(e, []), pair)
+		self._insert_ordered(self._pairs_by_coin.setdefault(co, []), pair)
+		self._insert_ordered(self._pairs_by_quote.setdefault(quo, []), pair)
+		self._staleness.add(pair)
+		self._staleness_by_ex.setdefault(e, StalenessIndex()).add(pair)
+		pair.coin.on_change = self._invalidate_valuation
+		pair.quote.on_change = self._invalidate_valuation
+		pair.on_update = self._pair_updated
+		self._invalidate_valuation()
+		self._generation += 1
+		self._possible_loops = {}
+		self._loop_evaluators = {}
+		self._changed_loops = {}
+		# Tracked evaluators are rebuilt now, with the rates from before the next push, so that push is
+		# compared against them
+		for depth in self._tracked_loops:
+			self._build_loop_evaluator(depth)
+	
+	def _insert_ordered(self, pairs: List[Pair], pair: Pair):
+		"""
+		Inserts a pair in an index list, keeping the order of _pair_order
+		
+		:param pairs: The index list
+		:param pair: The pair, already in _pair_order
+		"""
+		order = self._pair_order
+		key = order[pair]
+		lo, hi = 0, len(pairs)
+		while lo < hi:
+			mid = (lo + hi) // 2
+			if key < order[pairs[mid]]:
+				hi = mid
+			else:
+				lo = mid + 1
+		pairs.insert(lo, pair)
+	
 	def get_pairs_by_exchange(self, exchange: Union[str, Exchange]) -> list:
 		"""
 		Returns a list of pairs instanced for an exchange
@@ -170,16 +410,7 @@ class Portfolio(object):
 		:param exchange: The exchange, in string form or as an object
 		:return: A list of pairs, empty if none is found
 		"""
-		found_pairs = []
-		exchange = str(exchange)
-		if exchange not in self.pairs.keys():
-			return found_pairs
-		
-		for c, a in self.pairs[exchange].items():
-			for quo, b in a.items():
-				found_pairs.append(b)
-				
-		return found_pairs
+		return list(self._pairs_by_ex.get(str(exchange), ()))
 	
 	def get_pairs_by_coin(self, coin: Union[str, Asset]) -> List[Pair]:
 		"""
@@ -188,17 +419,7 @@ class Portfolio(object):
 		:param coin: The coin, in string form or as an object
 		:return: A list of pairs, empty if none is found
 		"""
-		found_pair = []
-		
-		coin = str(coin)
-		
-		for ex in self.pairs.keys():
-			if coin not in self.pairs[ex].keys():
-				continue
-			for quo, pair in self.pairs[ex][coin].items():
-				found_pair.append(pair)
-
-		return found_pair
+		return list(self._pairs_by_coin.get(str(coin), ()))
 	
 	def get_pairs_full(self) -> dict:
 		"""
@@ -206,13 +427,7 @@ class Portfolio(object):
 		
 		:return: The dict.
 		"""
-		pairs_full = {}
-		for ex in self.pairs.keys():
-			pairs_ex = self.get_pairs_by_exchange(ex)
-			pairs_full[ex] = {}
-			for symb in pairs_ex:
-				pairs_full[ex][symb.id] = symb
-		return pairs_full
+		return {ex: {pair.id: pair for pair in pairs} for ex, pairs in self._pairs_by_ex.items()}
 		
 	def get_pairs_by_quote(self, quote: Union[str, Asset]) -> list:
 		"""
@@ -221,17 +436,7 @@ class Portfolio(object):
 		:param quote: The quote, in string form or as an object
 		:return: A list of pairs, empty if none is found
 		"""
-		found_pairs = []
-		
-		quote = str(quote)
-		
-		for ex in self.pairs.keys():
-			for co in self.pairs[ex].keys():
-				if quote not in self.pairs[ex][co].keys():
-					continue
-				found_pairs.append(self.pairs[ex][co][quote])
-
-		return found_pairs
+		return list(self._pairs_by_quote.get(str(quote), ()))
 	
 	def get_pair_by_id(self, pair_id: Union[str, Tuple[Exchange, Asset, Asset]]) -> Optional[Pair]:
 		"""
@@ -247,9 +452,51 @@ class Portfolio(object):
 		if len(pair_id) != 3:
 			raise UnrecognizedPairlFormat(pair_id)
 		if self.pair_exists(pair_id):
-			return self.pairs[pair_id[0]][pair_id[1]][pair_id[2]]
+			return self._pair_by_key[tuple(pair_id)]
 		
 		return found_pair
+	
+	def get_pair_by_handle(self, handle: int) -> Optional[Pair]:
+		"""
+		Returns the pair registered with the given handle, None if there is no such handle
+		
+		:param handle: The pair handle, as in Pair.handle
+		:return: The pair
+		"""
+		if 0 <= handle < len(self._registry):
+			return self._registry[handle]
+		return None
+	
+	def get_handle(self, pair_id: Union[str, Tuple[str, str, str]]) -> int:
+		"""
+		Returns the handle of a pair, so feed handlers can resolve it once and then push by handle
+		
+		:param pair_id: The pair id in string format or tuple of (exchange, coin, quote) as strings
+		:return: The pair handle
+		"""
+		pair = self.get_pair_by_id(pair_id)
+		if pair is None:
+			raise PairlNotImplemented(pair_id)
+		return pair.handle
+
+	def enable_stats(self, halflives: Sequence[float] = (60.,), window: int = 100):
+		"""
+		Enables online statistics (see PairStats) on every pair, including the ones added later
+		
+		:param halflives: Halflives of the EMAs, in seconds
+		:param window: Number of ticks of the min / max / rate of change window
+		"""
+		self._stats_config = (tuple(halflives), window)
+		for pair in self._pair_list:
+			pair.enable_stats(*self._stats_config)
+	
+	def disable_stats(self):
+		"""
+		Stops keeping online statistics on every pair
+		"""
+		self._stats_config = None
+		for pair in self._pair_list:
+			pair.stats = None
 
 	def stop_updating(self):
 		self._updating = False
@@ -264,14 +511,123 @@ class Portfolio(object):
 		:param update: The update as an instance of the PriceUpdate class
 		:return: The updated pair
 		"""
-		if not self.pair_exists(update.id):
+		target_pair = self._pair_by_key.get(update.id)
+		if target_pair is None:
 			raise PairlNotImplemented("{}_{}_{}".format(*update.id))
-		ex, co, quo = update.id
-		target_pair = self.pairs[ex][co][quo]
 		if self._updating:
-			target_pair.add_update(update)
+			target_pair._apply(update)
+			self._after_updates((target_pair,))
+		return target_pair
+	
+	def push_by_handle(self, handle: int, rate: float, systime: datetime) -> Pair:
+		"""
+		Pushes a rate to the pair with the given handle. Meant for feed handlers that resolved
+		their pairs with get_handle beforehand, so no id strings are handled per tick.
+		
+		:param handle: The pair handle
+		:param rate: The best rate
+		:param systime: The time of the update
+		:return: The updated pair
+		"""
+		target_pair = self.get_pair_by_handle(handle)
+		if target_pair is None:
+			raise PairlNotImplemented(handle)
+		if self._updating:
+			ex, co, quo = target_pair.sliced_id
+			target_pair._apply(PriceUpdate.from_fields(ex, co, quo, rate, systime))
+			self._after_updates((target_pair,))
 		return target_pair
 	
+	def push_updates(self, updates: Union[Iterable[PriceUpdate], PriceUpdateBatch]) -> Set[Pair]:
+		"""
+		Pushes a batch of updates to the portfolio. Updates are grouped by pair, so every pair
+		is resolved only once per batch, and then applied in their original order.
+		If any update targets an unknown pair nothing is applied.
+		
+		:param updates: A list or iterator of PriceUpdate instances, or a columnar PriceUpdateBatch
+		:return: The set of pairs touched by the batch, empty if updating is stopped
+		"""
+		if isinstance(updates, PriceUpdateBatch):
+			return self._push_batch(updates)
+		
+		grouped = {}
+		for update in updates:
+			key = update.id
+			try:
+				grouped[key][1].append(update)
+			except KeyError:
+				target_pair = self._pair_by_key.get(key)
+				if target_pair is None:
+					raise PairlNotImplemented("{}_{}_{}".format(*key))
+				grouped[key] = (target_pair, [update])
+		
+		touched = set()
+		if not self._updating:
+			return touched
+		for target_pair, pair_updates in grouped.values():
+			for update in pair_updates:
+				target_pair._apply(update)
+			touched.add(target_pair)
+		self._after_updates(touched)
+		return touched
+	
+	def _push_batch(self, batch: PriceUpdateBatch) -> Set[Pair]:
+		"""
+		Pushes a columnar batch. The pair table of the batch is resolved once and then every pair
+		gets its ticks as array slices, without building an object per tick.
+		
+		:param batch: The batch
+		:return: The set of pairs touched by the batch
+		"""
+		groups = []
+		for pair_id, rates, timestamps in batch.groups():
+			target_pair = self._pair_by_key.get(pair_id)
+			if target_pair is None:
+				raise PairlNotImplemented("{}_{}_{}".format(*pair_id))
+			groups.append((target_pair, rates, timestamps))
+		
+		touched = set()
+		if not self._updating:
+			return touched
+		for target_pair, rates, timestamps in groups:
+			target_pair._apply_batch(rates, timestamps)
+			touched.add(target_pair)
+		self._after_updates(touched)
+		return touched
+	
+	def _after_updates(self, pairs: Iterable[Pair]):
+		"""
+		Keeps derived state in sync after some pairs got new rates
+		
+		:param pairs: The updated pairs
+		"""
+		staleness = self._staleness
+		staleness_by_ex = self._staleness_by_ex
+		for pair in pairs:
+			staleness.touch(pair)
+			staleness_by_ex[pair.ex.id].touch(pair)
+		if self._usd_value is not None and not self._usd_deps.isdisjoint(pairs):
+			self._invalidate_valuation()
+		if self._tracked_loops:
+			self._changed_loops = {}
+			for depth in self._tracked_loops:
+				evaluator = self._loop_evaluators.get(depth)
+				if evaluator is None:
+					evaluator = self._build_loop_evaluator(depth)
+				changed = [evaluator.update_pair(pair) for pair in pairs]
+				if len(changed) == 1:
+					self._changed_loops[depth] = changed[0]
+				elif changed:
+					self._changed_loops[depth] = np.unique(np.concatenate(changed))
+	
+	def _pair_updated(self, pair: Pair):
+		"""
+		Pair.on_update callback, for updates added to a pair directly instead of pushed
+		
+		:param pair: The updated pair
+		"""
+		self._after_updates((pair,))
+	
 	def adjust_holdings_from_assetupd(self, update: Optional[AssetUpdate]) -> Optional[dict]:
 		"""
 		Adjusts holdings from an AssetUpdate object. Assumes assets existign in portfolio. If None is passed, returns None.
@@ -319,11 +675,7 @@ class Portfolio(object):
 			if type(el) is not str:
 				raise UnrecognizedPairlFormat(pair)
 		
-		try:
-			self.pairs[pair[0]][pair[1]][pair[2]]
-		except KeyError:
-			return False
-		return True
+		return tuple(pair) in self._pair_by_key
 		
 	def get_pair_list(self) -> list:
 		"""
@@ -331,14 +683,7 @@ class Portfolio(object):
 		
 		:return: List of pair objects
 		"""
-		
-		found_pairs = []
-		for d1, a in self.pairs.items():
-			for d2, b in a.items():
-				for d3, c in b.items():
-					found_pairs.append(c)
-		
-		return found_pairs
+		return list(self._pair_list)
 	
 	def get_holdings(self) -> dict:
 		"""
@@ -361,76 +706,89 @@ class Portfolio(object):
 		"""
 		Returns a dictionary of [Exchange.id][Asset.id] = [amount, usd_value]
 		If there is no rate for ASSET->USD then usd_value = None
+		The valuation is cached until holdings change, pairs are added or one of the pairs it
+		read a rate from gets an update.
+		"""
+		
+		if self._usd_value is None:
+			self._usd_value, self._usd_deps = self._value_holdings()
+		return {ex: {ass: list(amval) for ass, amval in data.items()} for ex, data in self._usd_value.items()}
+	
+	def _value_holdings(self) -> Tuple[dict, Set[Pair]]:
 		"""
+		Values every holding in USD, directly, through BTC or through the shortest route to USD
 		
-		holdings = self.get_holdings()
+		:return: A tuple of (valuation as returned by get_usd_value, pairs whose rates were read)
+		"""
 		result = {}
+		deps = set()
 		
-		for ex, data in holdings.items():
+		for ex, data in self.get_holdings().items():
 			result[ex] = {}
 			for ass, am in data.items():
 				if ass == "USD":
 					usd_value = am
 				else:
-					try:
-						pair = "{}_{}_USD".format(ex, ass)
-						pair = self.get_pair_by_id(pair)
-						if pair is None:
-							rate1 = self.get_pair_by_id("{}_{}_BTC".format(ex, ass)).rate
-							rate2 = self.get_pair_by_id("{}_BTC_USD".format(ex)).rate
-							usd_value = am*rate1*rate2
-						else:
-							rate = pair.rate
+					usd_value = None
+					path = self._conversion_path(ex, ass, "USD")
+					if path is not None:
+						deps.update(path)
+						rate = path_rate(path)
+						if rate is not None:
 							usd_value = am*rate
-					except:
-						usd_value = None
 				result[ex][ass] = [am, usd_value]
 		
-		return result
+		return result, deps
+	
+	def _get_usd_totals(self) -> Tuple[float, float, Dict[str, float]]:
+		"""
+		Returns the cached totals of the valuation, computing them if needed
+		
+		:return: A tuple of (USD held, full value, full value per exchange)
+		"""
+		if self._usd_value is None:
+			self._usd_value, self._usd_deps = self._value_holdings()
+			self._usd_totals = None
+		if self._usd_totals is None:
+			usdval = 0.
+			fullval = 0.
+			exval = {}
+			for ex, data in self._usd_value.items():
+				exval[ex] = 0.
+				for ass, amval in data.items():
+					value = amval[1] if amval[1] is not None else 0
+					exval[ex] += value
+					fullval += value
+					if ass == "USD":
+						usdval += value
+			self._usd_totals = (usdval, fullval, exval)
+		return self._usd_totals
+	
+	def _invalidate_valuation(self):
+		self._usd_value = None
+		self._usd_totals = None
+		self._usd_deps = set()
 
 	def get_usd_only(self) -> float:
 		"""
 		Returns the value holded in USD form within the whole protfolio
 		"""
 
-		assval = self.get_usd_value()
-		usdval = 0.
-
-		for ex, data in assval.items():
-			for ass, amval in data.items():
-				if ass != "USD":
-					continue
-				usdval += amval[1] if amval[1] is not None else 0
-		return usdval
+		return self._get_usd_totals()[0]
 	
 	def get_full_usd_value(self) -> float:
 		"""
 		Returns the full value of the portfolio in USD form at current rates
 		"""
 		
-		assval = self.get_usd_value()
-		fullval = 0.
-		
-		for ex, data in assval.items():
-			for ass, amval in data.items():
-				fullval += amval[1] if amval[1] is not None else 0
-				
-		return fullval
+		return self._get_usd_totals()[1]
 	
 	def get_usd_per_ex(self) -> dict:
 		"""
 		Returns a dict with full usd value at current rates per exchange
 		"""
 		
-		assval = self.get_usd_value()
-		exval = {}
-		
-		for ex, data in assval.items():
-			exval[ex] = 0.
-			for ass, amval in data.items():
-				exval[ex] += amval[1] if amval[1] is not None else 0
-		
-		return exval
+		return dict(self._get_usd_totals()[2])
 		
 	def get_assets(self) -> Dict[str, Dict[str, Asset]]:
 		"""
@@ -457,15 +815,147 @@ class Portfolio(object):
 		:param depth: Lenght of the loop. Will only search for loops of that lenght, not less, but exactly that.
 		:return: A list ot tuples of pairs, where each tuple represents a different loop. An empty list if none is found.
 		"""
-		if self._possible_loops is not None:
-			return self._possible_loops
-
-		all_pairs = self.get_pair_list()
+		return list(self._get_loops(depth)[0])
+	
+	def _get_loops(self, depth: int) -> Tuple[List[Tuple[Pair, ...]], Dict[Pair, List[int]]]:
+		"""
+		Returns the cached loops of a depth together with the reverse index of loop positions per pair,
+		building both if needed
+		
+		:param depth: Lenght of the loops
+		:return: A tuple of (loops, reverse index)
+		"""
+		cached = self._possible_loops.get(depth)
+		if cached is None:
+			loops = self._find_loops(depth)
+			loops_by_pair = {}
+			for i, loop in enumerate(loops):
+				for pair in loop:
+					positions = loops_by_pair.setdefault(pair, [])
+					if not positions or positions[-1] != i:
+						positions.append(i)
+			cached = (loops, loops_by_pair)
+			self._possible_loops[depth] = cached
+		return cached
+	
+	def get_loops_with_pair(self, pair: Pair, depth: int = 3) -> List[Tuple[Pair, ...]]:
+		"""
+		Returns the loops of the given depth that go through a pair, using the reverse index
+		built alongside get_possible_loops
+		
+		:param pair: The pair
+		:param depth: Lenght of the loops
+		:return: A list of tuples of pairs, empty if the pair is not part of any loop
+		"""
+		loops, loops_by_pair = self._get_loops(depth)
+		return [loops[i] for i in loops_by_pair.get(pair, ())]
+	
+	def get_loop_evaluator(self, depth: int = 3) -> LoopEvaluator:
+		"""
+		Returns a LoopEvaluator compiled over get_possible_loops(depth), with the current rates loaded.
+		The evaluator is cached until a pair is added.
+		
+		:param depth: Lenght of the loops
+		:return: The evaluator
+		"""
+		evaluator = self._loop_evaluators.get(depth)
+		if evaluator is None:
+			evaluator = self._build_loop_evaluator(depth)
+		elif depth not in self._tracked_loops:
+			evaluator.refresh()
+		return evaluator
+	
+	def _build_loop_evaluator(self, depth: int) -> LoopEvaluator:
+		evaluator = LoopEvaluator(*self._get_loops(depth))
+		self._loop_evaluators[depth] = evaluator
+		return evaluator
+	
+	def track_loops(self, depth: int = 3):
+		"""
+		Keeps the values of the loops of a depth up to date on every push. Only the loops that go
+		through the updated pairs are recomputed, and changed_loops tells which ones changed.
 		
+		:param depth: Lenght of the loops
+		"""
+		self._tracked_loops.add(depth)
+		self.get_loop_evaluator(depth).refresh()
+	
+	def untrack_loops(self, depth: int = 3):
+		"""
+		Stops keeping the loops of a depth up to date on every push
+		
+		:param depth: Lenght of the loops
+		"""
+		self._tracked_loops.discard(depth)
+		self._changed_loops.pop(depth, None)
+	
+	def changed_loops(self, depth: int = 3) -> List[Tuple[Tuple[Pair, ...], float]]:
+		"""
+		Returns the loops whose value changed with the last push, for a depth enabled with track_loops
+		
+		:param depth: Lenght of the loops
+		:return: A list of (loop, net log-return) tuples, empty if nothing changed
+		"""
+		rows = self._changed_loops.get(depth)
+		if rows is None:
+			return []
+		return self._loop_evaluators[depth].select(rows)
+	
+	def evaluate_loops(self, depth: int = 3, threshold: Optional[float] = None) -> List[Tuple[Tuple[Pair, ...], float]]:
+		"""
+		Returns every loop of the given depth with its net log-return (rates and fees included), best first.
+		
+		:param depth: Lenght of the loops
+		:param threshold: If given, only loops with a net log-return above it are returned. 0 means profitable
+		:return: A list of (loop, value) tuples
+		"""
+		return self.get_loop_evaluator(depth).ranked(threshold)
+	
+	def find_negative_cycles(self, exchange: Optional[str] = None, max_cycles: int = 1) -> List[Tuple[Pair, ...]]:
+		"""
+		Returns profitable loops of any length within each exchange, found with a negative cycle search
+		over -log(rate * (1 - fee)) edge weights. Loops have the same form as in get_possible_loops.
+		
+		:param exchange: Exchange to search, all of them if None
+		:param max_cycles: Maximum number of loops returned per exchange
+		:return: A list of tuples of pairs, empty if no profitable loop is found
+		"""
+		if self._cycle_detector is None:
+			self._cycle_detector = NegativeCycleDetector(self)
+		return self._cycle_detector.find_cycles(exchange, max_cycles)
+	
+	def _find_loops(self, depth: int) -> List[Tuple[Pair, ...]]:
+		"""
+		Enumerates loops by depth first search over the asset graph, where every pair is an edge from
+		its coin to its quote. Yields the same loops, in the same order, as filtering every permutation
+		of get_pair_list() with check_loop_consistency, but only walks chained prefixes.
+		
+		:param depth: Lenght of the loop
+		:return: A list of tuples of pairs
+		"""
+		if depth < 2:
+			return []
+		
+		by_coin = self._pairs_by_coin
 		possible = []
-		for sequence in itertools.permutations(all_pairs, depth):
-			if self.check_loop_consistency(sequence):
-				possible.append(tuple(sequence))
+		path = []
+		used = set()
+		
+		def extend(pair: Pair):
+			path.append(pair)
+			used.add(pair)
+			if len(path) == depth:
+				if pair.quote.id == path[0].coin.id:
+					possible.append(tuple(path))
+			else:
+				for nxt in by_coin.get(pair.quote.id, ()):
+					if nxt not in used:
+						extend(nxt)
+			used.discard(pair)
+			path.pop()
+		
+		for start in self._pair_list:
+			extend(start)
 		return possible
 		
 	@staticmethod
@@ -495,6 +985,16 @@ class Portfolio(object):
 
 		return True
 
+	def _cutoff(self, threshold: timedelta) -> Tuple[datetime, int]:
+		"""
+		Reads the clock once for a freshness query
+
+		:param threshold: Maximum age of fresh data
+		:return: A tuple of (now, now - threshold in microseconds since the epoch)
+		"""
+		now = self._clock.now()
+		return now, datetime_to_us(now - threshold)
+
 	def pairs_with_data(self, threshold: timedelta) -> List[Pair]:
 		"""
 		Returns the list of pairs with data more recent than now - threshold
@@ -502,13 +1002,12 @@ class Portfolio(object):
 		:return: A list of pair instances.
 		"""
 
-		out = []
+		_, cutoff = self._cutoff(threshold)
+		out = self._staleness.newer_than(cutoff, inclusive=True)
+		if NO_DATA_AGE <= threshold:
+			out = out + self._staleness.never_updated
 
-		for pair in self.get_pair_list():
-			if pair.time_since_update <= threshold:
-				out.append(pair)
-
-		return out
+		return sorted(out, key=self._pair_order.__getitem__)
 
 	def report(self, threshold: timedelta) -> dict:
 		"""
@@ -525,20 +1024,27 @@ class Portfolio(object):
 
 		out = {"all": False, "overview": "", "with": [], "without": [], "exchanges": {}}
 
-		total = [x.time_since_update < threshold for x in self.get_pair_list()]
-		out["all"] = all(total)
-		total = "{}/{}".format(sum(total), len(total))
-		out["overview"] = total
+		_, cutoff = self._cutoff(threshold)
+		staleness = self._staleness
+		wi = staleness.newer_than(cutoff)
+		wo = staleness.older_than(cutoff)
+		if NO_DATA_AGE < threshold:
+			wi = wi + staleness.never_updated
+		elif NO_DATA_AGE > threshold:
+			wo = wo + staleness.never_updated
 
-		wi = [x.id for x in self.get_pair_list() if x.time_since_update < threshold]
-		wo = [x.id for x in self.get_pair_list() if x.time_since_update > threshold]
+		total = len(staleness)
+		out["all"] = len(wi) == total
+		out["overview"] = "{}/{}".format(len(wi), total)
 
-		out["with"] = wi
-		out["without"] = wo
+		order = self._pair_order.__getitem__
+		out["with"] = [x.id for x in sorted(wi, key=order)]
+		out["without"] = [x.id for x in sorted(wo, key=order)]
 
 		result = {}
-		for ex, symblist in self.get_pairs_full().items():
-			result[ex] = all([x.time_since_update < threshold for x in symblist.values()])
+		for ex, index in self._staleness_by_ex.items():
+			oldest = index.oldest
+			result[ex] = (oldest is None or oldest > cutoff) and (NO_DATA_AGE < threshold or not index.never_updated)
 
 		out["exchanges"] = result
 
@@ -549,23 +1055,61 @@ class Portfolio(object):
 		Returns TRUE if data has been added within the last second, false otherwise
 		"""
 
-		for pair in self.get_pair_list():
-			if pair.time_since_update <= timedelta(seconds=3):
-				return True
-
-		return False
+		_, cutoff = self._cutoff(timedelta(seconds=3))
+		newest = self._staleness.newest_pair
+		return newest is not None and newest.history.last_timestamp >= cutoff
 
 	def last_data_td(self) -> timedelta:
-		tdelta = []
-		for pair in self.get_pair_list():
-			tdelta.append(pair.time_since_update)
-		return min(tdelta)
+		if not self._pair_list:
+			raise ValueError("No pairs in the portfolio")
+		newest = self._staleness.newest_pair
+		if newest is None:
+			return NO_DATA_AGE
+		return newest.age(self._clock.now())
+
+	def get_routing_table(self, numeraire: str = "USD") -> RoutingTable:
+		"""
+		Returns the table of shortest conversion paths from every asset to a numeraire, per exchange.
+		Tables are kept and only rebuilt after pairs are added.
+
+		:param numeraire: Asset id the paths end in
+		:return: The routing table
+		"""
+		table = self._routing_tables.get(numeraire)
+		if table is None:
+			table = RoutingTable(self, numeraire)
+			self._routing_tables[numeraire] = table
+		return table
+
+	def _conversion_path(self, exchange: str, asset: str, quote_asset: str,
+	                     vehicle_asset: Optional[str] = "BTC") -> Optional[Tuple[Pair, ...]]:
+		"""
+		Returns the pairs to convert an asset into another one: the direct pair if it exists, else the pairs
+		through the vehicle asset, else the shortest route of the routing table
+
+		:param exchange: Exchange in string form
+		:param asset: The initial asset
+		:param quote_asset: The final asset
+		:param vehicle_asset: The preferred intermediate asset, None to go straight to the routing table
+		:return: A tuple of pairs, None if there is no way
+		"""
+		pair_by_key = self._pair_by_key
+		pair = pair_by_key.get((exchange, asset, quote_asset))
+		if pair is not None:
+			return (pair,)
+		if vehicle_asset is not None:
+			pair1 = pair_by_key.get((exchange, asset, vehicle_asset))
+			pair2 = pair_by_key.get((exchange, vehicle_asset, quote_asset))
+			if pair1 is not None and pair2 is not None:
+				return (pair1, pair2)
+		return self.get_routing_table(quote_asset).route(exchange, asset)
 
 	def get_virtual_rate(self, exchange: str, asset: str, quote_asset: str, vehicle_asset: str = "BTC") -> Optional[float]:
 		"""
 		Returns a virtual conversion rate between two assets that (may not form a pair)
 		using their comparison to a third one.
 		Quote asset = (Asset -> Vehicle rate) * (Vehicle -> Quote rate)
+		If the vehicle pairs don't exist the shortest path of pairs from the routing table is used.
 
 		:param exchange: Exchange in string form
 		:param asset: The initial asset
@@ -574,20 +1118,21 @@ class Portfolio(object):
 		:return: Virtual rate if possible, None if not.
 		"""
 
-		s1 = self.get_pair_by_id("{}_{}_{}".format(exchange, asset, vehicle_asset))
-		s2 = self.get_pair_by_id("{}_{}_{}".format(exchange, vehicle_asset, quote_asset))
+		pair_by_key = self._pair_by_key
+		s1 = pair_by_key.get((exchange, asset, vehicle_asset))
+		s2 = pair_by_key.get((exchange, vehicle_asset, quote_asset))
 
 		if s1 is None or s2 is None:
-			return None
+			return self.get_routing_table(quote_asset).rate(exchange, asset)
 
-		virtual_rate = s1.rate * s2.rate
-		return virtual_rate
+		return path_rate((s1, s2))
 
 	def predict_usd_val(self, exchange: str, asset: str, vehicle_asset: str = "BTC") -> Optional[float]:
 		"""
 		Predicts the USD value of an asset in a specific exchange. If no direct pair
 		with USD is present then it will try to get a virtual rate to USD through a vehicle asset
-		(BTC by default). Returns None if no direct or virtual rate is found.
+		(BTC by default), and then through any other path of pairs to USD.
+		Returns None if no direct or virtual rate is found.
 		
 		:param exchange:
 		:param asset:
@@ -595,15 +1140,13 @@ class Portfolio(object):
 		:return: The predicted usd value of the specific asset in the exchange
 		"""
 
-		to_usd_str = "{}_{}_USD".format(exchange, asset)
-		symb = self.get_pair_by_id(to_usd_str)
-		if symb is None:
-			rate = self.get_virtual_rate(exchange, asset, "USD", vehicle_asset)
-			if rate is None:
-				return None
-		else:
-			rate = symb.rate
-		assobj = self.get_assets()[exchange][asset]
+		path = self._conversion_path(exchange, asset, "USD", vehicle_asset)
+		if path is None:
+			return None
+		rate = path_rate(path)
+		if rate is None:
+			return None
+		assobj = self.ex_asset[exchange][asset]
 		return assobj.am * rate
 
 	def add_pair_reverses(self):
@@ -625,6 +1168,6 @@ class Portfolio(object):
 
 		:return:
 		"""
-		for pair in self.get_pair_list():
-			pair.coin._hold = 100
-			pair.quote._hold = 100
+		for pair in self._pair_list:
+			pair.coin.am = 100
+			pair.quote.am = 100
@@ -0,0 +1,109 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from typing import Optional
+import numpy as np
+
+
+class PriceHistory(object):
+
+	def __init__(self, capacity: int):
+		"""
+		Fixed capacity ring buffer of rates and int64 timestamps (microseconds since the epoch).
+		Storage is allocated once. Every value is written twice, at its position and at position + capacity,
+		so the window from the oldest to the newest value is always a contiguous slice and can be handed
+		out as a NumPy view without copying.
+
+		:param capacity: Maximum number of values kept
+		"""
+		if capacity < 1:
+			raise ValueError("History capacity must be at least 1. Got: {}".format(capacity))
+		self._capacity = capacity
+		self._rates = np.full(2 * capacity, np.nan, dtype=np.float64)
+		self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+		self._next = 0
+		self._size = 0
+
+	@property
+	def capacity(self) -> int:
+		return self._capacity
+
+	def __len__(self) -> int:
+		return self._size
+
+	def append(self, rate: float, timestamp: int):
+		"""
+		Adds a value, dropping the oldest one if the buffer is full
+
+		:param rate: The rate
+		:param timestamp: Microseconds since the epoch
+		"""
+		i = self._next
+		j = i + self._capacity
+		self._rates[i] = rate
+		self._rates[j] = rate
+		self._timestamps[i] = timestamp
+		self._timestamps[j] = timestamp
+		self._next = i + 1 if i + 1 < self._capacity else 0
+		if self._size < self._capacity:
+			self._size += 1
+
+	def extend(self, rates: np.ndarray, timestamps: np.ndarray):
+		"""
+		Adds a run of values in order. Only the last capacity values are written.
+
+		:param rates: Array of rates
+		:param timestamps: Array of microseconds since the epoch
+		"""
+		n = len(rates)
+		if n > self._capacity:
+			rates = rates[n - self._capacity:]
+			timestamps = timestamps[n - self._capacity:]
+			n = self._capacity
+		if not n:
+			return
+		idx = (self._next + np.arange(n)) % self._capacity
+		self._rates[idx] = rates
+		self._rates[idx + self._capacity] = rates
+		self._timestamps[idx] = timestamps
+		self._timestamps[idx + self._capacity] = timestamps
+		self._next = (self._next + n) % self._capacity
+		self._size = min(self._size + n, self._capacity)
+
+	def clear(self):
+		self._next = 0
+		self._size = 0
+
+	def _window(self, data: np.ndarray) -> np.ndarray:
+		start = (self._next - self._size) % self._capacity
+		view = data[start:start + self._size]
+		view.flags.writeable = False
+		return view
+
+	@property
+	def rates(self) -> np.ndarray:
+		"""
+		Read only view of the rates, oldest first
+		"""
+		return self._window(self._rates)
+
+	@property
+	def timestamps(self) -> np.ndarray:
+		"""
+		Read only view of the timestamps, oldest first
+		"""
+		return self._window(self._timestamps)
+
+	@property
+	def last_rate(self) -> Optional[float]:
+		if not self._size:
+			return None
+		return float(self._rates[self._next - 1 + self._capacity])
+
+	@property
+	def last_timestamp(self) -> Optional[int]:
+		if not self._size:
+			return None
+		return int(self._timestamps[self._next - 1 + self._capacity])
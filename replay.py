@@ -0,0 +1,159 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from base import PriceUpdate, AssetUpdate, PriceUpdateBatch
+from errors import SimulationNotCompleted
+from typing import Iterable, Iterator, Sequence, Union, TYPE_CHECKING
+from operator import attrgetter
+import heapq
+import time
+
+if TYPE_CHECKING:
+	from portfolio import Pair, Portfolio
+
+
+Event = Union[PriceUpdate, AssetUpdate]
+
+
+class Strategy(object):
+
+	def __init__(self):
+		"""
+		Base class for strategies driven by ReplayEngine. Every callback does nothing by default,
+		and the engine doesn't even call the ones that are not overridden.
+		"""
+		pass
+
+	def on_start(self, portfolio: "Portfolio"):
+		pass
+
+	def on_price_update(self, portfolio: "Portfolio", pair: "Pair", update: PriceUpdate):
+		pass
+
+	def on_asset_update(self, portfolio: "Portfolio", holdings: dict, update: AssetUpdate):
+		pass
+
+	def on_finish(self, portfolio: "Portfolio"):
+		pass
+
+
+def _overrides(strategy: Strategy, name: str) -> bool:
+	return getattr(type(strategy), name) is not getattr(Strategy, name)
+
+
+def _flatten(source: Iterable[Union[Event, PriceUpdateBatch]]) -> Iterator[Event]:
+	"""
+	Expands the PriceUpdateBatch items of a source into PriceUpdate objects, lazily
+	"""
+	for item in source:
+		if isinstance(item, PriceUpdateBatch):
+			yield from item.iter_updates()
+		else:
+			yield item
+
+
+class ReplayEngine(object):
+
+	def __init__(self, portfolio: "Portfolio", sources: Sequence[Iterable[Union[Event, PriceUpdateBatch]]],
+	             strategies: Sequence[Strategy] = ()):
+		"""
+		Replays several time ordered sources of updates (one per exchange or file, for instance) as a single
+		stream in timestamp order, using a k-way heap merge. PriceUpdates are pushed to the portfolio and
+		AssetUpdates adjust its holdings, then the strategies get their callbacks. Updates with the same time
+		keep the order of their sources. Sources may also yield PriceUpdateBatch items, which are expanded.
+		If the portfolio runs on a clock.SimulatedClock, it is advanced to the time of every event before it
+		is applied, so staleness queries made by strategies see replayed time.
+
+		:param portfolio: The portfolio to drive. Must already contain every pair found in the sources.
+		:param sources: Iterables of PriceUpdate / AssetUpdate, each one sorted by time
+		:param strategies: Strategies to call on every event
+		"""
+		self._portfolio = portfolio
+		self._sources = list(sources)
+		self._strategies = list(strategies)
+		self._running = False
+		self._report = None
+
+	def stop(self):
+		"""
+		Stops the replay after the current event. Meant to be called from a strategy callback.
+		"""
+		self._running = False
+
+	def run(self) -> dict:
+		"""
+		Runs the replay until every source is exhausted or stop is called
+
+		:return: The run report, see report
+		"""
+		portfolio = self._portfolio
+		push_update = portfolio.push_update
+		adjust_holdings = portfolio.adjust_holdings_from_assetupd
+		advance_clock = getattr(portfolio.clock, "advance_to", None)
+		on_price = [s.on_price_update for s in self._strategies if _overrides(s, "on_price_update")]
+		on_assets = [s.on_asset_update for s in self._strategies if _overrides(s, "on_asset_update")]
+
+		for strategy in self._strategies:
+			strategy.on_start(portfolio)
+
+		stream = heapq.merge(*[_flatten(source) for source in self._sources], key=attrgetter("systime"))
+		price_count = 0
+		asset_count = 0
+		first = None
+		last = None
+		self._running = True
+		started = time.perf_counter()
+
+		for event in stream:
+			if advance_clock is not None:
+				advance_clock(event.systime)
+			if type(event) is PriceUpdate:
+				pair = push_update(event)
+				price_count += 1
+				for callback in on_price:
+					callback(portfolio, pair, event)
+			elif type(event) is AssetUpdate:
+				holdings = adjust_holdings(event)
+				asset_count += 1
+				for callback in on_assets:
+					callback(portfolio, holdings, event)
+			else:
+				raise TypeError("Unknown event in replay source: {}".format(type(event).__name__))
+			if first is None:
+				first = event.systime
+			last = event.systime
+			if not self._running:
+				break
+
+		elapsed = time.perf_counter() - started
+		self._running = False
+
+		for strategy in self._strategies:
+			strategy.on_finish(portfolio)
+
+		self._report = {
+			"events": price_count + asset_count,
+			"price_updates": price_count,
+			"asset_updates": asset_count,
+			"start": first,
+			"end": last,
+			"elapsed": elapsed,
+			"events_per_second": (price_count + asset_count) / elapsed if elapsed > 0 else None,
+		}
+		return self._report
+
+	def report(self) -> dict:
+		"""
+		Returns a dictionary about the last run. Keys are:
+		- events, price_updates, asset_updates: number of events replayed
+		- start, end: time of the first and last event replayed
+		- elapsed: wall time of the run in seconds
+		- events_per_second: replay speed
+
+		:return: The report
+		"""
+		if self._report is None:
+			raise SimulationNotCompleted()
+		return self._report
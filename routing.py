@@ -0,0 +1,85 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from collections import deque
+from typing import Dict, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+	from portfolio import Pair, Portfolio
+
+
+class RoutingTable(object):
+
+	def __init__(self, portfolio: "Portfolio", numeraire: str = "USD"):
+		"""
+		Shortest conversion paths from every asset to a numeraire asset, per exchange. A path is a tuple of
+		pairs where every pair converts its coin into its quote (amount * rate), so the rate of the path is the
+		product of the rates of its pairs. Paths are found with a breadth first search backwards from the
+		numeraire, preferring the pairs added first on ties, and rebuilt when the portfolio gets new pairs.
+
+		:param portfolio: The portfolio
+		:param numeraire: Asset id every path ends in
+		"""
+		self._portfolio = portfolio
+		self.numeraire = numeraire
+		self._generation = None
+		self._routes = {}
+
+	def _exchange_routes(self, exchange: str) -> Dict[str, Tuple["Pair", ...]]:
+		if self._generation != self._portfolio.generation:
+			self._routes = {}
+			self._generation = self._portfolio.generation
+		routes = self._routes.get(exchange)
+		if routes is None:
+			by_quote = {}
+			for pair in self._portfolio.get_pairs_by_exchange(exchange):
+				by_quote.setdefault(pair.quote.id, []).append(pair)
+
+			routes = {self.numeraire: ()}
+			queue = deque([self.numeraire])
+			while queue:
+				asset = queue.popleft()
+				for pair in by_quote.get(asset, ()):
+					coin = pair.coin.id
+					if coin not in routes:
+						routes[coin] = (pair,) + routes[asset]
+						queue.append(coin)
+			self._routes[exchange] = routes
+		return routes
+
+	def route(self, exchange: str, asset: str) -> Optional[Tuple["Pair", ...]]:
+		"""
+		:param exchange: Exchange id
+		:param asset: Asset id
+		:return: The pairs converting asset into the numeraire, an empty tuple for the numeraire itself and
+			None if there is no path
+		"""
+		return self._exchange_routes(str(exchange)).get(str(asset))
+
+	def rate(self, exchange: str, asset: str) -> Optional[float]:
+		"""
+		:param exchange: Exchange id
+		:param asset: Asset id
+		:return: Conversion rate from asset to the numeraire at current rates, None if there is no path or
+			some pair in it has no rate yet
+		"""
+		path = self.route(exchange, asset)
+		if path is None:
+			return None
+		return path_rate(path)
+
+
+def path_rate(path: Tuple["Pair", ...]) -> Optional[float]:
+	"""
+	:param path: Pairs where each one converts into the coin of the next one
+	:return: Product of the rates of the pairs, None if any of them has no rate yet
+	"""
+	rate = 1.
+	for pair in path:
+		pair_rate = pair.rate
+		if pair_rate is None:
+			return None
+		rate *= pair_rate
+	return rate
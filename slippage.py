@@ -0,0 +1,166 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+
+Slippage from order book depth. Orders are filled walking the levels of a book side from the best one, and
+every function takes many order sizes at once: the levels are accumulated once and every size is located with
+a binary search, so there are no Python loops over levels or sizes.
+"""
+
+from typing import Optional, Sequence, Tuple, TYPE_CHECKING
+import numpy as np
+
+if TYPE_CHECKING:
+	from portfolio import Pair
+
+
+def walk_levels(prices: np.ndarray, sizes: np.ndarray, amounts) -> Tuple[np.ndarray, np.ndarray]:
+	"""
+	Fills orders against the levels of a book side
+
+	:param prices: Level prices, best first
+	:param sizes: Level sizes, best first
+	:param amounts: Order size, or array of order sizes, in the same unit as sizes
+	:return: A tuple of (notional, filled) arrays: sum of price * size taken and size filled per order. Orders
+		bigger than the whole side are filled up to its depth.
+	"""
+	amounts = np.asarray(amounts, dtype=np.float64)
+	if not len(sizes):
+		return np.zeros_like(amounts), np.zeros_like(amounts)
+	cum_sizes = np.cumsum(sizes)
+	cum_notional = np.cumsum(prices * sizes)
+	filled = np.minimum(amounts, cum_sizes[-1])
+	# Level where every order ends, and what was taken before it
+	last = np.minimum(np.searchsorted(cum_sizes, filled, side="left"), len(sizes) - 1)
+	before_size = np.where(last > 0, cum_sizes[last - 1], 0.)
+	before_notional = np.where(last > 0, cum_notional[last - 1], 0.)
+	notional = before_notional + (filled - before_size) * prices[last]
+	return notional, filled
+
+
+def fill_price(prices: np.ndarray, sizes: np.ndarray, amounts) -> np.ndarray:
+	"""
+	Volume weighted average price of orders filled against a book side
+
+	:param prices: Level prices, best first
+	:param sizes: Level sizes, best first
+	:param amounts: Order size, or array of order sizes
+	:return: Array of average prices, NaN where the order can't be filled completely
+	"""
+	notional, filled = walk_levels(prices, sizes, amounts)
+	amounts = np.asarray(amounts, dtype=np.float64)
+	with np.errstate(divide="ignore", invalid="ignore"):
+		return np.where((filled < amounts) | (filled <= 0), np.nan, notional / filled)
+
+
+def max_fillable_bid(prices: np.ndarray, sizes: np.ndarray, limit_price: Optional[float] = None) -> float:
+	"""
+	Maximum size that can be sold into the bids without going below a limit price
+
+	:param prices: Bid prices, highest first
+	:param sizes: Level sizes, best first
+	:param limit_price: Lowest price accepted, None for the whole depth
+	:return: The size
+	"""
+	if limit_price is None:
+		return float(np.sum(sizes))
+	n = np.searchsorted(-np.asarray(prices), -limit_price, side="right")
+	return float(np.sum(sizes[:n]))
+
+
+def max_fillable_ask(prices: np.ndarray, sizes: np.ndarray, limit_price: Optional[float] = None) -> float:
+	"""
+	Maximum size that can be bought from the asks without going above a limit price
+
+	:param prices: Ask prices, lowest first
+	:param sizes: Level sizes, best first
+	:param limit_price: Highest price accepted, None for the whole depth
+	:return: The size
+	"""
+	if limit_price is None:
+		return float(np.sum(sizes))
+	n = np.searchsorted(prices, limit_price, side="right")
+	return float(np.sum(sizes[:n]))
+
+
+def sell(pair: "Pair", amounts) -> np.ndarray:
+	"""
+	Quote received selling coin into the bids of a pair, fees included
+
+	:param pair: The pair, with an order book
+	:param amounts: Coin amount, or array of amounts
+	:return: Array of quote amounts, NaN where the bids are not deep enough
+	"""
+	amounts = np.asarray(amounts, dtype=np.float64)
+	prices, sizes = pair.book.bids()
+	notional, filled = walk_levels(prices, sizes, amounts)
+	return np.where(filled < amounts, np.nan, notional * (1. - pair.ex.fee_rate))
+
+
+def buy(pair: "Pair", amounts) -> np.ndarray:
+	"""
+	Coin received spending quote on the asks of a pair, fees included
+
+	:param pair: The pair, with an order book
+	:param amounts: Quote amount, or array of amounts
+	:return: Array of coin amounts, NaN where the asks are not deep enough
+	"""
+	amounts = np.asarray(amounts, dtype=np.float64)
+	prices, sizes = pair.book.asks()
+	# Walking the asks in quote terms: every level offers price * size quote for size coin
+	coin, spent = walk_levels(1. / prices, prices * sizes, amounts)
+	return np.where(spent < amounts, np.nan, coin * (1. - pair.ex.fee_rate))
+
+
+def loop_output(loop: Sequence["Pair"], amounts) -> np.ndarray:
+	"""
+	Walks a loop (as returned by Portfolio.get_possible_loops, every pair converting its coin into its quote)
+	selling into the bids of every pair, for many starting amounts at once. Pairs without an order book are
+	converted at Pair.rate with unlimited depth.
+
+	:param loop: The pairs of the loop
+	:param amounts: Starting amount in the coin of the first pair, or array of amounts
+	:return: Array of final amounts in the quote of the last pair, fees included. NaN where some pair is not
+		deep enough or has no rate.
+	"""
+	out = np.array(amounts, dtype=np.float64)
+	for pair in loop:
+		if pair.book is not None:
+			out = sell(pair, out)
+		elif pair.rate is not None:
+			out = out * (pair.rate * (1. - pair.ex.fee_rate))
+		else:
+			out = np.full_like(out, np.nan)
+	return out
+
+
+def loops_output(loops: Sequence[Sequence["Pair"]], amounts) -> np.ndarray:
+	"""
+	loop_output for several loops
+
+	:param loops: The loops
+	:param amounts: Array of starting amounts, shared by every loop
+	:return: 2D array of final amounts, one row per loop and one column per amount
+	"""
+	amounts = np.atleast_1d(np.asarray(amounts, dtype=np.float64))
+	result = np.empty((len(loops), len(amounts)))
+	for i, loop in enumerate(loops):
+		result[i] = loop_output(loop, amounts)
+	return result
+
+
+def best_size(loop: Sequence["Pair"], amounts) -> Tuple[Optional[float], float]:
+	"""
+	Picks the starting amount with the highest profit for a loop among candidates
+
+	:param loop: The pairs of the loop
+	:param amounts: Array of candidate starting amounts
+	:return: A tuple of (amount, profit in the starting asset). Amount is None if no candidate is profitable.
+	"""
+	amounts = np.atleast_1d(np.asarray(amounts, dtype=np.float64))
+	profit = loop_output(loop, amounts) - amounts
+	profit = np.where(np.isnan(profit), -np.inf, profit)
+	i = int(np.argmax(profit))
+	if not profit[i] > 0:
+		return None, 0.
+	return float(amounts[i]), float(profit[i])
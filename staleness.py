@@ -0,0 +1,111 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from collections import OrderedDict
+from typing import List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+	from portfolio import Pair
+
+
+class StalenessIndex(object):
+
+	def __init__(self):
+		"""
+		Pairs ordered by the time of their last update, oldest first, so freshness queries only walk the pairs
+		they return instead of scanning all of them. Updates almost always carry the newest time seen, which
+		moves the pair to the end in O(1). Out of order times only mark the index as unsorted, and it is sorted
+		again by the next query. Times are int microseconds since the epoch, as kept by Pair.history.
+		Pairs that never got an update are kept apart.
+		"""
+		# Pair -> time it is filed under, in time order unless _unsorted
+		self._order = OrderedDict()
+		self._newest = None
+		self._unsorted = False
+		self._never = set()
+
+	def __len__(self) -> int:
+		return len(self._order) + len(self._never)
+
+	def add(self, pair: "Pair"):
+		"""
+		Adds a pair to the index
+
+		:param pair: The pair
+		"""
+		self._never.add(pair)
+		self.touch(pair)
+
+	def touch(self, pair: "Pair"):
+		"""
+		Moves a pair to the position of its current last update time
+
+		:param pair: A pair already in the index
+		"""
+		ts = pair.history.last_timestamp
+		if ts is None:
+			return
+		order = self._order
+		old = order.get(pair)
+		if old == ts:
+			return
+		if old is None:
+			self._never.discard(pair)
+		order[pair] = ts
+		if self._newest is None or ts >= self._newest:
+			order.move_to_end(pair)
+			self._newest = ts
+		else:
+			self._unsorted = True
+
+	def _sorted(self) -> OrderedDict:
+		if self._unsorted:
+			self._order = OrderedDict(sorted(self._order.items(), key=lambda x: x[1]))
+			self._newest = next(reversed(self._order.values()))
+			self._unsorted = False
+		return self._order
+
+	@property
+	def never_updated(self) -> List["Pair"]:
+		return list(self._never)
+
+	def newer_than(self, cutoff: int, inclusive: bool = False) -> List["Pair"]:
+		"""
+		:param cutoff: Time in microseconds since the epoch
+		:param inclusive: Whether pairs updated exactly at cutoff are included
+		:return: Pairs last updated after cutoff, oldest first
+		"""
+		order = self._sorted()
+		out = []
+		for pair in reversed(order):
+			ts = order[pair]
+			if ts < cutoff or (ts == cutoff and not inclusive):
+				break
+			out.append(pair)
+		out.reverse()
+		return out
+
+	def older_than(self, cutoff: int, inclusive: bool = False) -> List["Pair"]:
+		"""
+		:param cutoff: Time in microseconds since the epoch
+		:param inclusive: Whether pairs updated exactly at cutoff are included
+		:return: Pairs with data last updated before cutoff, oldest first
+		"""
+		out = []
+		for pair, ts in self._sorted().items():
+			if ts > cutoff or (ts == cutoff and not inclusive):
+				break
+			out.append(pair)
+		return out
+
+	@property
+	def oldest(self) -> Optional[int]:
+		order = self._sorted()
+		return next(iter(order.values())) if order else None
+
+	@property
+	def newest_pair(self) -> Optional["Pair"]:
+		order = self._sorted()
+		return next(reversed(order)) if order else None
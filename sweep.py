@@ -0,0 +1,136 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from base import PriceUpdateBatch
+from portfolio import Portfolio, UPDATES_KEPT
+from replay import ReplayEngine, Strategy
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Iterator, List, Optional, Sequence, Union
+import numpy as np
+
+
+# Arrays attached by every worker process, see _attach
+_worker = {}
+
+
+def _pair_key(pair_id: Union[str, tuple]) -> str:
+	if type(pair_id) is str:
+		return pair_id
+	return "{}_{}_{}".format(*pair_id)
+
+
+def _attach(pair_ids: List[str], portfolio_pairs: List[str], blocks: list, history_len: int):
+	"""
+	Worker initializer, maps the shared tick arrays once per process
+	"""
+	_worker["pair_ids"] = pair_ids
+	_worker["portfolio_pairs"] = portfolio_pairs
+	_worker["history_len"] = history_len
+	_worker["shms"] = []
+	for key, name, dtype, length in blocks:
+		shm = shared_memory.SharedMemory(name=name)
+		_worker["shms"].append(shm)
+		_worker[key] = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+
+
+def _batches(chunk_size: int) -> Iterator[PriceUpdateBatch]:
+	pair_ids = _worker["pair_ids"]
+	handles, rates, timestamps = _worker["handles"], _worker["rates"], _worker["timestamps"]
+	for start in range(0, len(handles), chunk_size):
+		stop = start + chunk_size
+		yield PriceUpdateBatch(pair_ids, handles[start:stop], rates[start:stop], timestamps[start:stop])
+
+
+def _run_one(strategy_factory: Callable[[dict], Strategy], params: dict, chunk_size: int) -> dict:
+	"""
+	Replays the shared ticks with one parameter set in a fresh portfolio
+
+	:return: The result row
+	"""
+	portfolio = Portfolio(history_len=_worker["history_len"])
+	for pair_id in _worker["portfolio_pairs"]:
+		portfolio.add_pair(pair_id)
+	strategy = strategy_factory(params)
+	report = ReplayEngine(portfolio, [_batches(chunk_size)], [strategy]).run()
+
+	row = dict(params)
+	row["events"] = report["events"]
+	row["elapsed"] = report["elapsed"]
+	result = getattr(strategy, "result", None)
+	if result is not None:
+		row.update(result(portfolio))
+	return row
+
+
+class SweepRunner(object):
+
+	def __init__(self, ticks: PriceUpdateBatch, pair_ids: Optional[Sequence[Union[str, tuple]]] = None,
+	             processes: Optional[int] = None, chunk_size: int = 65536, history_len: int = UPDATES_KEPT):
+		"""
+		Replays the same ticks with many parameter sets in parallel. The tick arrays are copied once into
+		shared memory, and every worker process maps them without copying and replays them through its own
+		Portfolio and ReplayEngine. Call close (or use it as a context manager) to free the shared memory.
+
+		:param ticks: The ticks, time ordered, for instance from tickfile.TickFileReader.batch()
+		:param pair_ids: Pairs added to every portfolio, the pair table of ticks if None. Must contain every
+			pair found in ticks.
+		:param processes: Number of worker processes, the number of CPUs if None
+		:param chunk_size: Ticks per batch fed to the replay engines
+		:param history_len: Number of past rates kept by every pair
+		"""
+		self._pair_ids = [_pair_key(pair_id) for pair_id in ticks.pair_ids]
+		self._portfolio_pairs = self._pair_ids if pair_ids is None else [_pair_key(x) for x in pair_ids]
+		self.processes = processes
+		self.chunk_size = chunk_size
+		self.history_len = history_len
+
+		self._shms = []
+		self._blocks = []
+		try:
+			for key, array in (("handles", ticks.handles), ("rates", ticks.rates), ("timestamps", ticks.timestamps)):
+				# Zero sized blocks are not allowed
+				shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+				self._shms.append(shm)
+				np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+				self._blocks.append((key, shm.name, array.dtype.str, len(array)))
+		except Exception:
+			self.close()
+			raise
+
+	def __len__(self) -> int:
+		return self._blocks[0][3] if self._blocks else 0
+
+	def run(self, strategy_factory: Callable[[dict], Strategy], param_sets: Sequence[dict]) -> List[dict]:
+		"""
+		Replays the ticks once per parameter set. strategy_factory gets a parameter set and returns the
+		strategy to replay it with. It must be picklable, so a class or a module level function. If the
+		strategy has a result(portfolio) method its returned dict is added to the row.
+
+		:param strategy_factory: Builds a Strategy from a parameter set
+		:param param_sets: Dicts of parameters
+		:return: The results table, one row per parameter set in the same order: the parameters, the number
+			of events replayed, the elapsed time and the strategy result
+		"""
+		if not self._shms:
+			raise ValueError("Sweep runner is closed")
+		param_sets = list(param_sets)
+		with ProcessPoolExecutor(max_workers=self.processes, initializer=_attach,
+		                         initargs=(self._pair_ids, self._portfolio_pairs, self._blocks, self.history_len)) as pool:
+			rows = pool.map(_run_one, [strategy_factory] * len(param_sets), param_sets,
+			                [self.chunk_size] * len(param_sets))
+			return list(rows)
+
+	def close(self):
+		for shm in self._shms:
+			shm.close()
+			shm.unlink()
+		self._shms = []
+
+	def __enter__(self) -> "SweepRunner":
+		return self
+
+	def __exit__(self, *args):
+		self.close()
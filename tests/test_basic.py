@@ -54,6 +54,68 @@ class UpdateTests(unittest.TestCase):
 			d = copy.copy(self.upd1)
 			del d[key]
 			self.assertRaises(KeyError, PriceUpdate, d)
+	
+	def test_from_fields(self):
+		u = PriceUpdate.from_fields("KRAKEN", "USD", "BTC", 0.257, self.now_upd)
+		self.assertEqual(u.id, ("KRAKEN", "USD", "BTC"))
+		self.assertEqual(u.best_rate, 0.257)
+		self.assertEqual(u.systime, self.now_upd)
+		self.assertIsNone(u.orderbook)
+		
+	def test_slots(self):
+		u = PriceUpdate(self.upd1)
+		self.assertFalse(hasattr(u, "__dict__"))
+		
+		
+class PriceUpdateBatchTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.now_upd = datetime(2021, 3, 1, 12, 30, 15, 123456)
+		self.upd1 = {
+			"exchange": "KRAKEN",
+			"coin": "USD",
+			"quote": "BTC",
+			"rate": 0.257,
+			"datetime": self.now_upd
+		}
+		self.upd2 = {
+			"exchange": "KRAKEN",
+			"coin": "USD",
+			"quote": "ETH",
+			"rate": 0.5,
+			"datetime": self.now_upd
+		}
+		
+	def test_timestamp_roundtrip(self):
+		self.assertEqual(us_to_datetime(datetime_to_us(self.now_upd)), self.now_upd)
+		
+	def test_from_updates(self):
+		b = PriceUpdateBatch.from_updates([PriceUpdate(self.upd1), PriceUpdate(self.upd2), PriceUpdate(self.upd1)])
+		self.assertEqual(len(b), 3)
+		self.assertEqual(b.pair_ids, [("KRAKEN", "USD", "BTC"), ("KRAKEN", "USD", "ETH")])
+		self.assertEqual(b.handles.tolist(), [0, 1, 0])
+		self.assertEqual(b.rates.tolist(), [0.257, 0.5, 0.257])
+		self.assertEqual(b.timestamps.dtype, np.int64)
+		
+	def test_groups_keep_order(self):
+		b = PriceUpdateBatch(["KRAKEN_USD_BTC", "KRAKEN_USD_ETH"], [1, 0, 1, 0], [1., 2., 3., 4.], [10, 20, 30, 40])
+		groups = [(pair_id, r.tolist(), t.tolist()) for pair_id, r, t in b.groups()]
+		self.assertEqual(groups, [
+			(("KRAKEN", "USD", "BTC"), [2., 4.], [20, 40]),
+			(("KRAKEN", "USD", "ETH"), [1., 3.], [10, 30]),
+		])
+		
+	def test_iter_updates(self):
+		b = PriceUpdateBatch.from_updates([PriceUpdate(self.upd1), PriceUpdate(self.upd2)])
+		updates = list(b.iter_updates())
+		self.assertEqual(updates[1].id, ("KRAKEN", "USD", "ETH"))
+		self.assertEqual(updates[1].best_rate, 0.5)
+		self.assertEqual(updates[1].systime, self.now_upd)
+		
+	def test_raises_on_bad_columns(self):
+		self.assertRaises(ValueError, PriceUpdateBatch, ["KRAKEN_USD_BTC"], [0, 0], [1.], [1])
+		self.assertRaises(IndexError, PriceUpdateBatch, ["KRAKEN_USD_BTC"], [1], [1.], [1])
+		self.assertRaises(ValueError, PriceUpdateBatch, ["KRAKEN_USD"], [0], [1.], [1])
 		
 		
 class AssetUpdateTests(unittest.TestCase):
@@ -91,6 +153,14 @@ class AssetUpdateTests(unittest.TestCase):
 			d = copy.copy(self.upd1)
 			del d[key]
 			self.assertRaises(KeyError, AssetUpdate, d)
+	
+	def test_from_fields(self):
+		u = AssetUpdate.from_fields("KRAKEN", ["USD", "ETH"], [37., 50.], self.now_upd)
+		self.assertEqual(u.ex, "KRAKEN")
+		self.assertEqual(u.assetlist, ["USD", "ETH"])
+		self.assertEqual(u.holdinglist, [37., 50.])
+		self.assertEqual(u.systime, self.now_upd)
+		self.assertFalse(hasattr(u, "__dict__"))
 
 
 class AssetTest(unittest.TestCase):
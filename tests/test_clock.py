@@ -0,0 +1,103 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from clock import *
+from datetime import datetime, timedelta
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class CountingClock(object):
+	
+	def __init__(self, now):
+		self.reads = 0
+		self._now = now
+		
+	def now(self):
+		self.reads += 1
+		return self._now
+
+
+class ClockTests(unittest.TestCase):
+	
+	def test_wall_clock(self):
+		before = datetime.now()
+		now = WallClock().now()
+		self.assertTrue(before <= now <= datetime.now())
+		
+	def test_simulated_clock(self):
+		t0 = datetime(2021, 3, 1)
+		clock = SimulatedClock()
+		self.assertRaises(ValueError, clock.now)
+		clock.advance_to(t0)
+		self.assertEqual(clock.now(), t0)
+		clock.advance_to(t0 - timedelta(seconds=1))
+		self.assertEqual(clock.now(), t0)
+		clock.set(t0 - timedelta(seconds=1))
+		self.assertEqual(clock.now(), t0 - timedelta(seconds=1))
+		
+	def test_cached_clock(self):
+		inner = CountingClock(datetime(2021, 3, 1))
+		clock = CachedClock(inner)
+		clock.now()
+		clock.now()
+		self.assertEqual(inner.reads, 1)
+		clock.invalidate()
+		clock.now()
+		self.assertEqual(inner.reads, 2)
+
+
+class PortfolioClockTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.t0 = datetime(2021, 3, 1)
+		self.clock = SimulatedClock(self.t0)
+		self.p = Portfolio(clock=self.clock)
+		self.p.add_pair("KRAKEN_USD_BTC")
+		self.p.add_pair("KRAKEN_USD_ETH")
+		self.p.push_update(PriceUpdate.from_fields("KRAKEN", "USD", "BTC", 1., self.t0))
+		
+	def test_pairs_use_portfolio_clock(self):
+		pair = self.p.get_pair_by_id("KRAKEN_USD_BTC")
+		self.assertIs(pair.clock, self.clock)
+		self.assertEqual(pair.time_now, self.t0)
+		self.clock.advance_to(self.t0 + timedelta(seconds=10))
+		self.assertEqual(pair.time_since_update, timedelta(seconds=10))
+		
+	def test_staleness_queries(self):
+		self.clock.advance_to(self.t0 + timedelta(seconds=2))
+		self.assertTrue(self.p.data_flag())
+		self.assertEqual(self.p.last_data_td(), timedelta(seconds=2))
+		self.assertEqual([x.id for x in self.p.pairs_with_data(timedelta(seconds=5))], ["KRAKEN_USD_BTC"])
+		report = self.p.report(timedelta(seconds=5))
+		self.assertEqual(report["with"], ["KRAKEN_USD_BTC"])
+		self.assertEqual(report["without"], ["KRAKEN_USD_ETH"])
+		
+		self.clock.advance_to(self.t0 + timedelta(seconds=10))
+		self.assertFalse(self.p.data_flag())
+		self.assertEqual(self.p.pairs_with_data(timedelta(seconds=5)), [])
+		
+	def test_queries_read_clock_once(self):
+		clock = CountingClock(self.t0)
+		self.p.clock = clock
+		self.p.report(timedelta(seconds=5))
+		self.assertEqual(clock.reads, 1)
+		self.p.last_data_td()
+		self.assertEqual(clock.reads, 2)
+		
+	def test_swapping_clock_updates_pairs(self):
+		clock = SimulatedClock(self.t0)
+		self.p.clock = clock
+		self.assertTrue(all(x.clock is clock for x in self.p.get_pair_list()))
+		pair = self.p.add_pair("KRAKEN_EUR_BTC")
+		self.assertIs(pair.clock, clock)
+
+
+if __name__ == '__main__':
+	unittest.main()
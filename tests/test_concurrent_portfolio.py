@@ -0,0 +1,135 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from concurrent_portfolio import ConcurrentPortfolio
+from datetime import datetime, timedelta
+import threading
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+EXCHANGES = ("KRAKEN", "COINBASE", "BITSTAMP", "GEMINI")
+
+
+class ConcurrentPortfolioTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = ConcurrentPortfolio(history_len=1000)
+		for ex in EXCHANGES:
+			for pair in ("BTC_USD", "ETH_BTC", "USD_ETH", "ETH_USD"):
+				self.p.add_pair("{}_{}".format(ex, pair))
+		self.t0 = datetime(2021, 3, 1)
+		
+	def run_threads(self, targets):
+		errors = []
+		
+		def wrap(target):
+			try:
+				target()
+			except Exception as e:
+				errors.append(e)
+		
+		threads = [threading.Thread(target=wrap, args=(target,)) for target in targets]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join(timeout=30)
+			self.assertFalse(thread.is_alive(), "Thread deadlocked")
+		self.assertEqual(errors, [])
+		
+	def feed(self, ex, n=500):
+		def target():
+			for x in range(n):
+				systime = self.t0 + timedelta(milliseconds=x)
+				self.p.push_update(PriceUpdate.from_fields(ex, "BTC", "USD", 40000. + x, systime))
+				self.p.push_updates([
+					PriceUpdate.from_fields(ex, "ETH", "BTC", 0.05, systime),
+					PriceUpdate.from_fields(ex, "ETH", "USD", 2000. + x, systime),
+				])
+				self.p.adjust_holdings_from_assetupd(AssetUpdate.from_fields(ex, ["BTC", "USD"], [1., float(x)], systime))
+		return target
+		
+	def test_parallel_feeds(self):
+		self.p.track_loops(3)
+		snapshots = []
+		
+		def reader():
+			for _ in range(50):
+				snapshots.append(self.p.snapshot(timedelta(seconds=1)))
+				self.p.evaluate_loops(3)
+				
+		def adder():
+			for ex in ("BITFINEX", "POLONIEX"):
+				self.p.add_pair("{}_BTC_USD".format(ex))
+		
+		self.run_threads([self.feed(ex) for ex in EXCHANGES] + [reader, adder])
+		
+		for ex in EXCHANGES:
+			btc = self.p.get_pair_by_id("{}_BTC_USD".format(ex))
+			self.assertEqual(btc.rate, 40499.)
+			self.assertEqual(len(btc.history), 500)
+			self.assertEqual(self.p.get_holdings()[ex]["USD"], 499.)
+		self.assertEqual(self.p.get_full_usd_value(), len(EXCHANGES) * (40499. + 499.))
+		
+		# Every snapshot is internally consistent
+		for snap in snapshots:
+			total = sum(x[1] or 0 for data in snap["usd_value"].values() for x in data.values())
+			self.assertEqual(snap["full_usd_value"], total)
+			for ex in EXCHANGES:
+				rate = snap["rates"]["{}_BTC_USD".format(ex)]
+				held = snap["holdings"][ex]["BTC"]
+				self.assertEqual(snap["usd_value"][ex]["BTC"], [held, held * rate if rate is not None else None])
+		
+	def test_reads_while_adding_pairs(self):
+		done = threading.Event()
+
+		def reader():
+			while not done.is_set():
+				self.p.get_holdings()
+				self.p.get_assets()
+				self.p.get_pairs_full()
+				for pair in self.p.get_pair_list():
+					self.assertIs(self.p.get_pair_by_id(pair.id), pair)
+				self.p.get_routing_table().route("KRAKEN", "ETH")
+
+		def adder():
+			try:
+				for x in range(300):
+					self.p.add_pair("KRAKEN_C{}_USD".format(x))
+					self.p.add_pair("COINBASE_C{}_BTC".format(x))
+			finally:
+				done.set()
+
+		self.run_threads([reader, reader, adder])
+		self.assertEqual(len(self.p.get_pair_list()), len(EXCHANGES) * 4 + 600)
+		self.assertEqual(len(self.p.get_assets()["KRAKEN"]), 3 + 300)
+
+	def test_unknown_exchange(self):
+		update = PriceUpdate.from_fields("BINANCE", "BTC", "USD", 1., self.t0)
+		self.assertRaises(PairlNotImplemented, self.p.push_update, update)
+		self.assertRaises(PairlNotImplemented, self.p.push_updates, [update])
+		
+		# Entries of the pair table that no tick uses don't matter, as in Portfolio
+		batch = PriceUpdateBatch(["BINANCE_BTC_USD", "KRAKEN_BTC_USD"], [1], [2.], [datetime_to_us(self.t0)])
+		self.assertEqual(self.p.push_updates(batch), {self.p.get_pair_by_id("KRAKEN_BTC_USD")})
+		batch = PriceUpdateBatch(["BINANCE_BTC_USD", "KRAKEN_BTC_USD"], [1, 0], [2., 3.], [datetime_to_us(self.t0)] * 2)
+		self.assertRaises(PairlNotImplemented, self.p.push_updates, batch)
+		
+	def test_behaves_like_portfolio(self):
+		self.p.push_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 1., self.t0))
+		self.p.push_by_handle(self.p.get_handle("KRAKEN_ETH_BTC"), 2., self.t0)
+		batch = PriceUpdateBatch(["COINBASE_BTC_USD"], [0], [3.], [datetime_to_us(self.t0)])
+		self.assertEqual(self.p.push_updates(batch), {self.p.get_pair_by_id("COINBASE_BTC_USD")})
+		self.assertEqual(self.p.get_virtual_rate("KRAKEN", "ETH", "USD"), 2.)
+		self.assertIsNone(self.p.adjust_holdings_from_assetupd(None))
+		self.assertEqual(self.p.snapshot()["report"], None)
+
+
+if __name__ == '__main__':
+	unittest.main()
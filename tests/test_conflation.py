@@ -0,0 +1,70 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from conflation import Conflator
+from datetime import datetime, timedelta
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class ConflatorTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = Portfolio(keep_updates=True)
+		self.btc = self.p.add_pair("KRAKEN_USD_BTC")
+		self.eth = self.p.add_pair("KRAKEN_USD_ETH")
+		self.t0 = datetime(2021, 3, 1)
+		
+	def update(self, pair, rate, ms):
+		return PriceUpdate.from_fields("KRAKEN", "USD", pair, rate, self.t0 + timedelta(milliseconds=ms))
+	
+	def rates(self, pair):
+		return [x.best_rate for x in pair.updates]
+		
+	def test_manual_flush(self):
+		conf = Conflator(self.p)
+		self.assertIsNone(conf.push(self.update("BTC", 1., 0)))
+		conf.push(self.update("ETH", 10., 0))
+		conf.push(self.update("BTC", 2., 1))
+		conf.push(self.update("BTC", 3., 2))
+		self.assertEqual(conf.pending, 2)
+		self.assertIsNone(self.btc.rate)
+		
+		self.assertEqual(conf.flush(), {self.btc, self.eth})
+		self.assertEqual(self.rates(self.btc), [3.])
+		self.assertEqual(self.rates(self.eth), [10.])
+		self.assertEqual(conf.dropped, {"KRAKEN_USD_BTC": 2})
+		self.assertEqual(conf.total_dropped, 2)
+		self.assertEqual(conf.total_pushed, 2)
+		self.assertEqual(conf.flush(), set())
+		
+	def test_time_window(self):
+		conf = Conflator(self.p, window=timedelta(milliseconds=10))
+		touched = conf.push_many([self.update("BTC", float(x), x) for x in range(25)])
+		self.assertEqual(touched, {self.btc})
+		# Windows start at 0, 10 and 20 ms, the last one is still open
+		self.assertEqual(self.rates(self.btc), [9., 19.])
+		self.assertEqual(conf.pending, 1)
+		conf.flush()
+		self.assertEqual(self.rates(self.btc), [9., 19., 24.])
+		self.assertEqual(conf.dropped, {"KRAKEN_USD_BTC": 22})
+		
+	def test_max_batch(self):
+		conf = Conflator(self.p, max_batch=4)
+		for x in range(8):
+			conf.push(self.update("BTC" if x % 2 else "ETH", float(x), 0))
+		self.assertEqual(self.rates(self.btc), [3., 7.])
+		self.assertEqual(self.rates(self.eth), [2., 6.])
+		self.assertEqual(conf.pending, 0)
+		self.assertEqual(conf.total_dropped, 4)
+		self.assertRaises(ValueError, Conflator, self.p, max_batch=0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,110 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from converters import HistoricalConverter
+from tickfile import TickFileReader
+from datetime import datetime
+import json
+import shutil
+import tempfile
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class HistoricalConverterTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.csv = os.path.join(self.dir.name, "kraken.csv")
+		with open(self.csv, "w") as f:
+			f.write("time;base;counter;price\n")
+			f.write("2021-03-01T00:00:00;USD;BTC;0.1\n")
+			f.write("2021-03-01T00:00:01;USD;ETH;0.2\n")
+			f.write("\n")
+			f.write("2021-03-01T00:00:02;USD;BTC;0.3\n")
+		
+		self.jsonl = os.path.join(self.dir.name, "coinbase.jsonl")
+		with open(self.jsonl, "w") as f:
+			for i, rate in enumerate([1., 2., 3.]):
+				f.write(json.dumps({"exchange": "COINBASE", "coin": "USD", "quote": "BTC", "rate": rate,
+				                    "datetime": 1614556800 + i}) + "\n")
+		
+		self.csv_converter = HistoricalConverter(
+			columns={"coin": "base", "quote": "counter", "rate": "price", "datetime": "time"},
+			exchange="KRAKEN", delimiter=";", chunk_size=2
+		)
+		
+	def tearDown(self):
+		self.dir.cleanup()
+		
+	def test_csv_chunks(self):
+		batches = list(self.csv_converter.iter_batches(self.csv))
+		
+		self.assertEqual([len(b) for b in batches], [2, 1])
+		self.assertEqual(batches[1].pair_ids, [("KRAKEN", "USD", "BTC"), ("KRAKEN", "USD", "ETH")])
+		self.assertEqual(batches[1].handles.tolist(), [0])
+		self.assertEqual(batches[0].rates.tolist(), [0.1, 0.2])
+		self.assertEqual(batches[1].timestamps[0], datetime_to_us(datetime(2021, 3, 1, 0, 0, 2)))
+		
+	def test_jsonl_epoch_times(self):
+		conv = HistoricalConverter(fmt="jsonl")
+		batches = list(conv.iter_batches(self.jsonl))
+		
+		self.assertEqual(len(batches), 1)
+		self.assertEqual(batches[0].rates.tolist(), [1., 2., 3.])
+		self.assertEqual(us_to_datetime(batches[0].timestamps[0]), datetime(2021, 3, 1))
+		
+	def test_datetime_format(self):
+		path = os.path.join(self.dir.name, "custom.csv")
+		with open(path, "w") as f:
+			f.write("exchange,coin,quote,rate,datetime\n")
+			f.write("KRAKEN,USD,BTC,1.5,01/03/2021 10:30\n")
+		conv = HistoricalConverter(datetime_format="%d/%m/%Y %H:%M")
+		batch = next(conv.iter_batches(path))
+		self.assertEqual(us_to_datetime(batch.timestamps[0]), datetime(2021, 3, 1, 10, 30))
+		
+	def test_batches_feed_portfolio(self):
+		p = Portfolio()
+		p.add_pair("KRAKEN_USD_BTC")
+		p.add_pair("KRAKEN_USD_ETH")
+		for batch in self.csv_converter.iter_batches(self.csv):
+			p.push_updates(batch)
+		self.assertEqual(p.get_pair_by_id("KRAKEN_USD_BTC").rate, 0.3)
+		self.assertEqual(p.get_pair_by_id("KRAKEN_USD_ETH").rate, 0.2)
+		
+	def test_raises_on_missing_column(self):
+		conv = HistoricalConverter(exchange="KRAKEN", delimiter=";")
+		self.assertRaises(KeyError, list, conv.iter_batches(self.csv))
+		self.assertRaises(ValueError, HistoricalConverter, fmt="xml")
+		
+	def test_convert_files(self):
+		out = self.csv_converter.convert_files([self.csv], self.dir.name, processes=1)
+		out = out + HistoricalConverter(fmt="jsonl").convert_files([self.jsonl], self.dir.name, processes=2)
+		
+		self.assertEqual(out, [self.csv + ".ticks", self.jsonl + ".ticks"])
+		with TickFileReader(out[0]) as r:
+			self.assertEqual(r.pair_ids, ["KRAKEN_USD_BTC", "KRAKEN_USD_ETH"])
+			self.assertEqual(r.rates.tolist(), [0.1, 0.2, 0.3])
+		
+		self.csv_converter.convert_files([self.csv], self.dir.name, processes=1)
+		with TickFileReader(out[0]) as r:
+			self.assertEqual(len(r), 3)
+		with TickFileReader(out[1]) as r:
+			self.assertEqual(r.rates.tolist(), [1., 2., 3.])
+
+	def test_convert_files_same_name(self):
+		other = os.path.join(self.dir.name, "other")
+		os.mkdir(other)
+		copy = os.path.join(other, os.path.basename(self.csv))
+		shutil.copy(self.csv, copy)
+		out_dir = os.path.join(self.dir.name, "out")
+		os.mkdir(out_dir)
+		self.assertRaises(ValueError, self.csv_converter.convert_files, [self.csv, copy], out_dir, 1)
+		self.assertRaises(ValueError, self.csv_converter.convert_files, [self.csv, self.csv], out_dir, 1)
+		self.assertEqual(os.listdir(out_dir), [])
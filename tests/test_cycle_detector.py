@@ -0,0 +1,90 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from cycle_detector import NegativeCycleDetector
+from datetime import datetime
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class NegativeCycleDetectorTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = Portfolio()
+		for pair in ["EMPTY_USD_BTC", "EMPTY_BTC_ETH", "EMPTY_ETH_DOGE", "EMPTY_DOGE_USD", "EMPTY_ETH_USD"]:
+			self.p.add_pair(pair)
+		self.p.add_pair_reverses()
+		
+		self.rates = {"USD": 1., "BTC": 0.5, "ETH": 2., "DOGE": 10.}
+		for pair in self.p.get_pair_list():
+			self.push(pair, self.rates[pair.quote.id] / self.rates[pair.coin.id])
+	
+	def push(self, pair, rate):
+		ex, co, quo = pair.sliced_id
+		self.p.push_update(PriceUpdate.from_fields(ex, co, quo, rate, datetime.now()))
+		
+	def assert_is_loop(self, cycle):
+		self.assertTrue(self.p.check_loop_consistency(cycle))
+		product = 1.
+		for pair in cycle:
+			product *= pair.rate * (1 - pair.ex.fee_rate)
+		self.assertGreater(product, 1.)
+		
+	def test_no_cycle_on_consistent_rates(self):
+		self.assertEqual(self.p.find_negative_cycles(), [])
+		
+	def test_finds_long_cycle(self):
+		self.push(self.p.get_pair_by_id("EMPTY_DOGE_USD"), 0.11)
+		
+		cycles = self.p.find_negative_cycles()
+		self.assertEqual(len(cycles), 1)
+		self.assertEqual(len(cycles[0]), 4)
+		self.assert_is_loop(cycles[0])
+		
+	def test_incremental_search(self):
+		self.assertEqual(self.p.find_negative_cycles("EMPTY"), [])
+		
+		self.push(self.p.get_pair_by_id("EMPTY_BTC_ETH"), 4.1)
+		cycles = self.p.find_negative_cycles("EMPTY")
+		self.assertEqual(len(cycles), 1)
+		self.assert_is_loop(cycles[0])
+		
+		self.push(self.p.get_pair_by_id("EMPTY_BTC_ETH"), 4.)
+		self.assertEqual(self.p.find_negative_cycles("EMPTY"), [])
+		
+	def test_multiple_cycles(self):
+		self.push(self.p.get_pair_by_id("EMPTY_BTC_ETH"), 4.1)
+		
+		cycles = self.p.find_negative_cycles(max_cycles=10)
+		self.assertGreater(len(cycles), 1)
+		for cycle in cycles:
+			self.assert_is_loop(cycle)
+			
+	def test_fees_are_applied(self):
+		p = Portfolio()
+		a = p.add_pair("TEST_USD_BTC")
+		b = p.add_pair("TEST_BTC_USD")
+		p.push_update(PriceUpdate.from_fields("TEST", "USD", "BTC", 0.5, datetime.now()))
+		p.push_update(PriceUpdate.from_fields("TEST", "BTC", "USD", 2.1, datetime.now()))
+		
+		self.assertEqual(NegativeCycleDetector(p).find_cycles(), [])
+		
+		p.push_update(PriceUpdate.from_fields("TEST", "BTC", "USD", 2.5, datetime.now()))
+		self.assertEqual(NegativeCycleDetector(p).find_cycles(), [(a, b)])
+		
+	def test_missing_rates_and_new_pairs(self):
+		self.p.add_pair("EMPTY_USD_LITE")
+		self.p.add_pair("EMPTY_LITE_USD")
+		self.assertEqual(self.p.find_negative_cycles(), [])
+		
+		self.push(self.p.get_pair_by_id("EMPTY_USD_LITE"), 2.)
+		self.push(self.p.get_pair_by_id("EMPTY_LITE_USD"), 0.6)
+		cycles = self.p.find_negative_cycles()
+		self.assertEqual(len(cycles), 1)
+		self.assertEqual({x.id for x in cycles[0]}, {"EMPTY_USD_LITE", "EMPTY_LITE_USD"})
@@ -0,0 +1,84 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from fee_models import *
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class FeeModelTests(unittest.TestCase):
+
+	def test_rates_unchanged(self):
+		expected = {"KRAKEN": 0.0026, "COINBASE": 0.0035, "BINANCE": 0.001, "BITMEX": 0.00075, "BITTREX": 0.002,
+		            "OANDA": 0.00012, "GEMINI": 0.0035, "BITSTAMP": 0.0025, "BITFINEX": 0.002, "POLONIEX": 0.00125,
+		            "EMPTY": 0., "TEST": 0.05}
+		for ex_id, rate in expected.items():
+			self.assertAlmostEqual(Exchange(ex_id).fee_rate, rate)
+
+	def test_shared_instances(self):
+		self.assertIs(Exchange("KRAKEN").model, Exchange("KRAKEN").model)
+		self.assertEqual(Exchange("KRAKEN").fee_model_name, "FeesKraken")
+
+	def test_tiers(self):
+		model = get_fee_model("KRAKEN")
+		self.assertEqual(model.fee(0), 0.0026)
+		self.assertEqual(model.fee(49999.), 0.0026)
+		self.assertEqual(model.fee(50000), 0.0024)
+		self.assertEqual(model.fee(50000, maker=True), 0.0014)
+		self.assertEqual(model.fee(1e9), 0.0010)
+		self.assertEqual(model.fee(1e9, maker=True), 0.)
+		self.assertEqual(model.tier(120000), 2)
+		self.assertEqual(get_fee_model("BITMEX").fee(maker=True), -0.00025)
+
+	def test_invalid_volume(self):
+		model = get_fee_model("KRAKEN")
+		self.assertRaises(ValueError, model.fee, -1)
+		self.assertRaises(ValueError, model.fee, float("nan"), True)
+		self.assertRaises(ValueError, model.tier, -0.5)
+		ex = Exchange("KRAKEN")
+		ex.volume = -1
+		with self.assertRaises(ValueError):
+			ex.fee_rate
+
+	def test_exchange_volume(self):
+		ex = Exchange("COINBASE")
+		self.assertEqual(ex.fee(), 0.0035)
+		ex.volume = 0
+		self.assertEqual(ex.fee_rate, 0.005)
+		ex.volume = 200000
+		self.assertEqual(ex.fee_rate, 0.002)
+		self.assertEqual(ex.fee(maker=True), 0.001)
+		# The shared model is not affected
+		self.assertEqual(Exchange("COINBASE").fee_rate, 0.0035)
+
+	def test_invalid_schedules(self):
+		with self.assertRaises(ValueError):
+			TieredFees((10, 100), (0.1, 0.1), (0.1, 0.1))
+		with self.assertRaises(ValueError):
+			TieredFees((0, 100, 50), (0.1, 0.1, 0.1), (0.1, 0.1, 0.1))
+		with self.assertRaises(ValueError):
+			TieredFees((0, 100), (0.1,), (0.1, 0.1))
+
+	def test_register(self):
+		with self.assertRaises(FeeModelNotFound):
+			Exchange("NEWEX")
+		model = TieredFees((0, 1000), (0.002, 0.001), (0.003, 0.002))
+		register_fee_model("NEWEX", model)
+		try:
+			ex = Exchange("NEWEX")
+			self.assertIs(ex.model, model)
+			self.assertEqual(ex.fee_rate, 0.003)
+			ex.volume = 5000
+			self.assertEqual(ex.fee(maker=True), 0.001)
+		finally:
+			del FEE_MODELS["NEWEX"]
+
+
+if __name__ == '__main__':
+	unittest.main()
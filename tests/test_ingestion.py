@@ -0,0 +1,120 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from ingestion import AsyncIngestor
+from datetime import datetime, timedelta
+import asyncio
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class AsyncIngestorTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = Portfolio(keep_updates=True)
+		self.p.add_pair("KRAKEN_USD_BTC")
+		self.p.add_pair("KRAKEN_USD_ETH")
+		self.p.add_pair("COINBASE_USD_BTC")
+		self.t0 = datetime(2021, 3, 1)
+		
+	def update(self, pair, rate):
+		return PriceUpdate.from_fields(*pair.split("_"), rate, self.t0 + timedelta(seconds=rate))
+	
+	def rates(self, pair):
+		return [x.best_rate for x in self.p.get_pair_by_id(pair).updates]
+		
+	def test_policy_is_validated(self):
+		self.assertRaises(ValueError, AsyncIngestor, self.p, policy="potato")
+		self.assertRaises(ValueError, AsyncIngestor, self.p, maxsize=0)
+		
+	def test_block(self):
+		async def main():
+			async with AsyncIngestor(self.p, maxsize=2, batch_size=2) as ingestor:
+				for x in range(10):
+					await ingestor.put(self.update("KRAKEN_USD_BTC", float(x)))
+					await ingestor.put(self.update("COINBASE_USD_BTC", float(x)))
+			return ingestor.metrics()
+		
+		metrics = asyncio.run(main())
+		self.assertEqual(self.rates("KRAKEN_USD_BTC"), [float(x) for x in range(10)])
+		self.assertEqual(self.rates("COINBASE_USD_BTC"), [float(x) for x in range(10)])
+		self.assertEqual(metrics["processed"], 20)
+		self.assertEqual(metrics["depth"], {"KRAKEN": 0, "COINBASE": 0})
+		self.assertLessEqual(metrics["max_depth"]["KRAKEN"], 2)
+		self.assertEqual(metrics["dropped"], {"KRAKEN": 0, "COINBASE": 0})
+		
+	def test_block_put_nowait_raises_when_full(self):
+		ingestor = AsyncIngestor(self.p, maxsize=1)
+		ingestor.put_nowait(self.update("KRAKEN_USD_BTC", 1.))
+		self.assertRaises(asyncio.QueueFull, ingestor.put_nowait, self.update("KRAKEN_USD_BTC", 2.))
+		
+	def test_drop_oldest(self):
+		async def main():
+			ingestor = AsyncIngestor(self.p, maxsize=3, policy="drop_oldest")
+			for x in range(10):
+				ingestor.put_nowait(self.update("KRAKEN_USD_BTC", float(x)))
+			self.assertEqual(ingestor.metrics()["depth"], {"KRAKEN": 3})
+			ingestor.start()
+			await ingestor.stop()
+			return ingestor.metrics()
+		
+		metrics = asyncio.run(main())
+		self.assertEqual(self.rates("KRAKEN_USD_BTC"), [7., 8., 9.])
+		self.assertEqual(metrics["dropped"], {"KRAKEN": 7})
+		self.assertEqual(metrics["processed"], 3)
+		
+	def test_conflate(self):
+		async def main():
+			ingestor = AsyncIngestor(self.p, maxsize=2, policy="conflate")
+			for x in range(10):
+				ingestor.put_nowait(self.update("KRAKEN_USD_BTC", float(x)))
+				ingestor.put_nowait(self.update("KRAKEN_USD_ETH", float(x)))
+			self.assertEqual(ingestor.metrics()["depth"], {"KRAKEN": 4})
+			ingestor.start()
+			await ingestor.stop()
+			return ingestor.metrics()
+		
+		metrics = asyncio.run(main())
+		# The first update of each pair fits in the queue, then only the last one per pair is kept
+		self.assertEqual(self.rates("KRAKEN_USD_BTC"), [0., 9.])
+		self.assertEqual(self.rates("KRAKEN_USD_ETH"), [0., 9.])
+		self.assertEqual(metrics["conflated"], {"KRAKEN": 16})
+		self.assertEqual(metrics["processed"], 4)
+		
+	def test_unknown_pairs_are_rejected(self):
+		async def main():
+			async with AsyncIngestor(self.p) as ingestor:
+				await ingestor.put(self.update("KRAKEN_USD_BTC", 1.))
+				await ingestor.put(self.update("KRAKEN_USD_XRP", 2.))
+			return ingestor.metrics()
+		
+		metrics = asyncio.run(main())
+		self.assertEqual(self.p.get_pair_by_id("KRAKEN_USD_BTC").rate, 1.)
+		self.assertEqual(metrics["rejected"], 1)
+		self.assertEqual(metrics["processed"], 2)
+
+	def test_built_outside_the_loop(self):
+		# Built before any loop runs, then driven by two separate asyncio.run calls
+		ingestor = AsyncIngestor(self.p, maxsize=4)
+		ingestor.put_nowait(self.update("KRAKEN_USD_BTC", 1.))
+
+		async def main(rate):
+			async with ingestor:
+				# Lets the consumer drain the queue and wait for more
+				await asyncio.sleep(0.01)
+				await ingestor.put(self.update("KRAKEN_USD_BTC", rate))
+
+		asyncio.run(main(2.))
+		asyncio.run(main(3.))
+		self.assertEqual(self.rates("KRAKEN_USD_BTC"), [1., 2., 3.])
+		self.assertEqual(ingestor.metrics()["processed"], 3)
+
+
+if __name__ == '__main__':
+	unittest.main()
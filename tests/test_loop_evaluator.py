@@ -0,0 +1,127 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from loop_evaluator import LoopEvaluator
+from datetime import datetime
+import math
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class LoopEvaluatorTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = Portfolio()
+		for pair in ["TEST_USD_BTC", "TEST_BTC_ETH", "TEST_ETH_USD", "EMPTY_EUR_GBP", "EMPTY_GBP_EUR"]:
+			self.p.add_pair(pair)
+		
+		now = datetime.now()
+		rates = {"TEST_USD_BTC": 0.5, "TEST_BTC_ETH": 4., "TEST_ETH_USD": 0.5, "EMPTY_EUR_GBP": 0.5, "EMPTY_GBP_EUR": 2.1}
+		for pair_id, rate in rates.items():
+			ex, co, quo = pair_id.split("_")
+			self.p.push_update(PriceUpdate.from_fields(ex, co, quo, rate, now))
+		
+	def test_values(self):
+		loops = self.p.get_possible_loops(3)
+		ev = LoopEvaluator(loops)
+		
+		expected = math.log(0.5 * 4. * 0.5) + 3 * math.log(1 - 0.05)
+		for value in ev.values():
+			self.assertAlmostEqual(value, expected)
+			
+	def test_mixed_depths_are_padded(self):
+		loops = self.p.get_possible_loops(2) + self.p.get_possible_loops(3)
+		ev = LoopEvaluator(loops)
+		values = ev.values()
+		
+		self.assertEqual(ev.matrix.shape, (len(loops), 3))
+		self.assertAlmostEqual(values[0], math.log(0.5 * 2.1))
+		self.assertAlmostEqual(values[-1], math.log(0.5 * 4. * 0.5 * 0.95 ** 3))
+		
+	def test_ranked_and_threshold(self):
+		ranked = self.p.evaluate_loops(2)
+		self.assertEqual(len(ranked), 2)
+		self.assertEqual(ranked[0][0][0].ex.id, "EMPTY")
+		
+		self.assertEqual(self.p.evaluate_loops(3, threshold=0.), [])
+		self.assertEqual(len(self.p.evaluate_loops(2, threshold=0.)), 2)
+		
+	def test_update_pair(self):
+		ev = self.p.get_loop_evaluator(2)
+		pair = self.p.get_pair_by_id("EMPTY_GBP_EUR")
+		self.p.push_update(PriceUpdate.from_fields("EMPTY", "GBP", "EUR", 1.9, datetime.now()))
+		
+		self.assertEqual(len(ev.update_pair(pair)), 2)
+		self.assertAlmostEqual(ev.values()[0], math.log(0.5 * 1.9))
+		self.assertEqual(len(ev.update_pair(pair)), 0)
+		self.assertEqual(len(ev.update_pair(self.p.get_pair_by_id("TEST_USD_BTC"))), 0)
+		
+	def test_missing_rate_never_profitable(self):
+		self.p.add_pair("TEST_USD_ETH")
+		self.p.add_pair("TEST_ETH_BTC")
+		self.p.add_pair("TEST_BTC_USD")
+		
+		ranked = self.p.evaluate_loops(3)
+		self.assertEqual(ranked[-1][1], -math.inf)
+		for loop, value in self.p.evaluate_loops(3, threshold=-1.):
+			for pair in loop:
+				self.assertIsNotNone(pair.rate)
+		
+	def test_loops_with_pair(self):
+		pair = self.p.get_pair_by_id("TEST_BTC_ETH")
+		loops = self.p.get_loops_with_pair(pair, 3)
+		
+		self.assertEqual(len(loops), 3)
+		for loop in loops:
+			self.assertIn(pair, loop)
+		self.assertEqual(self.p.get_loops_with_pair(pair, 2), [])
+		
+	def test_tracked_loops_changed_on_push(self):
+		self.p.track_loops(3)
+		self.p.track_loops(2)
+		
+		self.p.push_update(PriceUpdate.from_fields("TEST", "BTC", "ETH", 5., datetime.now()))
+		changed = self.p.changed_loops(3)
+		
+		self.assertEqual(len(changed), 3)
+		for loop, value in changed:
+			self.assertAlmostEqual(value, math.log(0.5 * 5. * 0.5 * 0.95 ** 3))
+		self.assertEqual(self.p.changed_loops(2), [])
+		
+		self.p.push_update(PriceUpdate.from_fields("TEST", "BTC", "ETH", 5., datetime.now()))
+		self.assertEqual(self.p.changed_loops(3), [])
+		
+		touched = self.p.push_updates([
+			PriceUpdate.from_fields("EMPTY", "EUR", "GBP", 0.6, datetime.now()),
+			PriceUpdate.from_fields("TEST", "USD", "BTC", 0.4, datetime.now()),
+		])
+		self.assertEqual(len(touched), 2)
+		self.assertEqual(len(self.p.changed_loops(2)), 2)
+		self.assertEqual(len(self.p.changed_loops(3)), 3)
+		
+	def test_tracked_loops_survive_new_pairs(self):
+		self.p.track_loops(3)
+		self.p.add_pair("TEST_USD_ETH")
+		self.assertEqual(self.p.changed_loops(3), [])
+		
+		self.p.push_update(PriceUpdate.from_fields("TEST", "USD", "ETH", 2., datetime.now()))
+		self.assertEqual(len(self.p.changed_loops(3)), 0)
+		
+		self.p.push_update(PriceUpdate.from_fields("TEST", "USD", "BTC", 0.7, datetime.now()))
+		self.assertEqual(len(self.p.changed_loops(3)), 3)
+		self.assertEqual(self.p.changed_loops(2), [])
+
+	def test_first_push_after_new_pair(self):
+		self.p.track_loops(3)
+		self.p.add_pair("TEST_XRP_LTC")
+		self.p.push_update(PriceUpdate.from_fields("TEST", "BTC", "ETH", 4.5, datetime.now()))
+		changed = self.p.changed_loops(3)
+		self.assertEqual(len(changed), 3)
+		for loop, value in changed:
+			self.assertAlmostEqual(value, math.log(0.5 * 4.5 * 0.5 * 0.95 ** 3))
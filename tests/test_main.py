@@ -5,6 +5,23 @@ vicmf88@gmail.com
 
 from tests.test_basic import *
 from tests.test_portfolio import *
+from tests.test_loop_evaluator import *
+from tests.test_cycle_detector import *
+from tests.test_price_history import *
+from tests.test_pair_stats import *
+from tests.test_replay import *
+from tests.test_tickfile import *
+from tests.test_converters import *
+from tests.test_clock import *
+from tests.test_staleness import *
+from tests.test_routing import *
+from tests.test_ingestion import *
+from tests.test_conflation import *
+from tests.test_concurrent_portfolio import *
+from tests.test_sweep import *
+from tests.test_orderbook import *
+from tests.test_slippage import *
+from tests.test_fee_models import *
 import unittest
 
 if __name__ == '__main__':
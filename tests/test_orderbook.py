@@ -0,0 +1,145 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from orderbook import OrderBook, merge_book_updates, conflate_updates
+from conflation import Conflator
+from datetime import datetime
+import random
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class OrderBookTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.book = OrderBook()
+		self.book.apply({
+			"type": "snapshot",
+			"bids": [[99., 1.], [100., 2.], [98., 3.]],
+			"asks": [[102., 1.5], [101., 0.5], [103., 0.]],
+		})
+		
+	def test_snapshot(self):
+		self.assertEqual(self.book.best_bid, 100.)
+		self.assertEqual(self.book.best_ask, 101.)
+		self.assertEqual(self.book.best_bid_size, 2.)
+		self.assertEqual(self.book.best_ask_size, 0.5)
+		self.assertEqual(self.book.spread, 1.)
+		self.assertEqual(self.book.mid, 100.5)
+		self.assertEqual(self.book.bid_depth, 3)
+		self.assertEqual(self.book.ask_depth, 2)
+		prices, sizes = self.book.bids()
+		self.assertEqual(prices.tolist(), [100., 99., 98.])
+		self.assertEqual(sizes.tolist(), [2., 1., 3.])
+		prices, sizes = self.book.asks(depth=1)
+		self.assertEqual(prices.tolist(), [101.])
+		self.assertEqual(sizes.tolist(), [0.5])
+		
+	def test_diffs(self):
+		prices, _ = self.book.bids()
+		self.book.apply({"type": "diff", "bids": [[100., 0.], [99.5, 4.], [98., 5.]], "asks": [[101., 0.], [100.5, 1.]]})
+		self.assertEqual(self.book.bids()[0].tolist(), [99.5, 99., 98.])
+		self.assertEqual(self.book.bids()[1].tolist(), [4., 1., 5.])
+		self.assertEqual(self.book.asks()[0].tolist(), [100.5, 102.])
+		# Arrays handed out before are copies
+		self.assertEqual(prices.tolist(), [100., 99., 98.])
+		
+		self.book.apply({"type": "diff", "asks": [[100.5, 0.], [102., 0.], [104., 0.]]})
+		self.assertIsNone(self.book.best_ask)
+		self.assertIsNone(self.book.spread)
+		self.assertEqual(self.book.asks()[0].tolist(), [])
+		self.book.clear()
+		self.assertIsNone(self.book.best_bid)
+		self.assertRaises(ValueError, self.book.apply, {"type": "potato"})
+		
+	def test_matches_rebuild(self):
+		rng = random.Random(5)
+		levels = {"bids": {}, "asks": {}}
+		book = OrderBook()
+		for _ in range(2000):
+			side = rng.choice(("bids", "asks"))
+			price = float(rng.randint(1, 50))
+			size = float(rng.choice((0, 0, 1, 2, 3)))
+			book.apply({"type": "diff", side: [[price, size]]})
+			if size:
+				levels[side][price] = size
+			else:
+				levels[side].pop(price, None)
+			
+		bids = sorted(levels["bids"].items(), reverse=True)
+		asks = sorted(levels["asks"].items())
+		self.assertEqual(list(zip(*[x.tolist() for x in book.bids()])), bids)
+		self.assertEqual(list(zip(*[x.tolist() for x in book.asks()])), asks)
+		
+	def test_merge_book_updates(self):
+		diff1 = {"type": "diff", "bids": [[100., 0.], [99.5, 4.]], "asks": [[101., 2.]]}
+		diff2 = {"type": "diff", "bids": [[99.5, 0.]], "asks": [[101.5, 1.]]}
+		self.assertIs(merge_book_updates(None, diff1), diff1)
+		self.assertIs(merge_book_updates(diff1, None), diff1)
+		merged = merge_book_updates(diff1, diff2)
+		
+		expected = OrderBook()
+		expected.apply({"bids": [[100., 2.]], "asks": [[101., 1.]]})
+		expected.apply(diff1)
+		expected.apply(diff2)
+		self.book.apply({"bids": [[100., 2.]], "asks": [[101., 1.]]})
+		self.book.apply(merged)
+		self.assertEqual(self.book.bids()[0].tolist(), expected.bids()[0].tolist())
+		self.assertEqual(self.book.asks()[1].tolist(), expected.asks()[1].tolist())
+		
+		snapshot = merge_book_updates({"type": "snapshot", "bids": [[100., 2.]]}, diff1)
+		self.assertEqual(snapshot, {"type": "snapshot", "bids": [[99.5, 4.]], "asks": [[101., 2.]]})
+		self.assertIs(merge_book_updates(diff1, snapshot), snapshot)
+
+
+class PairOrderBookTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.now = datetime(2021, 3, 1)
+		self.p = Portfolio()
+		self.pair = self.p.add_pair("KRAKEN_BTC_USD")
+		
+	def test_price_update_carries_book(self):
+		book = {"type": "snapshot", "bids": [[100., 1.]], "asks": [[101., 1.]]}
+		update = PriceUpdate({"exchange": "KRAKEN", "coin": "BTC", "quote": "USD", "rate": 100., "datetime": self.now,
+		                      "orderbook": book})
+		self.assertIs(update.orderbook, book)
+		self.assertIsNone(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100., self.now).orderbook)
+		
+		self.assertIsNone(self.pair.book)
+		self.assertIsNone(self.pair.best_bid)
+		self.p.push_update(update)
+		self.assertEqual(self.pair.best_bid, 100.)
+		self.assertEqual(self.pair.best_ask, 101.)
+		
+		diff = {"type": "diff", "bids": [[100.5, 2.]]}
+		self.p.push_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100.5, self.now, diff))
+		self.assertEqual(self.pair.best_bid, 100.5)
+		# Updates without a book leave it as it is
+		self.p.push_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100.7, self.now))
+		self.assertEqual(self.pair.best_bid, 100.5)
+		
+	def test_conflation_keeps_diffs(self):
+		snapshot = {"type": "snapshot", "bids": [[100., 1.]], "asks": [[101., 1.]]}
+		self.p.push_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100., self.now, snapshot))
+		
+		conf = Conflator(self.p)
+		conf.push(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100., self.now, {"type": "diff", "bids": [[100.5, 1.]]}))
+		conf.push(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100., self.now))
+		conf.push(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 100., self.now, {"type": "diff", "asks": [[101., 0.]]}))
+		conf.flush()
+		self.assertEqual(self.pair.best_bid, 100.5)
+		self.assertIsNone(self.pair.best_ask)
+		
+		plain = PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 1., self.now)
+		self.assertIs(conflate_updates(plain, plain), plain)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,84 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from pair_stats import PairStats
+from datetime import datetime, timedelta
+import math
+import statistics
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class PairStatsTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.rates = [1., 1.1, 0.9, 1.3, 1.2, 0.8, 1.05]
+		
+	def test_moments(self):
+		st = PairStats(window=3)
+		for i, rate in enumerate(self.rates):
+			st.update(rate, i * 1000000)
+		
+		returns = [math.log(b / a) for a, b in zip(self.rates, self.rates[1:])]
+		self.assertEqual(st.count, 7)
+		self.assertEqual(st.last, 1.05)
+		self.assertAlmostEqual(st.mean_return, statistics.mean(returns))
+		self.assertAlmostEqual(st.variance, statistics.variance(returns))
+		self.assertAlmostEqual(st.volatility, statistics.stdev(returns))
+		
+	def test_window(self):
+		st = PairStats(window=3)
+		self.assertIsNone(st.min)
+		self.assertIsNone(st.roc)
+		for i, rate in enumerate(self.rates):
+			st.update(rate, i)
+			window = self.rates[max(0, i - 2):i + 1]
+			self.assertEqual(st.min, min(window))
+			self.assertEqual(st.max, max(window))
+		self.assertAlmostEqual(st.roc, 1.05 / 1.2 - 1)
+		
+	def test_ema_halflife(self):
+		st = PairStats(halflives=(10., 1.))
+		st.update(1., 0)
+		self.assertEqual(st.ema[10.], 1.)
+		
+		st.update(3., 10 * 1000000)
+		self.assertAlmostEqual(st.ema[10.], 2.)
+		self.assertAlmostEqual(st.ema[1.], 3. - 2. * 0.5 ** 10)
+		
+		st.update(5., 10 * 1000000)
+		self.assertAlmostEqual(st.ema[10.], 2.)
+		
+	def test_variance_needs_two_returns(self):
+		st = PairStats()
+		st.update(1., 0)
+		st.update(2., 1)
+		self.assertIsNone(st.variance)
+		self.assertIsNone(st.volatility)
+		
+	def test_portfolio_enables_stats(self):
+		p = Portfolio()
+		s1 = p.add_pair("KRAKEN_USD_BTC")
+		p.enable_stats(halflives=(5.,), window=2)
+		s2 = p.add_pair("KRAKEN_USD_ETH")
+		
+		now = datetime(2021, 3, 1)
+		p.push_update(PriceUpdate.from_fields("KRAKEN", "USD", "BTC", 1., now))
+		batch = PriceUpdateBatch(["KRAKEN_USD_ETH"], [0, 0, 0], [1., 2., 3.], [datetime_to_us(now)] * 3)
+		p.push_updates(batch)
+		
+		self.assertEqual(s1.stats.count, 1)
+		self.assertEqual(s2.stats.count, 3)
+		self.assertEqual(s2.stats.window, 2)
+		self.assertEqual(s2.stats.min, 2.)
+		self.assertEqual(list(s2.stats.ema.keys()), [5.])
+		
+		p.disable_stats()
+		self.assertIsNone(s1.stats)
+		self.assertIsNone(p.add_pair("KRAKEN_BTC_ETH").stats)
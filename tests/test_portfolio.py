@@ -6,6 +6,8 @@ vicmf88@gmail.com
 from portfolio import *
 from errors import *
 from datetime import datetime, timedelta
+import numpy as np
+import itertools
 import time
 import unittest
 import os
@@ -482,7 +484,33 @@ class PortfolioTests(unittest.TestCase):
 		
 		p = Portfolio()
 		self.assertEqual(p.get_pair_list(), [])
-		
+
+	def test_pair_order(self):
+		# Pairs are listed by exchange, then coin, then quote, each in the order they were first added
+		p = Portfolio()
+		for pair_id in ("KRAKEN_BTC_USD", "BINANCE_ETH_BTC", "KRAKEN_ETH_USD", "KRAKEN_BTC_EUR",
+		                "BINANCE_BTC_USD", "KRAKEN_ETH_BTC", "BINANCE_ETH_USD"):
+			p.add_pair(pair_id)
+		ids = lambda pairs: [x.id for x in pairs]
+		self.assertEqual(ids(p.get_pair_list()), [
+			"KRAKEN_BTC_USD", "KRAKEN_BTC_EUR", "KRAKEN_ETH_USD", "KRAKEN_ETH_BTC",
+			"BINANCE_ETH_BTC", "BINANCE_ETH_USD", "BINANCE_BTC_USD",
+		])
+		self.assertEqual(ids(p.get_pairs_by_exchange("KRAKEN")),
+		                 ["KRAKEN_BTC_USD", "KRAKEN_BTC_EUR", "KRAKEN_ETH_USD", "KRAKEN_ETH_BTC"])
+		self.assertEqual(ids(p.get_pairs_by_coin("ETH")),
+		                 ["KRAKEN_ETH_USD", "KRAKEN_ETH_BTC", "BINANCE_ETH_BTC", "BINANCE_ETH_USD"])
+		self.assertEqual(ids(p.get_pairs_by_quote("USD")),
+		                 ["KRAKEN_BTC_USD", "KRAKEN_ETH_USD", "BINANCE_ETH_USD", "BINANCE_BTC_USD"])
+		self.assertEqual({ex: list(pairs) for ex, pairs in p.get_pairs_full().items()}, {
+			"KRAKEN": ["KRAKEN_BTC_USD", "KRAKEN_BTC_EUR", "KRAKEN_ETH_USD", "KRAKEN_ETH_BTC"],
+			"BINANCE": ["BINANCE_ETH_BTC", "BINANCE_ETH_USD", "BINANCE_BTC_USD"],
+		})
+		self.assertEqual(list(p.get_pairs_full()), ["KRAKEN", "BINANCE"])
+		# The same order as walking the nested pairs dict
+		nested = [pair for coins in p.pairs.values() for quotes in coins.values() for pair in quotes.values()]
+		self.assertEqual(p.get_pair_list(), nested)
+
 	def test_get_holdings(self):
 		p = Portfolio()
 		
@@ -570,3 +598,240 @@ class PortfolioTests(unittest.TestCase):
 		self.assertEqual(assets["KRAKEN"]["USD"], p.get_pair_by_id("KRAKEN_USD_ETH").coin)
 		
 		self.assertEqual(assets["COINBASE"]["BTC"], p.get_pair_by_id("COINBASE_USD_BTC").quote)
+
+	def test_push_updates(self):
+		p = Portfolio()
+		
+		p.add_pair("KRAKEN_USD_BTC")
+		p.add_pair("COINBASE_USD_BTC")
+		p.add_pair("KRAKEN_USD_ETH")
+		
+		now = datetime.now()
+		updates = [
+			PriceUpdate({"exchange": "KRAKEN", "coin": "USD", "quote": "BTC", "rate": 0.1, "datetime": now}),
+			PriceUpdate({"exchange": "COINBASE", "coin": "USD", "quote": "BTC", "rate": 0.2, "datetime": now}),
+			PriceUpdate({"exchange": "KRAKEN", "coin": "USD", "quote": "BTC", "rate": 0.3, "datetime": now}),
+		]
+		
+		touched = p.push_updates(iter(updates))
+		
+		self.assertEqual({x.id for x in touched}, {"KRAKEN_USD_BTC", "COINBASE_USD_BTC"})
+		self.assertEqual(p.get_pair_by_id("KRAKEN_USD_BTC").rate, 0.3)
+		self.assertEqual(p.get_pair_by_id("COINBASE_USD_BTC").rate, 0.2)
+		self.assertIsNone(p.get_pair_by_id("KRAKEN_USD_ETH").rate)
+		
+	def test_push_updates_raises_not_implemented(self):
+		p = Portfolio()
+		p.add_pair("KRAKEN_USD_BTC")
+		
+		now = datetime.now()
+		updates = [
+			PriceUpdate({"exchange": "KRAKEN", "coin": "USD", "quote": "BTC", "rate": 0.1, "datetime": now}),
+			PriceUpdate({"exchange": "KRAKEN", "coin": "USD", "quote": "LITE", "rate": 0.2, "datetime": now}),
+		]
+		
+		self.assertRaises(PairlNotImplemented, p.push_updates, updates)
+		self.assertIsNone(p.get_pair_by_id("KRAKEN_USD_BTC").rate)
+		
+	def test_push_updates_batch(self):
+		p = Portfolio()
+		p.add_pair("KRAKEN_USD_BTC")
+		p.add_pair("KRAKEN_USD_ETH")
+		p.add_pair("COINBASE_USD_BTC")
+		
+		now = datetime(2021, 3, 1, 12, 30)
+		ts = [datetime_to_us(now + timedelta(seconds=x)) for x in range(4)]
+		batch = PriceUpdateBatch(["KRAKEN_USD_BTC", "KRAKEN_USD_ETH"], [0, 1, 0, 0], [0.1, 0.2, 0.3, 0.4], ts)
+		
+		touched = p.push_updates(batch)
+		
+		btc = p.get_pair_by_id("KRAKEN_USD_BTC")
+		self.assertEqual({x.id for x in touched}, {"KRAKEN_USD_BTC", "KRAKEN_USD_ETH"})
+		self.assertEqual(btc.rate, 0.4)
+		self.assertEqual(btc.last_update_time, now + timedelta(seconds=3))
+		self.assertEqual(btc.history.rates.tolist(), [0.1, 0.3, 0.4])
+		self.assertEqual(btc.history.timestamps.tolist(), [ts[0], ts[2], ts[3]])
+		self.assertIsNone(btc.updates)
+		self.assertEqual(p.get_pair_by_id("KRAKEN_USD_ETH").rate, 0.2)
+		
+		batch = PriceUpdateBatch(["KRAKEN_USD_LITE"], [0], [0.1], ts[:1])
+		self.assertRaises(PairlNotImplemented, p.push_updates, batch)
+		
+	def test_generation_tracks_universe(self):
+		p = Portfolio()
+		self.assertEqual(p.generation, 0)
+		
+		p.add_pair("KRAKEN_USD_BTC")
+		p.add_pair("KRAKEN_USD_ETH")
+		self.assertEqual(p.generation, 2)
+		
+		self.assertRaises(AlreadyImplementedPair, p.add_pair, "KRAKEN_USD_BTC")
+		self.assertEqual(p.generation, 2)
+		
+	def test_indexes_return_copies(self):
+		p = Portfolio()
+		p.add_pair("KRAKEN_USD_BTC")
+		
+		p.get_pair_list().clear()
+		p.get_pairs_by_coin("USD").clear()
+		p.get_pairs_full()["KRAKEN"].clear()
+		
+		self.assertEqual(len(p.get_pair_list()), 1)
+		self.assertEqual(len(p.get_pairs_by_coin("USD")), 1)
+		self.assertEqual(list(p.get_pairs_full()["KRAKEN"].keys()), ["KRAKEN_USD_BTC"])
+		
+	def test_pair_handles(self):
+		p = Portfolio()
+		s1 = p.add_pair("KRAKEN_USD_BTC")
+		s2 = p.add_pair("COINBASE_USD_BTC")
+		
+		self.assertEqual(s1.handle, 0)
+		self.assertEqual(s2.handle, 1)
+		self.assertEqual(p.get_handle("COINBASE_USD_BTC"), 1)
+		self.assertEqual(p.get_handle(("KRAKEN", "USD", "BTC")), 0)
+		self.assertIs(p.get_pair_by_handle(1), s2)
+		self.assertIsNone(p.get_pair_by_handle(2))
+		self.assertIsNone(p.get_pair_by_handle(-1))
+		self.assertRaises(PairlNotImplemented, p.get_handle, "KRAKEN_USD_ETH")
+		
+	def test_push_by_handle(self):
+		p = Portfolio()
+		p.add_pair("KRAKEN_USD_BTC")
+		s2 = p.add_pair("KRAKEN_USD_ETH")
+		
+		now = datetime.now()
+		updated = p.push_by_handle(s2.handle, 0.5, now)
+		
+		self.assertIs(updated, s2)
+		self.assertEqual(s2.rate, 0.5)
+		self.assertEqual(s2.last_update_time, now)
+		self.assertEqual(s2.history.last_timestamp, datetime_to_us(now))
+		self.assertRaises(PairlNotImplemented, p.push_by_handle, 7, 0.5, now)
+		
+	def test_ids_are_interned(self):
+		p = Portfolio()
+		s1 = p.add_pair("KRAKEN_USD_BTC")
+		s2 = p.add_pair("KRAKEN_" + "".join(["E", "T", "H"]) + "_BTC")
+		
+		self.assertIs(s1.quote.id, s2.quote.id)
+		self.assertIs(s2.coin.id, sys.intern("ETH"))
+		
+	def test_get_possible_loops_matches_permutations(self):
+		p = Portfolio()
+		for pair in ["KRAKEN_USD_BTC", "KRAKEN_BTC_ETH", "KRAKEN_ETH_USD", "COINBASE_USD_BTC", "COINBASE_ETH_BTC"]:
+			p.add_pair(pair)
+		p.add_pair_reverses()
+		
+		p.add_pair("KRAKEN_BTC_EUR")
+		p.add_pair("KRAKEN_EUR_USD")
+		
+		# Same loops and order as the permutations of the pairs walked through the nested pairs dict,
+		# which is how they were listed before the pair indexes existed
+		nested = [pair for coins in p.pairs.values() for quotes in coins.values() for pair in quotes.values()]
+		for depth in range(0, 5):
+			expected = [
+				tuple(x) for x in itertools.permutations(nested, depth)
+				if p.check_loop_consistency(x)
+			]
+			self.assertEqual(p.get_possible_loops(depth), expected)
+		
+		loops = p.get_possible_loops(3)
+		self.assertTrue(len(loops) > 0)
+		for loop in loops:
+			self.assertTrue(p.check_loop_consistency(loop))
+			
+	def test_get_possible_loops_cache_invalidated(self):
+		p = Portfolio()
+		p.add_pair("KRAKEN_USD_BTC")
+		p.add_pair("KRAKEN_BTC_ETH")
+		self.assertEqual(p.get_possible_loops(3), [])
+		self.assertEqual(p.get_possible_loops(2), [])
+		
+		p.add_pair("KRAKEN_ETH_USD")
+		self.assertEqual(len(p.get_possible_loops(3)), 3)
+		
+		p.add_pair_reverses()
+		self.assertEqual(len(p.get_possible_loops(3)), 6)
+		self.assertEqual(len(p.get_possible_loops(2)), 6)
+		
+	def test_history_len_and_debug_updates(self):
+		p = Portfolio(history_len=3, keep_updates=True)
+		s1 = p.add_pair("KRAKEN_USD_BTC")
+		s2 = p.add_pair((Exchange("KRAKEN"), Asset("USD"), Asset("ETH")))
+		
+		now = datetime(2021, 3, 1, 12, 30)
+		for x in range(5):
+			p.push_update(PriceUpdate.from_fields("KRAKEN", "USD", "BTC", float(x), now))
+		
+		self.assertEqual(s1.history.capacity, 3)
+		self.assertEqual(s2.history.capacity, 3)
+		self.assertEqual(s1.history.rates.tolist(), [2., 3., 4.])
+		self.assertEqual([x.best_rate for x in s1.updates], [2., 3., 4.])
+		
+		batch = PriceUpdateBatch(["KRAKEN_USD_BTC"], [0] * 4, [5., 6., 7., 8.], [datetime_to_us(now)] * 4)
+		p.push_updates(batch)
+		self.assertEqual(s1.history.rates.tolist(), [6., 7., 8.])
+		self.assertEqual([x.best_rate for x in s1.updates], [6., 7., 8.])
+		
+	def test_usd_value_cache(self):
+		p = Portfolio()
+		btc = p.add_pair("KRAKEN_BTC_USD")
+		eth_btc = p.add_pair("KRAKEN_ETH_BTC")
+		eth_usd = p.add_pair("COINBASE_ETH_USD")
+		now = datetime(2021, 3, 1)
+		p.push_updates([
+			PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 50000., now),
+			PriceUpdate.from_fields("KRAKEN", "ETH", "BTC", 0.04, now),
+		])
+		p.adjust_holdings_from_assetupd(AssetUpdate.from_fields("KRAKEN", ["BTC", "ETH", "USD"], [1., 10., 5.], now))
+		p.adjust_holdings_from_assetupd(AssetUpdate.from_fields("COINBASE", ["ETH"], [1.], now))
+		
+		values = p.get_usd_value()
+		self.assertEqual(values["KRAKEN"]["ETH"], [10., 20000.])
+		self.assertEqual(values["COINBASE"]["ETH"], [1., None])
+		self.assertEqual(p.get_full_usd_value(), 70005.)
+		self.assertEqual(p.get_usd_only(), 5.)
+		self.assertEqual(p.get_usd_per_ex(), {"KRAKEN": 70005., "COINBASE": 0.})
+		
+		# Results are copies of the cache
+		values["KRAKEN"]["ETH"][1] = 0.
+		p.get_usd_per_ex()["KRAKEN"] = 0.
+		self.assertEqual(p.get_usd_value()["KRAKEN"]["ETH"], [10., 20000.])
+		self.assertEqual(p.get_usd_per_ex()["KRAKEN"], 70005.)
+		
+		# Adding pairs drops the cache, pushes to pairs the valuation doesn't read keep it
+		p.add_pair_reverses()
+		self.assertIsNone(p._usd_value)
+		p.get_usd_value()
+		cached = p._usd_value
+		p.push_update(PriceUpdate.from_fields("KRAKEN", "USD", "BTC", 2e-05, now))
+		self.assertIs(p._usd_value, cached)
+		
+		# Pushes to dependencies and holding changes drop it
+		p.push_update(PriceUpdate.from_fields("COINBASE", "ETH", "USD", 1900., now))
+		self.assertEqual(p.get_usd_value()["COINBASE"]["ETH"], [1., 1900.])
+		p.push_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 60000., now))
+		self.assertEqual(p.get_full_usd_value(), 60000. + 24000. + 5. + 1900.)
+		p.adjust_holdings_from_assetupd(AssetUpdate.from_fields("KRAKEN", ["USD"], [10.], now))
+		self.assertEqual(p.get_usd_only(), 10.)
+		p.get_assets()["COINBASE"]["ETH"].am = 2.
+		self.assertEqual(p.get_usd_per_ex()["COINBASE"], 3800.)
+
+	def test_direct_pair_updates(self):
+		p = Portfolio()
+		btc = p.add_pair("KRAKEN_BTC_USD")
+		p.get_assets()["KRAKEN"]["BTC"].am = 1.
+		now = datetime.now()
+		btc.add_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 50000., now))
+		self.assertEqual(p.get_full_usd_value(), 50000.)
+		self.assertEqual(p.pairs_with_data(timedelta(seconds=60)), [btc])
+		self.assertEqual(p.report(timedelta(seconds=60))["overview"], "1/1")
+
+		btc.add_update(PriceUpdate.from_fields("KRAKEN", "BTC", "USD", 60000., now))
+		self.assertEqual(p.get_full_usd_value(), 60000.)
+		btc.add_batch(np.array([70000.]), np.array([datetime_to_us(now)], dtype=np.int64))
+		self.assertEqual(p.get_full_usd_value(), 70000.)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from price_history import PriceHistory
+import numpy as np
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class PriceHistoryTests(unittest.TestCase):
+	
+	def test_empty(self):
+		h = PriceHistory(4)
+		self.assertEqual(len(h), 0)
+		self.assertEqual(h.rates.tolist(), [])
+		self.assertIsNone(h.last_rate)
+		self.assertIsNone(h.last_timestamp)
+		
+	def test_append_wraps_around(self):
+		h = PriceHistory(3)
+		for x in range(7):
+			h.append(float(x), x * 10)
+			
+		self.assertEqual(len(h), 3)
+		self.assertEqual(h.rates.tolist(), [4., 5., 6.])
+		self.assertEqual(h.timestamps.tolist(), [40, 50, 60])
+		self.assertEqual(h.last_rate, 6.)
+		self.assertEqual(h.last_timestamp, 60)
+		
+	def test_views_are_contiguous_and_read_only(self):
+		h = PriceHistory(3)
+		for x in range(5):
+			h.append(float(x), x)
+		
+		rates = h.rates
+		self.assertTrue(rates.flags.c_contiguous)
+		self.assertFalse(rates.flags.writeable)
+		self.assertRaises(ValueError, rates.__setitem__, 0, 1.)
+		
+	def test_extend(self):
+		h = PriceHistory(4)
+		h.append(1., 1)
+		h.extend(np.array([2., 3.]), np.array([2, 3]))
+		self.assertEqual(h.rates.tolist(), [1., 2., 3.])
+		
+		h.extend(np.arange(10, 20, dtype=np.float64), np.arange(10, 20))
+		self.assertEqual(h.rates.tolist(), [16., 17., 18., 19.])
+		self.assertEqual(h.timestamps.tolist(), [16, 17, 18, 19])
+		
+		h.append(20., 20)
+		self.assertEqual(h.rates.tolist(), [17., 18., 19., 20.])
+		
+	def test_clear(self):
+		h = PriceHistory(2)
+		h.append(1., 1)
+		h.clear()
+		self.assertEqual(len(h), 0)
+		
+	def test_raises_on_bad_capacity(self):
+		self.assertRaises(ValueError, PriceHistory, 0)
@@ -0,0 +1,113 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from replay import ReplayEngine, Strategy
+from clock import SimulatedClock
+from datetime import datetime, timedelta
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class Recorder(Strategy):
+	
+	def __init__(self):
+		super().__init__()
+		self.events = []
+		self.finished = False
+	
+	def on_price_update(self, portfolio, pair, update):
+		self.events.append((pair.id, update.best_rate, update.systime))
+		
+	def on_asset_update(self, portfolio, holdings, update):
+		self.events.append((update.ex, holdings[update.ex]["USD"], update.systime))
+		
+	def on_finish(self, portfolio):
+		self.finished = True
+
+
+class ReplayEngineTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = Portfolio()
+		self.p.add_pair("KRAKEN_USD_BTC")
+		self.p.add_pair("COINBASE_USD_BTC")
+		self.t0 = datetime(2021, 3, 1)
+		
+	def at(self, seconds):
+		return self.t0 + timedelta(seconds=seconds)
+		
+	def kraken(self, rate, seconds):
+		return PriceUpdate.from_fields("KRAKEN", "USD", "BTC", rate, self.at(seconds))
+		
+	def coinbase(self, rate, seconds):
+		return PriceUpdate.from_fields("COINBASE", "USD", "BTC", rate, self.at(seconds))
+		
+	def test_merges_sources_in_time_order(self):
+		kraken = [self.kraken(1., 0), self.kraken(2., 2), self.kraken(3., 4)]
+		coinbase = iter([self.coinbase(10., 1), self.coinbase(20., 2), self.coinbase(30., 5)])
+		holdings = [AssetUpdate.from_fields("KRAKEN", ["USD"], [5.], self.at(3))]
+		rec = Recorder()
+		
+		engine = ReplayEngine(self.p, [kraken, coinbase, holdings], [rec])
+		report = engine.run()
+		
+		self.assertEqual([x[1] for x in rec.events], [1., 10., 2., 20., 5., 3., 30.])
+		self.assertTrue(rec.finished)
+		self.assertEqual(report["events"], 7)
+		self.assertEqual(report["price_updates"], 6)
+		self.assertEqual(report["asset_updates"], 1)
+		self.assertEqual(report["start"], self.at(0))
+		self.assertEqual(report["end"], self.at(5))
+		self.assertEqual(self.p.get_pair_by_id("KRAKEN_USD_BTC").rate, 3.)
+		self.assertEqual(self.p.get_pair_by_id("COINBASE_USD_BTC").rate, 30.)
+		
+	def test_batch_sources(self):
+		ts = [datetime_to_us(self.at(x)) for x in (0, 3)]
+		batch = PriceUpdateBatch(["KRAKEN_USD_BTC"], [0, 0], [1., 2.], ts)
+		rec = Recorder()
+		
+		ReplayEngine(self.p, [[batch], [self.coinbase(10., 1)]], [rec]).run()
+		self.assertEqual([x[1] for x in rec.events], [1., 10., 2.])
+		
+	def test_stop(self):
+		class Stopper(Strategy):
+			def on_price_update(self, portfolio, pair, update):
+				engine.stop()
+		
+		engine = ReplayEngine(self.p, [[self.kraken(1., 0), self.kraken(2., 1)]], [Stopper()])
+		report = engine.run()
+		self.assertEqual(report["events"], 1)
+		self.assertEqual(self.p.get_pair_by_id("KRAKEN_USD_BTC").rate, 1.)
+		
+	def test_advances_simulated_clock(self):
+		class Watcher(Strategy):
+			def __init__(self):
+				super().__init__()
+				self.ages = []
+				
+			def on_price_update(self, portfolio, pair, update):
+				other = portfolio.get_pair_by_id("KRAKEN_USD_BTC")
+				self.ages.append(other.time_since_update)
+		
+		self.p.clock = SimulatedClock()
+		watcher = Watcher()
+		ReplayEngine(self.p, [[self.kraken(1., 0)], [self.coinbase(10., 5)]], [watcher]).run()
+		self.assertEqual(watcher.ages, [timedelta(0), timedelta(seconds=5)])
+		self.assertEqual(self.p.clock.now(), self.at(5))
+		self.assertEqual(self.p.last_data_td(), timedelta(0))
+		
+	def test_report_raises_before_run(self):
+		engine = ReplayEngine(self.p, [])
+		self.assertRaises(SimulationNotCompleted, engine.report)
+		engine.run()
+		self.assertEqual(engine.report()["events"], 0)
+		
+	def test_raises_on_unknown_event(self):
+		engine = ReplayEngine(self.p, [["potato"]])
+		self.assertRaises((TypeError, AttributeError), engine.run)
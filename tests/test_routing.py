@@ -0,0 +1,85 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from routing import RoutingTable, path_rate
+from datetime import datetime
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class RoutingTableTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.p = Portfolio()
+		for pair in ("KRAKEN_BTC_USD", "KRAKEN_ETH_BTC", "KRAKEN_ETH_USDT", "KRAKEN_USDT_USD",
+		             "KRAKEN_XRP_ETH", "KRAKEN_ADA_USDT", "KRAKEN_USD_EUR", "COINBASE_XRP_USD"):
+			self.p.add_pair(pair)
+		self.now = datetime(2021, 3, 1)
+		
+	def push(self, pair, rate):
+		self.p.push_update(PriceUpdate.from_fields(*pair.split("_"), rate, self.now))
+		
+	def ids(self, path):
+		return [x.id for x in path]
+		
+	def test_shortest_paths(self):
+		table = RoutingTable(self.p, "USD")
+		self.assertEqual(table.route("KRAKEN", "USD"), ())
+		self.assertEqual(self.ids(table.route("KRAKEN", "BTC")), ["KRAKEN_BTC_USD"])
+		self.assertEqual(self.ids(table.route("KRAKEN", "ETH")), ["KRAKEN_ETH_BTC", "KRAKEN_BTC_USD"])
+		self.assertEqual(self.ids(table.route("KRAKEN", "ADA")), ["KRAKEN_ADA_USDT", "KRAKEN_USDT_USD"])
+		self.assertEqual(self.ids(table.route("KRAKEN", "XRP")),
+		                 ["KRAKEN_XRP_ETH", "KRAKEN_ETH_BTC", "KRAKEN_BTC_USD"])
+		self.assertEqual(self.ids(table.route("COINBASE", "XRP")), ["COINBASE_XRP_USD"])
+		# Pairs only convert coin into quote
+		self.assertIsNone(table.route("KRAKEN", "EUR"))
+		self.assertIsNone(table.route("BITSTAMP", "BTC"))
+		
+	def test_rebuilt_when_pairs_are_added(self):
+		table = self.p.get_routing_table("USD")
+		self.assertIs(self.p.get_routing_table("USD"), table)
+		self.assertEqual(len(table.route("KRAKEN", "XRP")), 3)
+		self.p.add_pair("KRAKEN_XRP_USD")
+		self.assertEqual(self.ids(table.route("KRAKEN", "XRP")), ["KRAKEN_XRP_USD"])
+		
+	def test_rates(self):
+		table = self.p.get_routing_table("USD")
+		self.assertIsNone(table.rate("KRAKEN", "ADA"))
+		self.push("KRAKEN_ADA_USDT", 2.)
+		self.assertIsNone(table.rate("KRAKEN", "ADA"))
+		self.push("KRAKEN_USDT_USD", 0.5)
+		self.assertEqual(table.rate("KRAKEN", "ADA"), 1.)
+		self.assertEqual(table.rate("KRAKEN", "USD"), 1.)
+		self.assertEqual(path_rate(()), 1.)
+		
+	def test_portfolio_conversions(self):
+		self.push("KRAKEN_ADA_USDT", 2.)
+		self.push("KRAKEN_USDT_USD", 0.5)
+		self.push("KRAKEN_XRP_ETH", 0.1)
+		self.push("KRAKEN_ETH_BTC", 0.05)
+		self.push("KRAKEN_BTC_USD", 40000.)
+		self.p.adjust_holdings_from_assetupd(AssetUpdate.from_fields("KRAKEN", ["ADA", "XRP"], [10., 2.], self.now))
+		
+		self.assertEqual(self.p.predict_usd_val("KRAKEN", "ADA"), 10.)
+		self.assertAlmostEqual(self.p.predict_usd_val("KRAKEN", "XRP"), 400.)
+		self.assertIsNone(self.p.predict_usd_val("KRAKEN", "EUR"))
+		self.assertEqual(self.p.get_virtual_rate("KRAKEN", "ADA", "USD"), 1.)
+		self.assertAlmostEqual(self.p.get_virtual_rate("KRAKEN", "ETH", "USD"), 2000.)
+		
+		values = self.p.get_usd_value()["KRAKEN"]
+		self.assertEqual(values["ADA"], [10., 10.])
+		self.assertAlmostEqual(values["XRP"][1], 400.)
+		
+		# The valuation depends on every pair of the paths it used
+		self.push("KRAKEN_XRP_ETH", 0.2)
+		self.assertAlmostEqual(self.p.get_usd_value()["KRAKEN"]["XRP"][1], 800.)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,109 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from slippage import *
+from datetime import datetime
+import numpy as np
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class SlippageTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.bid_prices = np.array([100., 99., 97.])
+		self.bid_sizes = np.array([1., 2., 3.])
+		self.ask_prices = np.array([101., 102., 105.])
+		self.ask_sizes = np.array([0.5, 1., 2.])
+		
+	def test_walk_levels(self):
+		notional, filled = walk_levels(self.bid_prices, self.bid_sizes, [0., 0.5, 1., 2., 6., 10.])
+		self.assertEqual(filled.tolist(), [0., 0.5, 1., 2., 6., 6.])
+		self.assertEqual(notional.tolist(), [0., 50., 100., 199., 589., 589.])
+		notional, filled = walk_levels(np.zeros(0), np.zeros(0), [1.])
+		self.assertEqual(filled.tolist(), [0.])
+		
+	def test_fill_price(self):
+		prices = fill_price(self.bid_prices, self.bid_sizes, [1., 2., 10.])
+		self.assertEqual(prices[:2].tolist(), [100., 99.5])
+		self.assertTrue(np.isnan(prices[2]))
+		self.assertEqual(float(fill_price(self.ask_prices, self.ask_sizes, 1.5)), (50.5 + 102.) / 1.5)
+		
+	def test_max_fillable(self):
+		self.assertEqual(max_fillable_bid(self.bid_prices, self.bid_sizes), 6.)
+		self.assertEqual(max_fillable_bid(self.bid_prices, self.bid_sizes, 99.), 3.)
+		self.assertEqual(max_fillable_bid(self.bid_prices, self.bid_sizes, 100.5), 0.)
+		self.assertEqual(max_fillable_ask(self.ask_prices, self.ask_sizes, 102.), 1.5)
+		self.assertEqual(max_fillable_ask(self.ask_prices, self.ask_sizes, 200.), 3.5)
+		self.assertEqual(max_fillable_bid(np.zeros(0), np.zeros(0), 1.), 0.)
+		self.assertEqual(max_fillable_ask(np.zeros(0), np.zeros(0), 1.), 0.)
+
+	def test_max_fillable_single_level(self):
+		prices, sizes = np.array([100.]), np.array([5.])
+		self.assertEqual(max_fillable_ask(prices, sizes, 99.), 0.)
+		self.assertEqual(max_fillable_ask(prices, sizes, 100.), 5.)
+		self.assertEqual(max_fillable_bid(prices, sizes, 101.), 0.)
+		self.assertEqual(max_fillable_bid(prices, sizes, 99.), 5.)
+		# Levels at the same price
+		prices, sizes = np.array([100., 100.]), np.array([1., 2.])
+		self.assertEqual(max_fillable_ask(prices, sizes, 99.), 0.)
+		self.assertEqual(max_fillable_bid(prices, sizes, 99.), 3.)
+
+
+class PairSlippageTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.now = datetime(2021, 3, 1)
+		self.p = Portfolio()
+		self.p.add_pair("EMPTY_EUR_USD")
+		self.p.add_pair("EMPTY_USD_GBP")
+		self.p.add_pair("EMPTY_GBP_EUR")
+		self.push("EUR_USD", 1.2, {"bids": [[1.2, 100.], [1.1, 100.]], "asks": [[1.21, 50.], [1.25, 100.]]})
+		self.push("USD_GBP", 0.8, {"bids": [[0.8, 1000.]]})
+		self.push("GBP_EUR", 1.1, None)
+		
+	def push(self, pair, rate, book):
+		coin, quote = pair.split("_")
+		self.p.push_update(PriceUpdate.from_fields("EMPTY", coin, quote, rate, self.now, book))
+		
+	def test_sell_and_buy(self):
+		pair = self.p.get_pair_by_id("EMPTY_EUR_USD")
+		out = sell(pair, [50., 150., 300.])
+		self.assertEqual(out[:2].tolist(), [60., 175.])
+		self.assertTrue(np.isnan(out[2]))
+		
+		out = buy(pair, [60.5, 60.5 + 62.5])
+		self.assertAlmostEqual(out[0], 50.)
+		self.assertAlmostEqual(out[1], 100.)
+		self.assertTrue(np.isnan(buy(pair, [1000.])[0]))
+		
+	def test_loops(self):
+		loop = self.p.get_possible_loops(3)[0]
+		ids = [x.id for x in loop]
+		start = ids.index("EMPTY_EUR_USD")
+		loop = loop[start:] + loop[:start]
+		
+		amounts = np.array([10., 100., 150., 250.])
+		out = loop_output(loop, amounts)
+		expected = [10. * 1.2 * 0.8 * 1.1, 100. * 1.2 * 0.8 * 1.1, (120. + 55.) * 0.8 * 1.1]
+		np.testing.assert_allclose(out[:3], expected)
+		self.assertTrue(np.isnan(out[3]))
+		
+		table = loops_output([loop, loop[:1]], amounts)
+		self.assertEqual(table.shape, (2, 4))
+		np.testing.assert_allclose(table[1][:3], [12., 120., 175.])
+		
+		amount, profit = best_size(loop, amounts)
+		self.assertEqual(amount, 100.)
+		self.assertAlmostEqual(profit, 5.6)
+		self.assertEqual(best_size(loop, [1000.]), (None, 0.))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,136 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from staleness import StalenessIndex
+from clock import SimulatedClock
+from datetime import datetime, timedelta
+import random
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class StalenessIndexTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.t0 = datetime(2021, 3, 1)
+		self.pairs = [Pair(Exchange("KRAKEN"), Asset("USD"), Asset(x)) for x in ("BTC", "ETH", "LTC")]
+		self.index = StalenessIndex()
+		for pair in self.pairs:
+			self.index.add(pair)
+			
+	def update(self, pair, seconds):
+		pair.add_update(PriceUpdate.from_fields("KRAKEN", pair.coin.id, pair.quote.id, 1., self.t0 + timedelta(seconds=seconds)))
+		self.index.touch(pair)
+		
+	def test_never_updated(self):
+		self.assertEqual(len(self.index), 3)
+		self.assertEqual(set(self.index.never_updated), set(self.pairs))
+		self.assertIsNone(self.index.oldest)
+		self.assertIsNone(self.index.newest_pair)
+		
+	def test_order_follows_updates(self):
+		btc, eth, ltc = self.pairs
+		self.update(btc, 0)
+		self.update(eth, 5)
+		self.update(ltc, 2)
+		self.assertEqual(self.index.newest_pair, eth)
+		self.assertEqual(self.index.oldest, datetime_to_us(self.t0))
+		self.update(btc, 10)
+		self.assertEqual(self.index.newest_pair, btc)
+		self.assertEqual(self.index.newer_than(datetime_to_us(self.t0) + 2000000), [eth, btc])
+		self.assertEqual(self.index.newer_than(datetime_to_us(self.t0) + 2000000, inclusive=True), [ltc, eth, btc])
+		self.assertEqual(self.index.older_than(datetime_to_us(self.t0) + 5000000), [ltc])
+		self.assertEqual(self.index.older_than(datetime_to_us(self.t0) + 5000000, inclusive=True), [ltc, eth])
+		self.assertEqual(self.index.never_updated, [])
+		self.assertEqual(len(self.index), 3)
+
+	def test_out_of_order(self):
+		btc, eth, ltc = self.pairs
+		for i, pair in enumerate(self.pairs):
+			self.update(pair, 10 + i)
+		# A pair going back in time, as when a replay starts again
+		self.update(ltc, 1)
+		self.assertEqual(self.index.oldest, datetime_to_us(self.t0) + 1000000)
+		self.assertEqual(self.index.newest_pair, eth)
+		self.assertEqual(self.index.older_than(datetime_to_us(self.t0) + 11000000, inclusive=True), [ltc, btc, eth])
+		self.update(btc, 12)
+		self.assertEqual(self.index.newer_than(datetime_to_us(self.t0) + 5000000), [eth, btc])
+
+
+class PortfolioStalenessTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.t0 = datetime(2021, 3, 1)
+		self.clock = SimulatedClock(self.t0)
+		self.p = Portfolio(clock=self.clock)
+		for ex in ("KRAKEN", "COINBASE"):
+			for coin in ("BTC", "ETH", "LTC", "XRP"):
+				self.p.add_pair("{}_USD_{}".format(ex, coin))
+				
+	def brute_report(self, threshold):
+		now = self.clock.now()
+		pairs = self.p.get_pair_list()
+		ages = [x.age(now) for x in pairs]
+		return {
+			"all": all(age < threshold for age in ages),
+			"overview": "{}/{}".format(sum(age < threshold for age in ages), len(ages)),
+			"with": [x.id for x, age in zip(pairs, ages) if age < threshold],
+			"without": [x.id for x, age in zip(pairs, ages) if age > threshold],
+			"exchanges": {ex: all(x.age(now) < threshold for x in self.p.get_pairs_by_exchange(ex))
+			              for ex in ("KRAKEN", "COINBASE")},
+		}
+		
+	def test_matches_full_scan(self):
+		rng = random.Random(3)
+		pairs = self.p.get_pair_list()
+		for step in range(300):
+			pair = rng.choice(pairs)
+			ex, coin, quote = pair.sliced_id
+			systime = self.t0 + timedelta(seconds=rng.randint(0, 60))
+			if rng.random() < 0.5:
+				self.p.push_update(PriceUpdate.from_fields(ex, coin, quote, 1., systime))
+			else:
+				batch = PriceUpdateBatch([pair.sliced_id], [0], [1.], [datetime_to_us(systime)])
+				self.p.push_updates(batch)
+			self.clock.set(self.t0 + timedelta(seconds=rng.randint(0, 70)))
+			threshold = timedelta(seconds=rng.randint(0, 20))
+			
+			self.assertEqual(self.p.report(threshold), self.brute_report(threshold))
+			now = self.clock.now()
+			self.assertEqual(self.p.pairs_with_data(threshold), [x for x in pairs if x.age(now) <= threshold])
+			self.assertEqual(self.p.data_flag(), any(x.age(now) <= timedelta(seconds=3) for x in pairs))
+			self.assertEqual(self.p.last_data_td(), min(x.age(now) for x in pairs))
+			
+	def test_results_follow_pair_list(self):
+		p = Portfolio(clock=self.clock)
+		for pair_id in ("KRAKEN_BTC_USD", "COINBASE_ETH_USD", "KRAKEN_ETH_USD", "KRAKEN_BTC_EUR"):
+			p.add_pair(pair_id)
+		for pair in reversed(p.get_pair_list()):
+			ex, coin, quote = pair.sliced_id
+			p.push_update(PriceUpdate.from_fields(ex, coin, quote, 1., self.t0))
+		ids = [x.id for x in p.get_pair_list()]
+		self.assertEqual(ids, ["KRAKEN_BTC_USD", "KRAKEN_BTC_EUR", "KRAKEN_ETH_USD", "COINBASE_ETH_USD"])
+		self.assertEqual([x.id for x in p.pairs_with_data(timedelta(seconds=1))], ids)
+		self.assertEqual(p.report(timedelta(seconds=1))["with"], ids)
+		self.clock.set(self.t0 + timedelta(seconds=5))
+		self.assertEqual(p.report(timedelta(seconds=1))["without"], ids)
+
+	def test_without_data(self):
+		report = self.p.report(timedelta(seconds=5))
+		self.assertFalse(report["all"])
+		self.assertEqual(report["overview"], "0/8")
+		self.assertEqual(len(report["without"]), 8)
+		self.assertEqual(report["exchanges"], {"KRAKEN": False, "COINBASE": False})
+		self.assertFalse(self.p.data_flag())
+		self.assertEqual(self.p.last_data_td(), NO_DATA_AGE)
+		self.assertRaises(ValueError, Portfolio().last_data_td)
+
+
+if __name__ == '__main__':
+	unittest.main()
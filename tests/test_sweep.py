@@ -0,0 +1,64 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from replay import Strategy
+from sweep import SweepRunner
+from datetime import datetime, timedelta
+import numpy as np
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class CountAbove(Strategy):
+	
+	def __init__(self, params):
+		super().__init__()
+		self.level = params["level"]
+		self.count = 0
+		
+	def on_price_update(self, portfolio, pair, update):
+		if update.best_rate > self.level:
+			self.count += 1
+			
+	def result(self, portfolio):
+		return {"above": self.count, "last": portfolio.get_pair_by_id("KRAKEN_USD_BTC").rate}
+
+
+class SweepRunnerTests(unittest.TestCase):
+	
+	def setUp(self):
+		t0 = datetime_to_us(datetime(2021, 3, 1))
+		n = 1000
+		self.ticks = PriceUpdateBatch(["KRAKEN_USD_BTC", "KRAKEN_USD_ETH"], np.arange(n) % 2,
+		                              np.arange(n, dtype=np.float64), t0 + np.arange(n) * 1000)
+		
+	def test_sweep(self):
+		params = [{"level": x} for x in (100, 500, 900, 2000)]
+		with SweepRunner(self.ticks, processes=2, chunk_size=128) as runner:
+			self.assertEqual(len(runner), 1000)
+			rows = runner.run(CountAbove, params)
+			# The shared ticks can be swept again
+			again = runner.run(CountAbove, params[:1])
+		
+		self.assertEqual([row["level"] for row in rows], [100, 500, 900, 2000])
+		self.assertEqual([row["above"] for row in rows], [899, 499, 99, 0])
+		self.assertTrue(all(row["events"] == 1000 for row in rows))
+		self.assertTrue(all(row["last"] == 998. for row in rows))
+		self.assertEqual(again[0]["above"], 899)
+		self.assertRaises(ValueError, runner.run, CountAbove, params)
+		
+	def test_extra_portfolio_pairs(self):
+		with SweepRunner(self.ticks, pair_ids=["KRAKEN_USD_BTC", "KRAKEN_USD_ETH", "KRAKEN_USD_XRP"],
+		                 processes=1) as runner:
+			rows = runner.run(CountAbove, [{"level": 0}])
+		self.assertEqual(rows[0]["above"], 999)
+
+
+if __name__ == '__main__':
+	unittest.main()
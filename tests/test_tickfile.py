@@ -0,0 +1,143 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+"""
+
+from portfolio import *
+from tickfile import MAGIC, VERSION, TickFileWriter, TickFileReader
+from datetime import datetime, timedelta
+import struct
+import tempfile
+import unittest
+import os
+import sys
+
+sys.path.append(os.path.abspath('../'))
+
+
+class TickFileTests(unittest.TestCase):
+	
+	def setUp(self):
+		self.dir = tempfile.TemporaryDirectory()
+		self.path = os.path.join(self.dir.name, "ticks.bin")
+		self.t0 = datetime(2021, 3, 1)
+		
+	def tearDown(self):
+		self.dir.cleanup()
+		
+	def update(self, pair_id, rate, seconds):
+		ex, co, quo = pair_id.split("_")
+		return PriceUpdate.from_fields(ex, co, quo, rate, self.t0 + timedelta(seconds=seconds))
+		
+	def test_roundtrip(self):
+		with TickFileWriter(self.path, ["KRAKEN_USD_BTC"]) as w:
+			w.write(self.update("KRAKEN_USD_BTC", 1., 0))
+			w.write(self.update("KRAKEN_USD_ETH", 2., 1))
+			batch = PriceUpdateBatch(["KRAKEN_USD_ETH", "COINBASE_USD_BTC"], [1, 0], [3., 4.],
+			                         [datetime_to_us(self.t0)] * 2)
+			w.write_batch(batch)
+			
+		with TickFileReader(self.path) as r:
+			self.assertEqual(r.pair_ids, ["KRAKEN_USD_BTC", "KRAKEN_USD_ETH", "COINBASE_USD_BTC"])
+			self.assertEqual(len(r), 4)
+			self.assertEqual(r.handles.tolist(), [0, 1, 2, 1])
+			self.assertEqual(r.rates.tolist(), [1., 2., 3., 4.])
+			self.assertEqual(r.timestamps[1], datetime_to_us(self.t0 + timedelta(seconds=1)))
+			
+			updates = list(r.iter_updates(chunk_size=3))
+			self.assertEqual(updates[1].id, ("KRAKEN", "USD", "ETH"))
+			self.assertEqual(updates[1].systime, self.t0 + timedelta(seconds=1))
+			
+	def test_append(self):
+		with TickFileWriter(self.path) as w:
+			w.write(self.update("KRAKEN_USD_BTC", 1., 0))
+		with TickFileWriter(self.path) as w:
+			w.write(self.update("KRAKEN_USD_ETH", 2., 1))
+			w.write(self.update("KRAKEN_USD_BTC", 3., 2))
+			
+		with TickFileReader(self.path) as r:
+			self.assertEqual(r.pair_ids, ["KRAKEN_USD_BTC", "KRAKEN_USD_ETH"])
+			self.assertEqual(r.handles.tolist(), [0, 1, 0])
+			self.assertEqual(r.rates.tolist(), [1., 2., 3.])
+			
+	def test_partial_record_is_dropped(self):
+		with TickFileWriter(self.path) as w:
+			w.write(self.update("KRAKEN_USD_BTC", 1., 0))
+		with open(self.path, "ab") as f:
+			f.write(b"\1\2\3")
+		
+		with TickFileReader(self.path) as r:
+			self.assertEqual(len(r), 1)
+		with TickFileWriter(self.path) as w:
+			w.write(self.update("KRAKEN_USD_BTC", 2., 1))
+		with TickFileReader(self.path) as r:
+			self.assertEqual(r.rates.tolist(), [1., 2.])
+		
+	def test_batches_are_views(self):
+		with TickFileWriter(self.path) as w:
+			for x in range(10):
+				w.write(self.update("KRAKEN_USD_BTC", float(x), x))
+				
+		p = Portfolio()
+		pair = p.add_pair("KRAKEN_USD_BTC")
+		with TickFileReader(self.path) as r:
+			batches = list(r.batches(chunk_size=4))
+			self.assertEqual([len(b) for b in batches], [4, 4, 2])
+			self.assertFalse(batches[0].rates.flags.owndata)
+			self.assertFalse(batches[0].handles.flags.owndata)
+			for batch in batches:
+				p.push_updates(batch)
+			del batches
+			
+		self.assertEqual(pair.rate, 9.)
+		self.assertEqual(pair.last_update_time, self.t0 + timedelta(seconds=9))
+		
+	def test_empty_file(self):
+		TickFileWriter(self.path).close()
+		with TickFileReader(self.path) as r:
+			self.assertEqual(len(r), 0)
+			self.assertEqual(list(r.batches()), [])
+			
+	def test_raises_on_bad_file(self):
+		with open(self.path, "wb") as f:
+			f.write(b"POTATO" * 10)
+		self.assertRaises(TickFileError, TickFileReader, self.path)
+		self.assertRaises(TickFileError, TickFileWriter, self.path)
+
+	def test_reader_raises_on_empty_file(self):
+		open(self.path, "wb").close()
+		fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+		self.assertRaises(TickFileError, TickFileReader, self.path)
+		with open(self.path, "wb") as f:
+			f.write(b"POTATO" * 10)
+		self.assertRaises(TickFileError, TickFileReader, self.path)
+		if fds is not None:
+			self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+
+	def test_raises_on_corrupt_header(self):
+		fds = len(os.listdir("/proc/self/fd")) if os.path.isdir("/proc/self/fd") else None
+		prefix = struct.Struct("<4sHHII")
+		headers = [
+			# 5 pairs declared over 3 bytes of garbage
+			prefix.pack(MAGIC, VERSION, 0, prefix.size + 3, 5) + b"\xff" * 3,
+			# A pair id running past the header
+			prefix.pack(MAGIC, VERSION, 0, prefix.size + 4, 1) + struct.pack("<H", 50) + b"ab",
+			# Invalid utf-8 in a pair id
+			prefix.pack(MAGIC, VERSION, 0, prefix.size + 4, 1) + struct.pack("<H", 2) + b"\xff\xfe",
+			# A header smaller than its own prefix, followed by what would be 2 records
+			prefix.pack(MAGIC, VERSION, 0, 4, 0) + b"\0" * 20,
+		]
+		for header in headers:
+			with open(self.path, "wb") as f:
+				f.write(header)
+			self.assertRaises(TickFileError, TickFileReader, self.path)
+			self.assertRaises(TickFileError, TickFileWriter, self.path)
+		if fds is not None:
+			self.assertEqual(len(os.listdir("/proc/self/fd")), fds)
+
+	def test_raises_on_full_table(self):
+		w = TickFileWriter(self.path, table_size=20)
+		w.add_pair("KRAKEN_USD_BTC")
+		self.assertRaises(TickFileError, w.add_pair, "KRAKEN_USD_ETH")
+		self.assertEqual(w.pair_ids, ["KRAKEN_USD_BTC"])
+		w.close()
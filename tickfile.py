@@ -0,0 +1,312 @@
+"""
+Victor Marin Felip
+vicmf88@gmail.com
+
+Binary tick files. Layout, all little endian:
+
+- Header of header_size bytes:
+	- magic b"TCKF", version (uint16), reserved (uint16), header_size (uint32), number of pairs (uint32)
+	- pair table: per pair, its id length (uint16) and the id ("EX_COIN_QUOTE") in utf-8
+	- zero padding up to header_size, so pairs can be added later without moving the records
+- Fixed size records: pair handle (uint32, index into the pair table), rate (float64), time (int64 microseconds
+  since the epoch, see base.datetime_to_us)
+"""
+
+from base import PriceUpdate, PriceUpdateBatch, datetime_to_us
+from errors import TickFileError
+from typing import Iterable, Iterator, List, Union
+import mmap
+import os
+import struct
+import numpy as np
+
+
+MAGIC = b"TCKF"
+VERSION = 1
+RECORD = np.dtype([("handle", "<u4"), ("rate", "<f8"), ("ts", "<i8")])
+
+_PREFIX = struct.Struct("<4sHHII")
+_ID_LEN = struct.Struct("<H")
+
+
+def _pair_key(pair_id: Union[str, tuple]) -> str:
+	if type(pair_id) is str:
+		return pair_id
+	return "{}_{}_{}".format(*pair_id)
+
+
+def _read_header(path: str, data: bytes) -> tuple:
+	"""
+	Parses the header of a tick file
+
+	:param path: Path of the file, for error messages
+	:param data: At least the first header_size bytes of the file
+	:return: A tuple of (header_size, list of pair ids)
+	"""
+	if len(data) < _PREFIX.size:
+		raise TickFileError(path, "file too short for a header")
+	magic, version, _, header_size, n_pairs = _PREFIX.unpack_from(data, 0)
+	if magic != MAGIC:
+		raise TickFileError(path, "not a tick file")
+	if version != VERSION:
+		raise TickFileError(path, "unsupported version {}".format(version))
+	if header_size < _PREFIX.size:
+		raise TickFileError(path, "invalid header size {}".format(header_size))
+	if len(data) < header_size:
+		raise TickFileError(path, "truncated header")
+
+	pair_ids = []
+	offset = _PREFIX.size
+	for _ in range(n_pairs):
+		if offset + _ID_LEN.size > header_size:
+			raise TickFileError(path, "corrupt pair table")
+		length, = _ID_LEN.unpack_from(data, offset)
+		offset += _ID_LEN.size
+		if offset + length > header_size:
+			raise TickFileError(path, "corrupt pair table")
+		try:
+			pair_ids.append(bytes(data[offset:offset + length]).decode("utf-8"))
+		except UnicodeDecodeError:
+			raise TickFileError(path, "corrupt pair table")
+		offset += length
+	return header_size, pair_ids
+
+
+class TickFileWriter(object):
+
+	def __init__(self, path: str, pair_ids: Iterable[Union[str, tuple]] = (), table_size: int = 65536,
+	             buffer_size: int = 65536):
+		"""
+		Appends ticks to a tick file, creating it if needed. If the file already exists its pair table is loaded
+		and new records go after the existing ones.
+
+		:param path: Path of the file
+		:param pair_ids: Pairs to declare up front, others are added to the table as they show up
+		:param table_size: Bytes reserved for the pair table when the file is created
+		:param buffer_size: Number of single updates buffered before they are written
+		"""
+		self._path = path
+		self._buffer_size = buffer_size
+		self._buffer = []
+
+		if os.path.exists(path) and os.path.getsize(path) > 0:
+			self._file = open(path, "r+b")
+			try:
+				prefix = self._file.read(_PREFIX.size)
+				if len(prefix) < _PREFIX.size:
+					raise TickFileError(path, "file too short for a header")
+				self._file.seek(0)
+				header_size = max(_PREFIX.unpack(prefix)[3], _PREFIX.size)
+				self._header_size, existing = _read_header(path, self._file.read(header_size))
+			except TickFileError:
+				self._file.close()
+				raise
+			# Drop a partially written last record, if any
+			records = (os.path.getsize(path) - self._header_size) // RECORD.itemsize
+			self._file.truncate(self._header_size + records * RECORD.itemsize)
+		else:
+			self._file = open(path, "w+b")
+			self._header_size = _PREFIX.size + table_size
+			existing = []
+			self._file.write(b"\0" * self._header_size)
+
+		self._pair_ids = []
+		self._handles = {}
+		for pair_id in existing:
+			self._handles[pair_id] = len(self._pair_ids)
+			self._pair_ids.append(pair_id)
+		self._write_table()
+
+		for pair_id in pair_ids:
+			self.add_pair(pair_id)
+
+	@property
+	def pair_ids(self) -> List[str]:
+		return list(self._pair_ids)
+
+	def _write_table(self):
+		table = bytearray(_PREFIX.pack(MAGIC, VERSION, 0, self._header_size, len(self._pair_ids)))
+		for pair_id in self._pair_ids:
+			encoded = pair_id.encode("utf-8")
+			table += _ID_LEN.pack(len(encoded)) + encoded
+		if len(table) > self._header_size:
+			raise TickFileError(self._path, "pair table full, create the file with a bigger table_size")
+		self._file.seek(0)
+		self._file.write(table)
+		self._file.seek(0, os.SEEK_END)
+
+	def add_pair(self, pair_id: Union[str, tuple]) -> int:
+		"""
+		Adds a pair to the table if it is not there yet
+
+		:param pair_id: The pair id, as "EX_COIN_QUOTE" or a tuple of (ex, coin, quote)
+		:return: The handle of the pair in this file
+		"""
+		pair_id = _pair_key(pair_id)
+		handle = self._handles.get(pair_id)
+		if handle is None:
+			handle = len(self._pair_ids)
+			self._pair_ids.append(pair_id)
+			try:
+				self._write_table()
+			except TickFileError:
+				self._pair_ids.pop()
+				raise
+			self._handles[pair_id] = handle
+		return handle
+
+	def write_arrays(self, handles: np.ndarray, rates: np.ndarray, timestamps: np.ndarray):
+		"""
+		Appends records from arrays. Handles must already be handles of this file.
+
+		:param handles: Array of pair handles
+		:param rates: Array of rates
+		:param timestamps: Array of microseconds since the epoch
+		"""
+		self._flush_buffer()
+		records = np.empty(len(handles), dtype=RECORD)
+		records["handle"] = handles
+		records["rate"] = rates
+		records["ts"] = timestamps
+		self._file.write(records.tobytes())
+
+	def write_batch(self, batch: PriceUpdateBatch):
+		"""
+		Appends every tick of a batch, translating its pair table into this file's one
+
+		:param batch: The batch
+		"""
+		table = np.array([self.add_pair(pair_id) for pair_id in batch.pair_ids], dtype=np.uint32)
+		self.write_arrays(table[batch.handles], batch.rates, batch.timestamps)
+
+	def write(self, update: PriceUpdate):
+		"""
+		Buffers a single update, written with the next flush
+
+		:param update: The update
+		"""
+		handle = self.add_pair(update.id)
+		self._buffer.append((handle, update.best_rate, datetime_to_us(update.systime)))
+		if len(self._buffer) >= self._buffer_size:
+			self._flush_buffer()
+
+	def _flush_buffer(self):
+		if self._buffer:
+			records = np.array(self._buffer, dtype=RECORD)
+			self._buffer = []
+			self._file.write(records.tobytes())
+
+	def flush(self):
+		self._flush_buffer()
+		self._file.flush()
+
+	def close(self):
+		if not self._file.closed:
+			self.flush()
+			self._file.close()
+
+	def __enter__(self) -> "TickFileWriter":
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+class TickFileReader(object):
+
+	def __init__(self, path: str):
+		"""
+		Memory maps a tick file. Records are exposed as NumPy views over the mapping, so nothing is
+		parsed or copied until it is used. Views handed out keep the mapping alive after close.
+
+		:param path: Path of the file
+		"""
+		self._path = path
+		self._file = open(path, "rb")
+		self._mmap = None
+		try:
+			# mmap refuses empty files, so short files are reported before mapping
+			if os.fstat(self._file.fileno()).st_size < _PREFIX.size:
+				raise TickFileError(path, "file too short for a header")
+			self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+			self._header_size, self._pair_ids = _read_header(path, self._mmap)
+		except TickFileError:
+			if self._mmap is not None:
+				self._mmap.close()
+			self._file.close()
+			raise
+
+		count = (len(self._mmap) - self._header_size) // RECORD.itemsize
+		if count:
+			self._records = np.frombuffer(self._mmap, dtype=RECORD, count=count, offset=self._header_size)
+		else:
+			self._records = np.zeros(0, dtype=RECORD)
+
+	@property
+	def pair_ids(self) -> List[str]:
+		return list(self._pair_ids)
+
+	@property
+	def records(self) -> np.ndarray:
+		return self._records
+
+	@property
+	def handles(self) -> np.ndarray:
+		return self._records["handle"]
+
+	@property
+	def rates(self) -> np.ndarray:
+		return self._records["rate"]
+
+	@property
+	def timestamps(self) -> np.ndarray:
+		return self._records["ts"]
+
+	def __len__(self) -> int:
+		return len(self._records)
+
+	def batch(self, start: int = 0, stop: int = None) -> PriceUpdateBatch:
+		"""
+		Returns a range of records as a PriceUpdateBatch of views over the file
+
+		:param start: First record
+		:param stop: Record after the last one, the end of the file if None
+		:return: The batch
+		"""
+		records = self._records[start:stop]
+		return PriceUpdateBatch(self._pair_ids, records["handle"], records["rate"], records["ts"])
+
+	def batches(self, chunk_size: int = 1000000) -> Iterator[PriceUpdateBatch]:
+		"""
+		Yields the whole file as consecutive batches of at most chunk_size records
+
+		:param chunk_size: Records per batch
+		:return: An iterator of batches
+		"""
+		for start in range(0, len(self._records), chunk_size):
+			yield self.batch(start, start + chunk_size)
+
+	def iter_updates(self, chunk_size: int = 65536) -> Iterator[PriceUpdate]:
+		"""
+		Yields every record as a PriceUpdate, for consumers that need objects (such as ReplayEngine)
+
+		:param chunk_size: Records converted at a time
+		:return: An iterator of updates
+		"""
+		for batch in self.batches(chunk_size):
+			yield from batch.iter_updates()
+
+	def close(self):
+		self._records = np.zeros(0, dtype=RECORD)
+		try:
+			self._mmap.close()
+		except BufferError:
+			# Views are still alive, the mapping goes away with the last of them
+			pass
+		self._file.close()
+
+	def __enter__(self) -> "TickFileReader":
+		return self
+
+	def __exit__(self, *args):
+		self.close()